@@ -0,0 +1,54 @@
+"""Compare the ASCII trace parser against the previous re.split-based parsing.
+
+Run as ``python benchmarks/parse_trace.py``.
+"""
+import argparse
+import numpy as np
+import re
+import timeit
+
+from autocal.vna import parse_ascii_trace
+
+
+def make_payload(npoints: int) -> bytes:
+    """Make a CSV trace file like the ones stored by ``MMEM:STOR:FDAT``."""
+    freq = np.linspace(40e6, 200e6, npoints)
+    data = np.random.default_rng(0).normal(size=npoints)
+    lines = ["# Channel 1", "# Trace 1", "Frequency, Formatted Data, Formatted Data"]
+    lines += [f"{f:+.12e},{d:+.12e},{0:+.12e}" for f, d in zip(freq, data)]
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+def parse_re_split(payload) -> np.ndarray:
+    """Parse a trace the way measure_s11 used to."""
+    tokens = re.split("\r\n|,", str(payload, "ascii").strip())
+    length = len(tokens[5:])
+    strings = np.array(tokens[5:]).reshape(length // 3, 3)
+
+    out = np.empty(strings.shape)
+    out[:] = strings
+    return out
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--points", type=int, nargs="+", default=[641, 1601, 16001])
+    parser.add_argument("--number", type=int, default=50)
+    args = parser.parse_args()
+
+    for npoints in args.points:
+        payload = memoryview(bytearray(make_payload(npoints)))
+        assert np.array_equal(parse_re_split(payload), parse_ascii_trace(payload))
+
+        old = min(timeit.repeat(lambda: parse_re_split(payload), number=args.number))
+        new = min(timeit.repeat(lambda: parse_ascii_trace(payload), number=args.number))
+        print(
+            f"{npoints:>6} points: re.split {1e3 * old / args.number:8.3f} ms   "
+            f"parse_ascii_trace {1e3 * new / args.number:8.3f} ms   "
+            f"speedup {old / new:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Time a whole calibration of a load, and a receiver reading, in simulated time.
+
+Run as ``python benchmarks/run_load_scenario.py``. No lab hardware is needed: the
+LabJacks are simulated by :mod:`autocal.labjack_sim`, the VNA by
+:class:`autocal.vna_sim.SimulatedVNA`, and fastspec by a script that exits straight
+away. Every question to the operator is answered at once. Simulated time runs
+``--speedup`` times faster than real time, so e.g. the four-hour wait of the receiver
+reading takes 1.4 s at the default speedup. The simulated VNA sweeps in real time,
+which therefore counts ``--speedup`` times over in simulated time.
+
+With ``--asyncio``, the asyncio engine (:mod:`autocal.engine`) is timed instead of
+the blocking functions. With ``--spectra-hours``, each load after the first starts
+that long (in simulated time) after the previous one, as if taking its spectra. With
+``--warm-start``, the loads after the first skip their warmup if the switch is still
+warm, e.g.::
+
+    python benchmarks/run_load_scenario.py --no-receiver-reading --warm-start \
+        --spectra-hours 3 --loads Ambient HotLoad AntSim1
+"""
+import argparse
+import h5py
+import os
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+from autocal import automation, engine
+from autocal.config import Config
+from autocal.hal import Clock, get_clock, open_device, set_clock, set_driver
+from autocal.labjack_sim import SimulatedU3, SimulatedU6
+from autocal.switch import SwitchController, set_switch
+from autocal.vna import VNA, set_vna
+from autocal.vna_sim import SimulatedVNA
+from autocal.warmup import WarmupCache, set_warmup_cache
+
+
+def timeit(label, func):
+    """Run a function once, reporting the real and simulated time it took."""
+    clock = get_clock()
+    t0, sim0 = time.perf_counter(), clock.monotonic()
+    func()
+    real, simulated = time.perf_counter() - t0, clock.monotonic() - sim0
+    print(f"{label:<28} {real:8.2f} s real   {simulated / 60:8.1f} min simulated")
+
+
+async def _answer(question):
+    """Answer a question to the operator at once."""
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--speedup", type=float, default=10000)
+    parser.add_argument("--sweep-time", type=float, default=0.01)
+    parser.add_argument("--loads", nargs="+", default=["Ambient"])
+    parser.add_argument("--spectra-hours", type=float, default=0)
+    parser.add_argument("--asyncio", action="store_true")
+    parser.add_argument("--warm-start", action="store_true")
+    parser.add_argument("--no-receiver-reading", action="store_true")
+    parser.add_argument("--max-warmup-iters", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    set_clock(Clock(speedup=args.speedup))
+    set_driver("u3", SimulatedU3)
+    # The same thermistors are read by every run, so they stay warm between them.
+    u6 = SimulatedU6(seed=args.seed)
+    set_driver("u6", lambda: u6)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+
+        cfg = Path(tmpdir) / "config.yaml"
+        cfg.write_text(f"fastspec_dir: {tmpdir}\ncalib_dir: .\nspec_dir: .\n")
+        if automation.config is None:
+            automation.config = Config(cfg, init=False)
+
+        fastspec = Path(tmpdir) / "fastspec_single"
+        fastspec.write_text("#!/bin/sh\nexit 0\n")
+        fastspec.chmod(0o755)
+        automation.config.fastspec_path = fastspec
+        automation.config.fastspec_ini = Path(tmpdir) / "edges.ini"
+
+        u3io = open_device("u3")
+        set_switch(SwitchController(u3io, automation.config.switch_guard_time))
+        automation.block_on_question = lambda question: None
+        if args.warm_start:
+            set_warmup_cache(WarmupCache(Path(tmpdir) / "warmup_cache.h5"))
+
+        with SimulatedVNA(sweep_time=args.sweep_time, seed=args.seed) as sim:
+            set_vna(VNA(*sim.address))
+
+            if args.asyncio:
+                engine.config = automation.config
+                engine.block_on_question_async = _answer
+                run_load = partial(engine.run, "run_load", plot=False)
+                receiver_reading = partial(
+                    engine.run, "measure_receiver_reading", show_fastspec_output=False
+                )
+            else:
+                run_load = partial(automation.run_load, plot=False)
+                receiver_reading = automation.measure_receiver_reading
+
+            for i, load in enumerate(args.loads):
+                if i:
+                    get_clock().sleep(args.spectra_hours * 60 * 60)
+                timeit(
+                    f"run_load({load})",
+                    lambda: run_load(
+                        load,
+                        run_time=0,
+                        max_warmup_iters=args.max_warmup_iters,
+                        show_fastspec_output=False,
+                        sampler=True,
+                    ),
+                )
+                with h5py.File("warmup_s11.h5", "r") as fl:
+                    print(f"  {len(fl['Match'])} warmup iterations")
+
+            if not args.no_receiver_reading:
+                timeit("measure_receiver_reading", receiver_reading)
+
+        print(f"{u3io.transactions} U3 transactions")
+
+
+if __name__ == "__main__":
+    main()
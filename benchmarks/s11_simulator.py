@@ -0,0 +1,92 @@
+"""Time the S11 acquisition path end-to-end against a local simulated VNA.
+
+Run as ``python benchmarks/s11_simulator.py``. No lab hardware is needed: the VNA is
+simulated by :class:`autocal.vna_sim.SimulatedVNA` and the SP4T switch calls go to a
+:class:`autocal.labjack_sim.SimulatedU3`.
+"""
+import argparse
+import csv
+import numpy as np
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from autocal import automation
+from autocal.config import Config
+from autocal.labjack_sim import SimulatedU3
+from autocal.switch import SwitchController, set_switch
+from autocal.vna import VNA, set_vna
+from autocal.vna_sim import SimulatedVNA
+
+
+def write_temperature_csv(path: Path, n: int = 20):
+    """Write a Temperature.csv with constant temperatures, as the warmup requires."""
+    with open(path, "w") as fl:
+        writer = csv.writer(fl)
+        writer.writerow(["Date", "Time"] + [f"col{i}" for i in range(10)])
+        for _ in range(n):
+            writer.writerow(["01/01/2022", "00:00:00"] + [25.0] * 10)
+
+
+def timeit(label, func, repeats):
+    """Run a function a number of times and report the best and mean time."""
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    print(f"{label:<32} best {min(times):8.3f} s   mean {np.mean(times):8.3f} s")
+
+
+def main():
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sweep-time", type=float, default=0.01)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--noise", type=float, default=1e-3)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--warmup-iters", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+
+        cfg = Path(tmpdir) / "config.yaml"
+        cfg.write_text("fastspec_dir: .\ncalib_dir: .\nspec_dir: .\n")
+        if automation.config is None:
+            automation.config = Config(cfg, init=False)
+        set_switch(SwitchController(SimulatedU3()))
+        write_temperature_csv(Path("Temperature.csv"))
+
+        with SimulatedVNA(
+            sweep_time=args.sweep_time, latency=args.latency, noise=args.noise
+        ) as sim:
+            set_vna(VNA(*sim.address))
+
+            timeit(
+                "measure_s11 (binary)",
+                lambda: automation.measure_s11(print_settings=False),
+                args.repeats,
+            )
+            timeit(
+                "measure_s11 (ascii)",
+                lambda: automation.measure_s11(print_settings=False, binary=False),
+                args.repeats,
+            )
+            timeit(
+                "take_all_load_s11",
+                lambda: automation.take_all_load_s11(1),
+                args.repeats,
+            )
+            timeit(
+                "_take_warmup_s11",
+                lambda: automation._take_warmup_s11(
+                    args.warmup_iters, args.warmup_iters, plot=False
+                ),
+                args.repeats,
+            )
+
+
+if __name__ == "__main__":
+    main()
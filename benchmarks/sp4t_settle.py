@@ -0,0 +1,103 @@
+"""Compare fixed waits after switching to waiting with the settle detector.
+
+Run as ``python benchmarks/sp4t_settle.py``. The VNA is simulated by
+:class:`autocal.vna_sim.SimulatedVNA`, whose trace gets a transient (decaying over
+``--settle-time``) every time the simulated U3 switches the SP4T supply on. For each
+switch, the time spent waiting and the error of the S11 taken afterwards (from the
+noiseless trace) are reported.
+"""
+import argparse
+import numpy as np
+import os
+import tempfile
+import time
+import u3
+from pathlib import Path
+
+from autocal import automation
+from autocal.config import Config
+from autocal.labjack_sim import SimulatedU3
+from autocal.settle import SettleDetector
+from autocal.switch import POWER, SwitchController, set_switch
+from autocal.vna import VNA, set_vna
+from autocal.vna_sim import SimulatedVNA
+
+
+class SwitchingU3(SimulatedU3):
+    """Disturbs the trace of a simulated VNA whenever the switch supply goes on."""
+
+    def __init__(self, sim: SimulatedVNA):
+        super().__init__()
+        self.sim = sim
+
+    def getFeedback(self, *commands):  # noqa: N802
+        """Apply the commands, disturbing the VNA if the supply is switched on."""
+        out = super().getFeedback(*commands)
+        for cmd in commands:
+            if isinstance(cmd, u3.BitStateWrite) and cmd.ioNumber == POWER:
+                if not cmd.state:
+                    self.sim.disturb()
+        return out
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sweep-time", type=float, default=0.005)
+    parser.add_argument("--settle-time", type=float, default=0.05)
+    parser.add_argument("--fixed-wait", type=float, default=1.0)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+
+        cfg = Path(tmpdir) / "config.yaml"
+        cfg.write_text("fastspec_dir: .\ncalib_dir: .\nspec_dir: .\n")
+        if automation.config is None:
+            automation.config = Config(cfg, init=False)
+
+        with SimulatedVNA(
+            sweep_time=args.sweep_time, settle_time=args.settle_time, seed=args.seed
+        ) as sim:
+            set_vna(VNA(*sim.address))
+            set_switch(SwitchController(SwitchingU3(sim)))
+            detector = SettleDetector()
+            detector.calibrate()
+
+            for label, wait in [
+                (
+                    f"fixed {args.fixed_wait} s wait",
+                    lambda v: time.sleep(args.fixed_wait),
+                ),
+                ("settle detector", detector.wait),
+            ]:
+                waits, errors = [], []
+                for _ in range(args.iterations):
+                    for voltage in automation.WARMUP_VOLTAGES.values():
+                        automation._set_voltage(0)
+                        automation._set_voltage(voltage)
+
+                        t0 = time.perf_counter()
+                        wait(voltage)
+                        waits.append(time.perf_counter() - t0)
+
+                        s11 = automation.measure_s11(print_settings=False, count=2)
+                        ideal = 0.05 * np.exp(-2j * np.pi * s11[:, 0] * 5e-9)
+                        errors.append(np.abs(s11[:, 1] + 1j * s11[:, 2] - ideal).max())
+
+                print(
+                    f"{label:<20} {1e3 * np.mean(waits):8.1f} ms/switch   "
+                    f"max error {np.max(errors):.2e}"
+                )
+
+            for state, (n, median, longest) in detector.summary().items():
+                print(
+                    f"  {state:>5}V settled in {1e3 * median:6.1f} ms (median), "
+                    f"{1e3 * longest:6.1f} ms (max) over {n} switches"
+                )
+
+
+if __name__ == "__main__":
+    main()
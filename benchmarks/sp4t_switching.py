@@ -0,0 +1,82 @@
+"""Time SP4T switching against a simulated U3 with USB transaction latency.
+
+Run as ``python benchmarks/sp4t_switching.py``. Each iteration switches through the
+states of one warmup iteration: a reset, then each standard followed by a reset.
+"""
+import argparse
+import tempfile
+import time
+import u3
+from pathlib import Path
+
+from autocal import automation
+from autocal.config import Config
+from autocal.labjack_sim import SimulatedU3
+from autocal.switch import SwitchController
+
+
+def set_voltage_serial(voltage):
+    """Set the switch state the way _set_voltage used to."""
+    settings = automation._get_voltage_settings(voltage)
+
+    automation.config.u3io.getFeedback(u3.BitStateWrite(4, settings[0]))
+    automation.config.u3io.getFeedback(u3.BitStateWrite(5, settings[1]))
+    automation.config.u3io.getFeedback(u3.BitStateWrite(6, settings[2]))
+    time.sleep(automation.config.switch_guard_time)
+    automation.config.u3io.getFeedback(u3.BitStateWrite(7, settings[3]))
+
+
+def warmup_iteration(set_voltage):
+    """Switch through the states of one warmup iteration."""
+    set_voltage(0)
+    for voltage in automation.WARMUP_VOLTAGES.values():
+        set_voltage(voltage)
+        set_voltage(0)
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=1e-3)
+    parser.add_argument("--guard", type=float, default=0.1)
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cfg = Path(tmpdir) / "config.yaml"
+        cfg.write_text(
+            f"fastspec_dir: .\ncalib_dir: .\nspec_dir: .\n"
+            f"switch_guard_time: {args.guard}\n"
+        )
+        if automation.config is None:
+            automation.config = Config(cfg, init=False)
+        automation.config.switch_guard_time = args.guard
+
+    def batched(voltage):
+        switch.switch_to(voltage, force=True)
+
+    def cached(voltage):
+        switch.switch_to(voltage)
+
+    for label, set_voltage in [
+        ("serial writes", set_voltage_serial),
+        ("batched writes", batched),
+        ("cached state", cached),
+    ]:
+        mock = automation.config.u3io = SimulatedU3(args.latency)
+        switch = SwitchController(mock, guard_time=args.guard)
+
+        t0 = time.perf_counter()
+        for _ in range(args.iterations):
+            warmup_iteration(set_voltage)
+        elapsed = (time.perf_counter() - t0) / args.iterations
+
+        assert mock.fio[4:] == [1, 1, 1, 1]
+        print(
+            f"{label:<16} {1e3 * elapsed:8.1f} ms/iteration   "
+            f"{mock.transactions / args.iterations:5.1f} transactions/iteration"
+        )
+
+
+if __name__ == "__main__":
+    main()
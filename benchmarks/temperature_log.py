@@ -0,0 +1,68 @@
+"""Compare re-reading a growing temperature log with reading it incrementally.
+
+Run as ``python benchmarks/temperature_log.py``. This mimics the warmup, which reads
+the SP4T temperatures after every switch state while the temperature sensor keeps
+appending to the log.
+"""
+import argparse
+import csv
+import tempfile
+import time
+from edges_io.io import Resistance
+from pathlib import Path
+
+from autocal.temp_sensor_with_time_U6 import FIELDNAMES
+from autocal.temperature_log import TemperatureLog
+
+
+def append_rows(path: Path, start: int, n: int):
+    """Append rows of constant temperatures to the log."""
+    with open(path, "a") as fl:
+        writer = csv.writer(fl)
+        for i in range(start, start + n):
+            writer.writerow(
+                ["01/01/2022", f"00:{i // 60 % 60:02}:{i % 60:02}"] + [25.0] * 10
+            )
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--initial-rows", type=int, default=2000)
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--rows-per-read", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "Temperature.csv"
+        path.write_text(",".join(FIELDNAMES) + "\n")
+        append_rows(path, 0, args.initial_rows)
+        log = TemperatureLog(path)
+
+        full = incremental = 0.0
+        for i in range(args.reads):
+            append_rows(
+                path, args.initial_rows + i * args.rows_per_read, args.rows_per_read
+            )
+
+            t0 = time.perf_counter()
+            old = Resistance.read_csv(path)[0]["sp4t_temp"]
+            t1 = time.perf_counter()
+            log.update()
+            new = log["sp4t_temp"]
+            t2 = time.perf_counter()
+
+            assert len(old) == len(new)
+            full += t1 - t0
+            incremental += t2 - t1
+
+        print(
+            f"{args.reads} reads of a log growing from {args.initial_rows} rows: "
+            f"read_csv {1e3 * full / args.reads:8.3f} ms/read   "
+            f"TemperatureLog {1e3 * incremental / args.reads:8.3f} ms/read   "
+            f"speedup {full / incremental:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Time the bookkeeping of warmup sweeps: lists re-stacked per state vs a WarmupBuffer.
+
+Run as ``python benchmarks/warmup_buffer.py``. For every sweep of a warmup, the sweeps
+so far are stacked per load (as the plot does), and at the end they are stacked for
+the HDF5 file. No VNA or plotting is involved, only the handling of the arrays.
+"""
+import argparse
+import numpy as np
+import time
+
+from autocal.automation import WARMUP_VOLTAGES
+from autocal.warmup import WarmupBuffer
+
+
+def with_lists(sweeps, max_iters):
+    """Keep the sweeps in lists, stacking them after each one as the warmup used to."""
+    warmup_re = {load: [] for load in WARMUP_VOLTAGES}
+    warmup_im = {load: [] for load in WARMUP_VOLTAGES}
+    for it in range(max_iters):
+        for load in WARMUP_VOLTAGES:
+            s11 = sweeps[it, load]
+            warmup_re[load].append(s11[:, 1])
+            warmup_im[load].append(s11[:, 2])
+            for name in WARMUP_VOLTAGES:
+                np.atleast_2d(np.array(warmup_re[name]))
+                np.atleast_2d(np.array(warmup_im[name]))
+    return {
+        load: np.array(warmup_re[load]) + 1j * np.array(warmup_im[load])
+        for load in WARMUP_VOLTAGES
+    }
+
+
+def with_buffer(sweeps, max_iters):
+    """Keep the sweeps in a WarmupBuffer, taking views of it after each one."""
+    warmup = WarmupBuffer(WARMUP_VOLTAGES, max_iters)
+    for it in range(max_iters):
+        for load in WARMUP_VOLTAGES:
+            warmup.append(load, sweeps[it, load])
+            warmup.real()
+            warmup.imag()
+    return {load: warmup[load] for load in WARMUP_VOLTAGES}
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--n-freq", type=int, default=641)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    freq = np.linspace(40e6, 200e6, args.n_freq)
+    sweeps = {
+        (it, load): np.stack([freq, *rng.normal(size=(2, args.n_freq))], axis=1)
+        for it in range(args.iterations)
+        for load in WARMUP_VOLTAGES
+    }
+
+    results = {}
+    for label, func in [("lists", with_lists), ("WarmupBuffer", with_buffer)]:
+        times = []
+        for _ in range(args.repeats):
+            t0 = time.perf_counter()
+            results[label] = func(sweeps, args.iterations)
+            times.append(time.perf_counter() - t0)
+        print(f"{label:<14} best {1e3 * min(times):8.2f} ms per warmup")
+
+    for load in WARMUP_VOLTAGES:
+        assert np.array_equal(results["lists"][load], results["WarmupBuffer"][load])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Compare when warmups stop under the old and the trend convergence criteria.
+
+Run as ``python benchmarks/warmup_convergence.py``. Each standard's simulated S11
+settles exponentially, with its own amplitude and time constant (in iterations), plus
+noise. The old criterion only compares the last two Short sweeps; the trend criterion
+tests all standards over a window. For each, the number of iterations taken (each
+about 4 x 80 s on the bench) and the transient left in the worst standard when it
+stopped are reported.
+"""
+import argparse
+import numpy as np
+
+from autocal.automation import WARMUP_VOLTAGES
+from autocal.warmup import TrendConvergence, WarmupBuffer
+
+
+def old_converged(warmup: WarmupBuffer) -> bool:
+    """The criterion used before, which only looked at the last standard (Short)."""
+    sweeps = warmup["Short"]
+    if len(sweeps) < 2:
+        return False
+    for part in (sweeps.real, sweeps.imag):
+        diff = np.sqrt(np.mean((part[-1] - part[-2]) ** 2))
+        intrinsic = np.sqrt(np.mean(np.diff(part[-1]) ** 2))
+        if diff > intrinsic:
+            return False
+    return True
+
+
+def run(converged, rng, args):
+    """Simulate a warmup until it converges, returning its length and leftover drift."""
+    freq = np.linspace(40e6, 200e6, 641)
+    base = 0.05 * np.exp(-2j * np.pi * freq * 5e-9)
+    amplitude = rng.uniform(0, args.amplitude, len(WARMUP_VOLTAGES))
+    tau = rng.uniform(1, args.max_tau, len(WARMUP_VOLTAGES))
+
+    warmup = WarmupBuffer(WARMUP_VOLTAGES, args.max_iters)
+    for it in range(args.max_iters):
+        for i, load in enumerate(WARMUP_VOLTAGES):
+            noise = rng.normal(scale=args.noise / np.sqrt(2), size=(2, len(freq)))
+            s11 = base + amplitude[i] * np.exp(-it / tau[i]) + noise[0] + 1j * noise[1]
+            warmup.append(load, np.stack([freq, s11.real, s11.imag], axis=1))
+        if it >= 1 and converged(warmup):
+            break
+    return it + 1, np.max(amplitude * np.exp(-it / tau))
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trials", type=int, default=200)
+    parser.add_argument("--max-iters", type=int, default=50)
+    parser.add_argument("--noise", type=float, default=1e-3)
+    parser.add_argument("--amplitude", type=float, default=2e-2)
+    parser.add_argument("--max-tau", type=float, default=6.0)
+    parser.add_argument("--window", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    trend = TrendConvergence(window=args.window, temperature_delta=None)
+    for label, converged in [
+        ("old (Short only)", old_converged),
+        ("trend", lambda warmup: not trend.pending(warmup)),
+    ]:
+        rng = np.random.default_rng(args.seed)
+        iters, leftover = np.array(
+            [run(converged, rng, args) for _ in range(args.trials)]
+        ).T
+        print(
+            f"{label:<18} {iters.mean():5.1f} iterations (max {iters.max():3.0f})   "
+            f"leftover transient: median {np.median(leftover):.1e}, "
+            f"{np.mean(leftover > args.noise):5.1%} above the noise"
+        )
+
+
+if __name__ == "__main__":
+    main()
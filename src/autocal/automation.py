@@ -4,76 +4,171 @@ import logging
 import numpy as np
 import os
 import questionary as qs
-import re
-import socket
 import subprocess
 import sys
 import time
-import u3
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from contextlib import contextmanager
-from edges_io.io import Resistance
 from functools import partial
 from pathlib import Path
 from rich.console import Console
 from rich.panel import Panel
 from scipy.ndimage.filters import uniform_filter1d
-from typing import Optional, Union
+from typing import Callable, Iterator, List, Optional, Tuple, Union
 
 from . import plotting
 from .config import config
+from .hal import get_clock
+from .s11_store import get_store, write_touchstone
+from .sampler import TemperatureSampler, get_sampler, set_sampler
+from .settle import get_detector
+from .switch import SWITCH_STATES, get_switch
+from .temperature_log import TemperatureLog
+from .temperature_server import TemperatureSubscriber
+from .temperature_stats import TemperatureStats
 from .utils import block_on_question
+from .vna import get_vna, parse_ascii_trace
+from .warmup import Convergence, TrendConvergence, WarmupBuffer, get_warmup_cache
 
 console = Console()
 logger = logging.getLogger(__name__)
 
 STANDARD_VOLTAGES = {"External": 37, "Match": 34, "Short": 31.3, "Open": 28}
+WARMUP_VOLTAGES = {"External": 37, "Match": 34, "Open": 28, "Short": 31.3}
+
+# The number of most recent temperature readings shown in the plot of the warmup:
+# about eight hours at the default interval of 30 s, more than a whole warmup.
+WARMUP_PLOT_READINGS = 1024
+
+# The repeats of the S11 measurements of a load.
+LOAD_S11_REPEATS = {1: "First", 2: "Second"}
+
+# What the user must confirm before, and during, the receiver reading.
+RECEIVER_READING_CHECKS = [
+    "Ensured fastspec is running in a different terminal for a minimum of 4 hours to "
+    "stabilize the receiver?",
+    "Ensure the VNA is connected with M-M SMA and calibrated with `autocal cal-vna -r`?",
+]
+RECEIVER_READING_CHECK = "ReceiverReading load connected to VNA?"
+# Time (seconds) for which fastspec runs before the first receiver reading, to
+# stabilise the receiver.
+RECEIVER_WARMUP_TIME = 4 * 60 * 60
+
+# Loads for which the U3 FIO lines must be (re-)configured before switching.
+CONFIGURE_IO_LOADS = {
+    "AntSim1",
+    "AntSim2",
+    "AntSim3",
+    "HotLoad",
+    "LongCableOpen",
+    "LongCableShort",
+}
 
 
 def _get_voltage_settings(voltage):
-    if voltage == 37:
-        return 1, 1, 1, 0
-    elif voltage == 34:
-        return 1, 1, 0, 0
-    elif voltage == 31.3:
-        return 1, 0, 1, 0
-    elif voltage == 28:
-        return 0, 1, 1, 0
-    elif voltage == 0:
-        return 1, 1, 1, 1
-    else:
+    try:
+        return SWITCH_STATES[voltage]
+    except KeyError:
         raise ValueError(f"Voltage {voltage} not understood.")
 
 
 def _set_voltage(voltage):
-    settings = _get_voltage_settings(voltage)
+    """Set the state of the SP4T switch, only writing the pins that change."""
+    get_switch().switch_to(voltage)
+
 
-    config.u3io.getFeedback(u3.BitStateWrite(4, settings[0]))
-    config.u3io.getFeedback(u3.BitStateWrite(5, settings[1]))
-    config.u3io.getFeedback(u3.BitStateWrite(6, settings[2]))
-    time.sleep(0.1)
-    config.u3io.getFeedback(u3.BitStateWrite(7, settings[3]))
+def _settle(voltage) -> bool:
+    """Wait for the switch to settle, if a settle detector is set.
+
+    Returns whether it was seen to settle, in which case the fixed waits of the next
+    sweep can be skipped.
+    """
+    detector = get_detector()
+    return detector is not None and detector.wait(voltage)
 
 
-def take_s11(fname, voltage, print_settings=True):
-    """Take S11 with particular voltage settings."""
+def _calibrate_settle():
+    """Estimate the noise of the settle detector's probes, if it is set and has not.
+
+    This should be done while the switch has been left alone for a while.
+    """
+    detector = get_detector()
+    if detector is not None and detector.noise is None:
+        detector.calibrate()
+
+
+def take_s11(
+    fname,
+    voltage,
+    print_settings=True,
+    executor: Optional[Executor] = None,
+    repeat: int = 0,
+) -> Union[np.ndarray, Future]:
+    """Take S11 with particular voltage settings.
+
+    If an ``executor`` is given, only the switching and the VNA sweep/transfer happen
+    here: the S11 is parsed and saved on the executor, and its future is returned.
+    """
     _set_voltage(voltage)
 
     logger.info(f"Taking {fname} measurement at {voltage}V...")
-    measure_s11(fname=f"{fname}.s1p", print_settings=print_settings)
-    config.u3io.getFeedback(u3.BitStateWrite(7, 1))
+    parse = _sweep_s11(print_settings=print_settings, settled=_settle(voltage))
+    get_switch().power_off()
+
+    metadata = {
+        "voltage": voltage,
+        "repeat": repeat,
+        "settings": get_vna().state,
+        "timestamp": get_clock().time(),
+    }
+    if executor is None:
+        return _finish_s11(parse, fname, metadata)
+    return executor.submit(_finish_s11, parse, fname, metadata)
+
+
+def _finish_s11(parse: Callable[[], np.ndarray], fname, metadata) -> np.ndarray:
+    s11 = parse()
+    _save_s11(s11, f"{fname}.s1p", **metadata)
     logger.info(f"... saved as '{fname}.s1p'")
+    return s11
 
 
-def take_all_load_s11(repeat_num: int):
-    """Take all S11 measurements for a load."""
+def take_all_load_s11(repeat_num: int, pipelined: bool = True):
+    """Take all S11 measurements for a load.
+
+    If ``pipelined``, each standard is parsed and saved in the background while the
+    switch moves on to the next standard and its sweep starts.
+    """
     """"--------------------------------
     Run S11 for 1 hour for temperature stability of SP4T switch
     -----------------------------------
 
      """
+    if not pipelined:
+        for i, (name, voltage) in enumerate(STANDARD_VOLTAGES.items()):
+            take_s11(
+                f"{name}{repeat_num:02}",
+                voltage=voltage,
+                print_settings=not i,
+                repeat=repeat_num,
+            )
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        futures = [
+            take_s11(
+                f"{name}{repeat_num:02}",
+                voltage=voltage,
+                print_settings=not i,
+                executor=executor,
+                repeat=repeat_num,
+            )
+            for i, (name, voltage) in enumerate(STANDARD_VOLTAGES.items())
+        ]
 
-    for i, (name, voltage) in enumerate(STANDARD_VOLTAGES.items()):
-        take_s11(f"{name}{repeat_num:02}", voltage=voltage, print_settings=not i)
+    # Raise any errors from parsing/saving.
+    for future in futures:
+        future.result()
 
 
 @contextmanager
@@ -109,7 +204,7 @@ def fastspec_process(run_time, init_time=0, post_time=0, stdout=None):
         )
 
     if init_time:
-        time.sleep(init_time)
+        get_clock().sleep(init_time)
 
     try:
         yield fpipe
@@ -121,62 +216,70 @@ def fastspec_process(run_time, init_time=0, post_time=0, stdout=None):
             fpipe.terminate()
 
         if post_time:
-            time.sleep(post_time)
+            get_clock().sleep(post_time)
 
 
-def run_load(
-    load: str,
-    run_time: float,
-    min_warmup_iters=2,
-    max_warmup_iters: int = 50,
-    show_fastspec_output=True,
-    plot=True,
-):
-    """Run a full calibration of a load."""
-    if load in {
-        "AntSim1",
-        "AntSim2",
-        "AntSim3",
-        "HotLoad",
-        "LongCableOpen",
-        "LongCableShort",
-    }:
-        config.u3io.configIO(FIOAnalog=15)
-
-    config.u3io.getFeedback(u3.BitDirWrite(4, 1))
-    config.u3io.getFeedback(u3.BitDirWrite(5, 1))
-    config.u3io.getFeedback(u3.BitDirWrite(6, 1))
-    config.u3io.getFeedback(u3.BitDirWrite(7, 1))
+def _init_switch(configure_io: bool = True):
+    get_switch().configure(configure_io)
 
-    console.rule(f"Starting {load} Calibration")
 
-    block_on_question(f"Connected {load} load to receiver input?")
+def _load_checks(load: str) -> List[str]:
+    """Return the things the user must confirm before calibrating a load."""
+    checks = [f"Connected {load} load to receiver input?"]
 
     if load in {"Ambient", "HotLoad"}:
-        block_on_question(
-            f"Ensured high-pass filter is connected to ports of {load} Load?"
-        )
-
-        block_on_question(
+        checks.append(f"Ensured high-pass filter is connected to ports of {load} Load?")
+        checks.append(
             f"Ensured voltage supply connected to Ambient Load is set to "
             f"{'0V' if load == 'Ambient' else '12V'}?"
         )
 
     if load in {"LongCableOpen"}:
-        block_on_question("Ensured Open is connected to LongCable?")
+        checks.append("Ensured Open is connected to LongCable?")
     if load in {"LongCableShort"}:
-        block_on_question("Ensured Short is connected to LongCable?")
+        checks.append("Ensured Short is connected to LongCable?")
+
+    checks.append("Ensured thermistor port is connected to labjack?")
+    return checks
+
+
+def run_load(
+    load: str,
+    run_time: float,
+    min_warmup_iters=2,
+    max_warmup_iters: int = 50,
+    show_fastspec_output=True,
+    plot=True,
+    sampler: bool = False,
+    temp_socket: Optional[str] = None,
+):
+    """Run a full calibration of a load.
+
+    If ``sampler`` is True, the thermistors are read by an in-process
+    :class:`~autocal.sampler.TemperatureSampler` rather than by ``autocal temp-sensor``
+    in a separate process. If ``temp_socket`` is given, they are instead received from
+    the ``autocal temp-sensor --daemon`` publishing on that socket.
+    """
+    _init_switch(configure_io=load in CONFIGURE_IO_LOADS)
+
+    console.rule(f"Starting {load} Calibration")
 
-    block_on_question("Ensured thermistor port is connected to labjack?")
+    for check in _load_checks(load):
+        block_on_question(check)
 
     console.print(
         "[bold]Starting the spectrum observing program and temperature monitoring program"
     )
 
+    # The sampler is started first, so that fastspec isn't left running if it fails
+    # (e.g. if there is no temperature server).
+    temp_sampler = _start_temperature_sampler(sampler, temp_socket)
+
     with fastspec_process(
         run_time, stdout=None if show_fastspec_output else subprocess.DEVNULL
     ):
-        epipe = subprocess.Popen(["autocal", "temp-sensor"])
+        if temp_sampler is None:
+            epipe = subprocess.Popen(["autocal", "temp-sensor"])
 
     console.rule("[bold]Finished taking spectra.")
 
@@ -185,91 +288,210 @@ def run_load(
     _take_warmup_s11(min_warmup_iters, max_warmup_iters, plot=plot)
 
     console.print("")
-    console.print("[bold]Taking First Repeat of S11 measurements...")
-    take_all_load_s11(1)
-    console.print("[bold]Taking Second Repeat of S11 measurements...")
-    take_all_load_s11(2)
-
-    epipe.terminate()
+    for repeat, name in LOAD_S11_REPEATS.items():
+        console.print(f"[bold]Taking {name} Repeat of S11 measurements...")
+        take_all_load_s11(repeat)
 
+    if temp_sampler is not None:
+        set_sampler(None)
+    else:
+        epipe.terminate()
 
-def _take_warmup_s11(min_warmup_iters, max_warmup_iters, plot=True):
-    warmup_count = 0
-    warmup_re = {"External": [], "Match": [], "Open": [], "Short": []}
-    warmup_im = {"External": [], "Match": [], "Open": [], "Short": []}
 
-    for warmup_count in range(max_warmup_iters):
+def _temperature_sampler(
+    sampler: bool, temp_socket: Optional[str] = None
+) -> Optional[TemperatureSampler]:
+    """The sampler to use for a calibration, or None to run ``autocal temp-sensor``."""
+    if temp_socket:
+        return TemperatureSubscriber(temp_socket)
+    return TemperatureSampler() if sampler else None
 
-        _set_voltage(0)  # reseting SP4T switch
 
-        for load, voltage in {
-            "External": 37,
-            "Match": 34,
-            "Open": 28,
-            "Short": 31.3,
-        }.items():
+def _start_temperature_sampler(
+    sampler: bool, temp_socket: Optional[str] = None
+) -> Optional[TemperatureSampler]:
+    """Start the sampler to use for a calibration, if any (see ``run_load``)."""
+    temp_sampler = _temperature_sampler(sampler, temp_socket)
+    if temp_sampler is not None:
+        temp_sampler.start()
+        set_sampler(temp_sampler)
+    return temp_sampler
 
-            _set_voltage(voltage)
 
-            warmup_s11 = SP4T_warmup_s11(print_settings=False)
-            freqs = warmup_s11[:, 0]
-            warmup_re[load].append(warmup_s11[:, 1])
-            warmup_im[load].append(warmup_s11[:, 2])
-            _set_voltage(0)  # reseting SP4T switch
+def _take_warmup_s11(
+    min_warmup_iters,
+    max_warmup_iters,
+    plot=True,
+    convergence: Optional[Convergence] = None,
+):
+    warmup = WarmupBuffer(WARMUP_VOLTAGES, max_warmup_iters)
+    if convergence is None:
+        convergence = _convergence()
 
-            # Also check temperature of S4PT switch
-            temps = Resistance.read_csv("Temperature.csv")[0]["sp4t_temp"]
+    if _start_warmup(warmup):
+        _write_warmup_s11(warmup)
+        return
 
+    # Any verification sweeps count as the first iteration.
+    for warmup_count in range(len(warmup), max_warmup_iters):
+        for _ in _warmup_iteration(warmup):
             # Make a plot of the warmup progress so far.
             # TODO: make it show to the user.
             if plot:
-                plotting.s11_warmup_plot(
-                    freq=freqs,
-                    s11_re=warmup_re,
-                    s11_im=warmup_im,
-                    temperatures=temps,
-                    filename="warmup_s11.pdf",
-                )
-
-        # Here we put some conditions on when we think it's
-        # "converged" in its warmup
-        if warmup_count >= max(1, (min_warmup_iters - 1)):  # do _at least_ 1 warmup.
-            # If we don't have 5 minutes worth of temperature readings, or the last two blocks
-            # of five temperature readings are not similar, assume we haven't yet converged.
-            if (
-                len(temps) < 10
-                or np.abs(np.mean(temps[-10:-5]) - np.mean(temps[-5:])) > 0.2
-            ):
-                continue
-
-            # The following checks if the difference in the last two measurements
-            # has an RMS that is smaller than the RMS of the alternate-channel
-            # difference in the last measurement.
-            rms_diff_re = rms(
-                warmup_re[load][warmup_count] - warmup_re[load][warmup_count - 1]
-            )
-            rms_diff_this_re = rms(
-                warmup_re[load][warmup_count][1:] - warmup_re[load][warmup_count][:-1]
-            )
+                _plot_warmup(warmup, _read_sp4t_temps())
 
-            rms_diff_im = rms(
-                warmup_im[load][warmup_count] - warmup_im[load][warmup_count - 1]
-            )
-            rms_diff_this_im = rms(
-                warmup_im[load][warmup_count][1:] - warmup_im[load][warmup_count][:-1]
-            )
+        if _end_warmup_iteration(warmup, warmup_count, min_warmup_iters, convergence):
+            break
 
-            if rms_diff_re <= rms_diff_this_re and rms_diff_im <= rms_diff_this_im:
-                break
+    _write_warmup_s11(warmup)
 
-            logger.info(
-                f"On iteration {warmup_count}, RMS_DIFF=({rms_diff_re}, {rms_diff_im}) vs. RMS_INTRINSIC=({rms_diff_this_re, rms_diff_this_im})"
-            )
 
+def _start_warmup(warmup: WarmupBuffer) -> bool:
+    """Prepare for the warmup, returning whether it can be skipped (see _warm_start)."""
+    # The switch hasn't been used since the spectra were taken.
+    _calibrate_settle()
+    return _warm_start(warmup)
+
+
+def _warmup_iteration(warmup: WarmupBuffer) -> Iterator[str]:
+    """Take one iteration of the warmup, adding a sweep of each standard to it.
+
+    This is a generator, which yields each standard once its sweep has been added. Each
+    step only drives the instruments, so the caller can do something else (e.g. plot)
+    between steps, or run each step on another thread.
+    """
+    _set_voltage(0)  # reseting SP4T switch
+    for load, voltage in WARMUP_VOLTAGES.items():
+        warmup.append(load, _warmup_s11(voltage))
+        yield load
+
+
+def _end_warmup_iteration(
+    warmup: WarmupBuffer,
+    warmup_count,
+    min_warmup_iters,
+    convergence: Optional[Convergence] = None,
+) -> bool:
+    """Whether the warmup has converged after an iteration, caching it if it has."""
+    converged = _warmup_converged(
+        warmup, _temperature_stats(), warmup_count, min_warmup_iters, convergence
+    )
+    if converged:
+        _cache_warmup(warmup)
+    return converged
+
+
+def _warm_start(warmup: WarmupBuffer) -> bool:
+    """Whether the warmup can be skipped, as the switch is still warm from the last one.
+
+    If a warmup cache is set, a verification sweep of each standard is added to the
+    warmup and compared to the cached converged warmup.
+    """
+    cache = get_warmup_cache()
+    if cache is None:
+        return False
+
+    _set_voltage(0)  # reseting SP4T switch
+    for load, voltage in WARMUP_VOLTAGES.items():
+        warmup.append(load, _warmup_s11(voltage))
+
+    sp4t_temp = _sp4t_temperature()
+    if cache.matches(warmup, sp4t_temp):
+        console.print("[bold]The SP4T switch is still warm, skipping the warmup.")
+        cache.refresh(sp4t_temp)
+        return True
+    return False
+
+
+def _cache_warmup(warmup: WarmupBuffer):
+    """Save a converged warmup to the warmup cache, if one is set."""
+    cache = get_warmup_cache()
+    if cache is not None:
+        cache.save(warmup, _sp4t_temperature())
+
+
+def _plot_warmup(warmup: WarmupBuffer, temperatures: np.ndarray):
+    plotting.s11_warmup_plot(
+        freq=warmup.freq,
+        s11_re=warmup.real(),
+        s11_im=warmup.imag(),
+        temperatures=temperatures,
+        filename="warmup_s11.pdf",
+    )
+
+
+def _warmup_s11(voltage) -> np.ndarray:
+    _set_voltage(voltage)
+    warmup_s11 = SP4T_warmup_s11(print_settings=False, settled=_settle(voltage))
+    _set_voltage(0)  # reseting SP4T switch
+    return warmup_s11
+
+
+_temperature_log: Optional[TemperatureLog] = None
+
+
+def _temperatures() -> Union[TemperatureSampler, TemperatureLog]:
+    """The source of the temperatures: the sampler if one is running, or the log."""
+    sampler = get_sampler()
+    if sampler is not None:
+        # Don't carry on with stale temperatures if the sampler has stopped.
+        sampler.check()
+        return sampler
+
+    # Only the rows written since the last call are read from the log.
+    global _temperature_log
+    if _temperature_log is None:
+        _temperature_log = TemperatureLog("Temperature.csv")
+    _temperature_log.update()
+    return _temperature_log
+
+
+def _read_sp4t_temps(n: int = WARMUP_PLOT_READINGS) -> np.ndarray:
+    """The SP4T temperatures of the most recent ``n`` readings, oldest first."""
+    source = _temperatures()
+    if isinstance(source, TemperatureSampler):
+        # Only the readings asked for are copied out of the ring buffer.
+        return source.readings(n)["sp4t_temp"]
+    return source["sp4t_temp"][-n:]
+
+
+def _sp4t_temperature() -> float:
+    temps = _read_sp4t_temps(1)
+    return float(temps[-1]) if len(temps) else np.nan
+
+
+def _temperature_stats() -> TemperatureStats:
+    return _temperatures().stats
+
+
+def _convergence() -> Convergence:
+    """The convergence criterion of the warmup, as configured in ~/.edges-autocal."""
+    return TrendConvergence(**(config.warmup_convergence if config else {}))
+
+
+def _warmup_converged(
+    warmup: WarmupBuffer,
+    stats,
+    warmup_count,
+    min_warmup_iters,
+    convergence: Optional[Convergence] = None,
+) -> bool:
+    # Here we put some conditions on when we think it's
+    # "converged" in its warmup
+    if warmup_count < max(1, (min_warmup_iters - 1)):  # do _at least_ 1 warmup.
+        return False
+
+    # All the standards (and the SP4T temperature) must have converged.
+    if convergence is None:
+        convergence = _convergence()
+    return convergence.converged(warmup, stats)
+
+
+def _write_warmup_s11(warmup: WarmupBuffer):
     with h5py.File("warmup_s11.h5", "w") as fl:
-        fl["freqs"] = freqs
-        for load in warmup_re:
-            fl[load] = np.array(warmup_re[load]) + 1j * np.array(warmup_im[load])
+        fl["freqs"] = warmup.freq
+        for load in warmup.loads:
+            fl[load] = warmup[load]
 
 
 def rms(x: np.ndarray):
@@ -280,49 +502,52 @@ def rms(x: np.ndarray):
 def measure_receiver_reading(show_fastspec_output=False):
     """Measure receiver reading S11."""
     console.rule("Performing Receiver Reading Measurement")
-    block_on_question(
-        "Ensured fastspec is running in a different terminal for a minimum of 4 hours to "
-        "stabilize the receiver?"
-    )
-
-    block_on_question(
-        "Ensure the VNA is connected with M-M SMA and calibrated with `autocal cal-vna -r`?"
-    )
+    for check in RECEIVER_READING_CHECKS:
+        block_on_question(check)
 
     for repeat in [1, 2]:
 
         with fastspec_process(
-            init_time=4 * 60 * 60 if repeat == 1 else 0,
+            init_time=RECEIVER_WARMUP_TIME if repeat == 1 else 0,
             run_time=0,
             stdout=None if show_fastspec_output else subprocess.DEVNULL,
         ):
             # this runs fastspec for four hours before doing the following, then stops
             # fastspec right after the last S11 is taken. The second repeat does not
             # run for four hours first.
-            for load in ["Match", "Open", "Short"]:
-                block_on_question(
-                    f"{load} load connected to VNA {load}{repeat:02} measurement?"
-                )
-
-                receiver_s11(f"{load}{repeat:02}.s1p")
+            for question, measure in _receiver_load_steps(repeat):
+                block_on_question(question)
+                measure()
 
             # Block here before we release fastspec, so that it doesn't cool down
             # before the second repeat while waiting for user input.
-            block_on_question("ReceiverReading load connected to VNA?")
+            block_on_question(RECEIVER_READING_CHECK)
+
+        _take_receiver_reading(repeat)
 
-        # Get the receiver reading
-        _set_voltage(0)
-        receiver_s11(fname=f"ReceiverReading{repeat:02}.s1p")
-        config.u3io.getFeedback(u3.BitStateWrite(7, 1))
+
+def _receiver_load_steps(repeat: int) -> List[Tuple[str, Callable[[], np.ndarray]]]:
+    """The question to the user, and the measurement, for each load of a repeat of the
+    receiver reading."""
+    return [
+        (
+            f"{load} load connected to VNA {load}{repeat:02} measurement?",
+            partial(receiver_s11, f"{load}{repeat:02}.s1p"),
+        )
+        for load in ["Match", "Open", "Short"]
+    ]
+
+
+def _take_receiver_reading(repeat: int):
+    """Get the receiver reading, through the SP4T switch with its supply off."""
+    _set_voltage(0)
+    receiver_s11(fname=f"ReceiverReading{repeat:02}.s1p", settled=_settle(0))
+    get_switch().power_off()
 
 
 def measure_switching_state_s11(min_warmup_iters=2, max_warmup_iters=50, plot=True):
     """Measure SwitchingState S11."""
-    config.u3io.configIO(FIOAnalog=15)
-    config.u3io.getFeedback(u3.BitDirWrite(4, 1))
-    config.u3io.getFeedback(u3.BitDirWrite(5, 1))
-    config.u3io.getFeedback(u3.BitDirWrite(6, 1))
-    config.u3io.getFeedback(u3.BitDirWrite(7, 1))
+    _init_switch()
 
     console.rule("Starting Warmup")
     _take_warmup_s11(min_warmup_iters, max_warmup_iters, plot=plot)
@@ -340,50 +565,7 @@ def measure_switching_state_s11(min_warmup_iters=2, max_warmup_iters=50, plot=Tr
         }.items():
             if load.startswith("External"):
                 block_on_question(f"{load} connected to receiver input?")
-            take_s11(f"{load}{repeat:02}", voltage)
-
-
-def _binblock_raw(data_in):
-    # Find the start position of the IEEE header, which starts with a '#'.
-    data_in = data_in.decode()
-    startpos = data_in.find("#")
-    logger.debug(f"Startpos: {startpos}")
-
-    # Check for problem with start position.
-    if startpos < 0:
-        raise IOError("No start of block found")
-
-    # Find the number that follows '#' symbol.  This is the number of digits in the block
-    # length.
-    size_of_length = int(data_in[startpos + 1])
-    logger.debug(f"size_of_length: {size_of_length}")
-
-    # Now that we know how many digits are in the size value, get the size of the data file.
-    image_size = int(data_in[(startpos + 2) : (startpos + 2 + size_of_length)])
-
-    # Get the length from the header
-    offset = startpos + size_of_length
-
-    # Extract the data out into a list.
-    return data_in[offset : offset + image_size]
-
-
-def _setup(s):
-    server_address = ("10.206.160.72", 5025)  # ip address of NA
-    logger.info(
-        f"Connecting to network analyser {server_address[0]} port {server_address[1]}"
-    )
-
-    s.connect(server_address)
-    s.send(b"*IDN?\n")
-    time.sleep(0.05)
-    data = s.recv(200)
-    logger.info(f"Connected to ENA: {data}")
-
-    # Define data format for Data transfer reference SCPI
-    s.send(b"FORM:DATA ASCii;*OPC?\n")
-    s.send(b"SENS:FREQ:START 40e6;*OPC?\n")
-    s.send(b"SENS:FREQ:STOP 200e6;*OPC?\n")
+            take_s11(f"{load}{repeat:02}", voltage, repeat=repeat)
 
 
 def measure_s11(
@@ -393,101 +575,198 @@ def measure_s11(
     power: float = 0.0,
     sleep_after_display: int = 70,
     sleep_after_init: int = 5,
+    sync: bool = True,
+    sweep_timeout: Optional[float] = None,
+    binary: bool = True,
+    settled: bool = False,
 ) -> np.ndarray:
-    """Measure S11 using a VNA."""
-    # Create a TCP/IP socket
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    _setup(s)
+    """Measure S11 using a VNA.
+
+    Parameters
+    ----------
+    fname
+        If given, save the S11 to this file.
+    print_settings
+        Whether to print the VNA settings.
+    count
+        Number of sweeps to average.
+    power
+        Output power (dBm).
+    sleep_after_display, sleep_after_init
+        Fixed waits (seconds) used to let the averaging finish when ``sync`` is False.
+    sync
+        Whether to trigger the averaged sweep and ask the VNA when it is complete,
+        instead of waiting for a fixed amount of time.
+    sweep_timeout
+        Maximum time (seconds) to wait for the averaged sweep when ``sync`` is True.
+        By default, the total of the fixed waits used when ``sync`` is False.
+    binary
+        Whether to transfer the complex trace directly as binary REAL64 data. If
+        False, fall back to storing the real and imaginary parts as CSV files on
+        the VNA and transferring those as ASCII.
+    settled
+        Whether the switch is known to have settled (see :mod:`autocal.settle`), so
+        that the fixed waits for it when ``sync`` is False can be skipped.
+    """
+    parse = _sweep_s11(
+        print_settings=print_settings,
+        count=count,
+        power=power,
+        sleep_after_display=sleep_after_display,
+        sleep_after_init=sleep_after_init,
+        sync=sync,
+        sweep_timeout=sweep_timeout,
+        binary=binary,
+        settled=settled,
+    )
+    settings = get_vna().state
+    s11 = parse()
+    if fname:
+        _save_s11(s11, fname, settings=settings)
+    return s11
+
+
+def _sweep_s11(
+    print_settings: bool = True,
+    count: int = 10,
+    power: float = 0.0,
+    sleep_after_display: int = 70,
+    sleep_after_init: int = 5,
+    sync: bool = True,
+    sweep_timeout: Optional[float] = None,
+    binary: bool = True,
+    settled: bool = False,
+) -> Callable[[], np.ndarray]:
+    # Run the sweep and transfer the data, returning a function that parses the
+    # transferred data into the S11 array. Everything here needs the VNA, but the
+    # parsing does not, so it can be deferred (see take_s11).
+    vna = get_vna()
+    _set_frequency_range(vna)
 
     # -----------------------------------------------------
     # Set the output power level.
     # There are different levels of attenuation;
     # check document Agilent E5070B/E5071B ENA programmers
     # guide page no 705
-    s.send(b"SOUR:POW:ATT 0;*OPC?\n")
-    s.send(b"SOUR:POW %f;*OPC?\n" % power)
-    time.sleep(0.5)
+    vna.set("SOUR:POW:ATT", "0")
+    vna.set("SOUR:POW", f"{power:f}")
+    if not sync and not settled:
+        get_clock().sleep(0.5)
     # -----------------------------------------------------
 
-    s.send(b"SENS:SWE:POIN 641;*OPC?\n")
-    s.send(b"SENS:BWID 100;*OPC?\n")
-    s.send(b"SENS:AVER:STAT 1;*OPC?\n")
-    s.send(b"SENS:AVER:CLE;*OPC?\n")
+    vna.set("SENS:SWE:POIN", "641")
+    vna.set("SENS:BWID", "100")
+    vna.set("SENS:AVER:STAT", "1")
+    vna.write("SENS:AVER:CLE")
 
-    s.send(b"SENS:AVER:COUN %d;*OPC?\n" % count)
-    s.send(b"INIT:CONT ON;*OPC?\n")
-    time.sleep(10)
-    s.send(b"DISP:WIND1:TRAC1:Y:AUTO;*OPC?\n")
+    vna.set("SENS:AVER:COUN", count)
+
+    if sync:
+        # A single bus trigger runs the full set of averaging sweeps, after which
+        # the instrument holds the trace until we've read it out.
+        vna.set("TRIG:SOUR", "BUS")
+        vna.set("TRIG:AVER", "ON")
+        vna.set("INIT:CONT", "ON")
+    else:
+        vna.set("INIT:CONT", "ON")
+        if not settled:
+            get_clock().sleep(10)
+    vna.write("DISP:WIND1:TRAC1:Y:AUTO")
 
     if print_settings:
         _print_vna_settings(power, count)
 
     logger.info("Starting VNA Measurements")
 
-    # FIXME: why is the above MESSAGE commented??
-    s.send(b"DISP:WIND1:TRAC1:Y:AUTO;*OPC?\n")
-    time.sleep(sleep_after_display)
+    if sync:
+        if sweep_timeout is None:
+            sweep_timeout = 10 + sleep_after_display + sleep_after_init
 
-    s.send(b"INIT:CONT OFF;*OPC?\n")
-    time.sleep(sleep_after_init)
+        t0 = time.time()
+        if vna.trigger_and_wait(timeout=sweep_timeout):
+            logger.info(f"VNA sweep completed in {time.time() - t0:.1f} seconds.")
+        else:
+            logger.warning(
+                f"VNA sweep did not report completion within {sweep_timeout} seconds."
+            )
+
+        vna.write("DISP:WIND1:TRAC1:Y:AUTO")
+        vna.set("INIT:CONT", "OFF")
+        vna.set("TRIG:SOUR", "INT")
+    else:
+        # FIXME: why is the above MESSAGE commented??
+        vna.write("DISP:WIND1:TRAC1:Y:AUTO")
+        get_clock().sleep(sleep_after_display)
+
+        vna.set("INIT:CONT", "OFF")
+        get_clock().sleep(sleep_after_init)
+
+    if binary:
+        return partial(_s11_from_complex, *vna.read_trace())
+    return partial(_parse_s11_ascii, *_transfer_s11_ascii(vna))
 
-    # -----------------------------------------------------------
 
+def _set_frequency_range(vna):
+    # Made for every sweep (it costs nothing if unchanged), so that the range is
+    # restored if it was changed on the front panel, e.g. during a calibration.
+    vna.set("SENS:FREQ:START", "40e6")
+    vna.set("SENS:FREQ:STOP", "200e6")
+
+
+def _s11_from_complex(freq: np.ndarray, s11_complex: np.ndarray) -> np.ndarray:
+    s11 = np.empty([len(freq), 3])
+    s11[:, 0] = freq  # Frequency points
+    s11[:, 1] = s11_complex.real  # real part
+    s11[:, 2] = s11_complex.imag  # imaginary part
+    return s11
+
+
+def _transfer_s11_ascii(vna):
+    # -----------------------------------------------------------
     # Read Imaginary value and transfer to host controller
     # -----------------------------------------------------------
 
     # Define data type and chanel for Data transfer reference
     # SCPI Programer guide E5061A
-    s.send(b"CALC1:FORM IMAG;*OPC?\n")
+    vna.set("FORM:DATA", "ASCii")
+    vna.set("CALC1:FORM", "IMAG")
 
     # save data internal memory
-    s.send(b'MMEM:STOR:FDAT "D:\\Auto\\EDGES_p.csv";*OPC?\n')
+    vna.write('MMEM:STOR:FDAT "D:\\Auto\\EDGES_p.csv"')
     # transfer data to host controller
-    s.send(b'MMEM:TRAN? "D:\\Auto\\EDGES_p.csv";*OPC?\n')
-    time.sleep(1)
-    data_phase = s.recv(
-        180000
-    )  # buffer size for receiving data currently set as 15Kbytes
-
-    binary_data_p = _binblock_raw(data_phase)
-    data_p = re.split("\r\n|,", binary_data_p)
-    length = len(data_p[5:])
-    data_p_array = np.array(data_p[5:])
-    data_p_re = data_p_array.reshape(length // 3, 3)
-    # Read Imaginary value and transfer to host controller
-    # -----------------------------------------------------------
+    data_phase = vna.query_block('MMEM:TRAN? "D:\\Auto\\EDGES_p.csv"')
 
     # ----------------------------------------------------------
     # Read Real value and transfer to host controller
 
-    s.send(b"CALC1:FORM REAL;*OPC?\n")
-    s.send(b'MMEM:STOR:FDAT "D:\\Auto\\EDGES_m.csv";*OPC?\n')
-    s.send(b'MMEM:TRAN? "D:\\Auto\\EDGES_m.csv";*OPC?\n')
-    time.sleep(1)
-    data_mag = s.recv(180000)
-
-    binary_data_m = _binblock_raw(data_mag)
-    data_m = re.split("\r\n|,", binary_data_m)
-    length = len(data_m[5:])
-    data_m_array = np.array(data_m[5:])
-    data_m_re = data_m_array.reshape(length // 3, 3)
-    # Read Real value and transfer to host controller
-    # -----------------------------------------------------------
+    vna.set("CALC1:FORM", "REAL")
+    vna.write('MMEM:STOR:FDAT "D:\\Auto\\EDGES_m.csv"')
+    data_mag = vna.query_block('MMEM:TRAN? "D:\\Auto\\EDGES_m.csv"')
+
+    return data_phase, data_mag
+
+
+def _parse_s11_ascii(data_phase, data_mag) -> np.ndarray:
+    data_p = parse_ascii_trace(data_phase)
+    data_m = parse_ascii_trace(data_mag)
 
     # Reshape Magnitude, phase and save as S11.csv in host controller
     # -----------------------------------------------------------
-    s11 = np.empty([np.size(data_m_re, 0), 3])
-    s11[:, 0] = data_m_re[:, 0]  # Frequency points
-    s11[:, 1] = data_m_re[:, 1]  # real part
-    s11[:, 2] = data_p_re[:, 1]  # imaginary part
-    if fname:
-        _save_s11(s11, fname)
-    s.close()
+    s11 = np.empty([np.size(data_m, 0), 3])
+    s11[:, 0] = data_m[:, 0]  # Frequency points
+    s11[:, 1] = data_m[:, 1]  # real part
+    s11[:, 2] = data_p[:, 1]  # imaginary part
     return s11
 
 
-def _save_s11(s11: np.ndarray, fname: Union[str, Path] = "S11.csv"):
-    np.savetxt(fname, s11, delimiter="\t", header="Hz S RI R 50")
+def _save_s11(s11: np.ndarray, fname: Union[str, Path] = "S11.csv", **metadata):
+    # Sweeps go to the S11 store of the observation, if there is one, and to
+    # Touchstone files unless the store exports those on demand instead.
+    store = get_store()
+    if store is not None:
+        store.append(s11, name=Path(fname).stem, **metadata)
+    if store is None or store.touchstone:
+        write_touchstone(fname, s11)
 
 
 SP4T_warmup_s11 = partial(measure_s11, count=2)
@@ -498,25 +777,24 @@ receiver_s11 = partial(
 
 def vna_calib():
     """Calibrate a VNA."""
-    # create a TCP/IP socket
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    _setup(s)
+    vna = get_vna()
 
     # ------------------------------------------------------
     #       set the output power level there are different level of attenuation
     #       check document Agilent E5070B/E5071B ENA programmers guide page no 705
-    s.send(b"SOUR:POW:ATT 0;*OPC?\n")
-    s.send(b"SOUR:POW 0.00;*OPC?\n")
+    vna.set("SOUR:POW:ATT", "0")
+    vna.set("SOUR:POW", f"{0:f}")
     # -----------------------------------------------------
 
-    s.send(b"SENS1:CORR:COLL:CKIT 1;*OPC?\n")
+    vna.set("SENS1:CORR:COLL:CKIT", "1")
 
-    s.send(b"SENS:SWE:POIN 641;*OPC?\n")
-    s.send(b"SENS:BWID 100;*OPC?\n")
-    s.send(b"SENS:AVER:STAT 1;*OPC?\n")
-    s.send(b"SENS:AVER:CLE;*OPC?\n")
+    _set_frequency_range(vna)
+    vna.set("SENS:SWE:POIN", "641")
+    vna.set("SENS:BWID", "100")
+    vna.set("SENS:AVER:STAT", "1")
+    vna.write("SENS:AVER:CLE")
 
-    s.send(b"SENS:AVER:COUN 10;*OPC?\n")
+    vna.set("SENS:AVER:COUN", "10")
 
     _print_vna_settings(0, 10)
 
@@ -534,11 +812,13 @@ def vna_calib():
 
     block_on_question("Confirm that all these steps were taken?")
 
+    # The front-panel calibration may have changed any setting.
+    vna.invalidate()
+
     console.print(
         "[green] :heavy_check_mark: VNA Calibration is completed for all loads except "
         "ReceiverReading "
     )
-    s.close()
 
 
 def _print_vna_settings(rf_power, n_averaging):
@@ -559,25 +839,24 @@ def _print_vna_settings(rf_power, n_averaging):
 
 def vna_calib_receiver_reading():
     """Calibrate a VNA for the Receiver Reading."""
-    # create a TCP/IP socket
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    _setup(s)
+    vna = get_vna()
 
     # ------------------------------------------------------
     #       set the output power level there are different level of attenuation
     #       check document Agilent E5070B/E5071B ENA programmers guide page no 705
-    s.send(b"SOUR:POW:ATT 30;*OPC?\n")
-    s.send(b"SOUR:POW -35.00;*OPC?\n")
+    vna.set("SOUR:POW:ATT", "30")
+    vna.set("SOUR:POW", f"{-35:f}")
     # -----------------------------------------------------
 
-    s.send(b"SENS1:CORR:COLL:CKIT 1;*OPC?\n")
+    vna.set("SENS1:CORR:COLL:CKIT", "1")
 
-    s.send(b"SENS:SWE:POIN 641;*OPC?\n")
-    s.send(b"SENS:BWID 100;*OPC?\n")
-    s.send(b"SENS:AVER:STAT 1;*OPC?\n")
-    s.send(b"SENS:AVER:CLE;*OPC?\n")
+    _set_frequency_range(vna)
+    vna.set("SENS:SWE:POIN", "641")
+    vna.set("SENS:BWID", "100")
+    vna.set("SENS:AVER:STAT", "1")
+    vna.write("SENS:AVER:CLE")
 
-    s.send(b"SENS:AVER:COUN 30;*OPC?\n")
+    vna.set("SENS:AVER:COUN", "30")
 
     _print_vna_settings(-35, 30)
 
@@ -597,9 +876,10 @@ def vna_calib_receiver_reading():
 
     block_on_question("Confirm all steps taken?")
 
-    console.print("[green]:checkmark: VNA Calibration is completed for ReceiverReading")
+    # The front-panel calibration may have changed any setting.
+    vna.invalidate()
 
-    s.close()
+    console.print("[green]:checkmark: VNA Calibration is completed for ReceiverReading")
 
 
 def power_handler(signum, frame):
@@ -607,10 +887,7 @@ def power_handler(signum, frame):
     logger.warning("Ctrl+C detected exiting calibration")
     config.p.terminate()
     config.e.terminate()
-    config.u3io.getFeedback(u3.BitStateWrite(4, 1))
-    config.u3io.getFeedback(u3.BitStateWrite(5, 1))
-    config.u3io.getFeedback(u3.BitStateWrite(6, 1))
-    config.u3io.getFeedback(u3.BitStateWrite(7, 1))
-    time.sleep(1)
+    get_switch().switch_to(0, force=True)
+    get_clock().sleep(1)
     logger.warning("Exiting cleanly...")
     exit(signum)
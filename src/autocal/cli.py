@@ -3,27 +3,37 @@ import click
 import datetime as dt
 import functools
 import logging
+import numpy as np
 import questionary as qs
 import re
 import signal
 import subprocess
 import sys
 import time
-import u3
 import yaml
 from datetime import datetime
-from edges_io.io import LOAD_ALIASES, CalibrationObservation, Resistance
+from edges_io.io import LOAD_ALIASES, CalibrationObservation
 from pathlib import Path
 from rich.console import Console
 from rich.logging import RichHandler
 from rich.panel import Panel
 from typing import Optional, Tuple
 
-from . import automation
+from . import automation, engine
 from .automation import power_handler, vna_calib, vna_calib_receiver_reading
 from .config import config
+from .s11_store import S11Store, set_store
+from .settle import SettleDetector, get_detector, set_detector
+from .switch import get_switch
+from .temp_sensor_with_time_U6 import AdaptiveInterval
 from .temp_sensor_with_time_U6 import temp_sensor as tmpsense
+from .temperature_archive import TemperatureArchive
+from .temperature_server import DEFAULT_SOCKET
+from .temperature_server import serve as serve_temperatures
 from .utils import float_validator, int_validator
+from .vna import DEFAULT_PORT
+from .vna_sim import SimulatedVNA
+from .warmup import WarmupCache, set_warmup_cache
 
 # add a comment testing
 logging.basicConfig(
@@ -162,7 +172,76 @@ def write_resistance(defn, male=True, run_num=1):
     default=True,
     help="Whether to create running plots of various parts of the calibration.",
 )
-def run(min_warmup_iters, max_warmup_iters, show_fastspec, plot):
+@click.option(
+    "-a/-A",
+    "--asyncio/--no-asyncio",
+    "use_asyncio",
+    default=False,
+    help="Whether to run the calibration on the asyncio engine, which overlaps "
+    "independent steps (temperature reads, plotting, saving) with instrument work.",
+)
+@click.option(
+    "-s/-S",
+    "--s11-store/--no-s11-store",
+    default=False,
+    help="Whether to also append every S11 sweep to a single HDF5 file, s11.h5, in "
+    "the observation directory.",
+)
+@click.option(
+    "-t/-T",
+    "--touchstone/--no-touchstone",
+    default=True,
+    help="Whether to write S11 sweeps as Touchstone files as they are taken. Only "
+    "applies with --s11-store, from which they can be exported later.",
+)
+@click.option(
+    "-m/-M",
+    "--sampler/--no-sampler",
+    default=False,
+    help="Whether to read the thermistors on a thread of this process, rather than "
+    "with `autocal temp-sensor` in a separate process.",
+)
+@click.option(
+    "--temp-socket",
+    type=click.Path(dir_okay=False),
+    help="Receive the temperatures from an `autocal temp-sensor --daemon` publishing "
+    "on this socket, instead of reading the thermistors.",
+)
+@click.option(
+    "-e/-E",
+    "--settle/--no-settle",
+    default=False,
+    help="Whether to wait for the SP4T switch to settle with fast probe sweeps of the "
+    "VNA before each S11, instead of fixed waits. Settle times are logged.",
+)
+@click.option(
+    "-k/-K",
+    "--warm-start/--no-warm-start",
+    default=False,
+    help="Whether to skip the S11 warmup if a verification sweep of each standard "
+    "matches the converged warmup of a recent run in this observation.",
+)
+@click.option(
+    "--warm-start-max-age",
+    type=float,
+    help="Time (hours) since the converged warmup was saved or last verified after "
+    "which --warm-start no longer uses it. By default, as set by `warm_start` in "
+    "~/.edges-autocal, or 24 hours.",
+)
+def run(
+    min_warmup_iters,
+    max_warmup_iters,
+    show_fastspec,
+    plot,
+    use_asyncio,
+    s11_store,
+    touchstone,
+    sampler,
+    temp_socket,
+    settle,
+    warm_start,
+    warm_start_max_age,
+):
     """Run a calibration of a load."""
     console.rule("Running automated calibration")
 
@@ -170,7 +249,9 @@ def run(min_warmup_iters, max_warmup_iters, show_fastspec, plot):
         logger.error("You have not initialized autocal. Run `autocal init`.")
         sys.exit()
 
-    signal.signal(signal.SIGINT, power_handler)
+    # The asyncio engine handles Ctrl+C itself.
+    if not use_asyncio:
+        signal.signal(signal.SIGINT, power_handler)
 
     calobs, now, obs_path, time = get_observation()
 
@@ -198,10 +279,40 @@ def run(min_warmup_iters, max_warmup_iters, show_fastspec, plot):
         load, obs_path, run_num
     )
 
+    if s11_store:
+        set_store(
+            S11Store(
+                obs_path / "s11.h5",
+                load=load,
+                run_num=run_num,
+                touchstone=touchstone,
+            )
+        )
+    if settle:
+        set_detector(SettleDetector())
+    if warm_start:
+        cache_settings = dict(config.warm_start)
+        if warm_start_max_age is not None:
+            cache_settings["max_age"] = warm_start_max_age * 60 * 60
+        set_warmup_cache(WarmupCache(obs_path / "warmup_cache.h5", **cache_settings))
+
     # ------------------------------------------------------
     #      Starting load calibration
     # ------------------------------------------------------
-    if load not in ["SwitchingState", "ReceiverReading"]:
+    if load not in ["SwitchingState", "ReceiverReading"] and use_asyncio:
+        engine.run(
+            "run_load",
+            load,
+            time,
+            min_warmup_iters=min_warmup_iters,
+            max_warmup_iters=max_warmup_iters,
+            show_fastspec_output=show_fastspec,
+            plot=plot,
+            sampler=sampler,
+            temp_socket=temp_socket,
+        )
+
+    elif load not in ["SwitchingState", "ReceiverReading"]:
         automation.run_load(
             load,
             time,
@@ -209,6 +320,8 @@ def run(min_warmup_iters, max_warmup_iters, show_fastspec, plot):
             max_warmup_iters=max_warmup_iters,
             show_fastspec_output=show_fastspec,
             plot=plot,
+            sampler=sampler,
+            temp_socket=temp_socket,
         )
 
     elif load == "SwitchingState":
@@ -216,13 +329,21 @@ def run(min_warmup_iters, max_warmup_iters, show_fastspec, plot):
         write_resistance(def_file, male=True, run_num=run_num)
 
     elif load == "ReceiverReading":
-        automation.measure_receiver_reading(show_fastspec_output=show_fastspec)
+        if use_asyncio:
+            engine.run("measure_receiver_reading", show_fastspec_output=show_fastspec)
+        else:
+            automation.measure_receiver_reading(show_fastspec_output=show_fastspec)
         write_resistance(def_file, male=False, run_num=run_num)
 
     # ------------------------------------------------------
     # Move the spectra
     # ------------------------------------------------------
     cleanup(load, res_path, run_num, s11_path, spec_path)
+    set_store(None)
+    if get_detector() is not None:
+        get_detector().log_summary()
+        set_detector(None)
+    set_warmup_cache(None)
 
     write_history(def_file, run_num=run_num, load=load, now=now)
     console.rule("[green bold]Finished Calibration!")
@@ -238,10 +359,11 @@ def cleanup(load, res_path, run_num, s11_path, spec_path):
     for fl in config.spec_dir.glob("*.acq"):
         fl.replace(spec_path / f"{load}_{run_num:02}_{fl.name}")
     for fl in Path(".").glob("*.csv"):
-        r = Resistance.read_csv(fl)[0]
-        t = datetime.strptime(
-            r["date"][0].decode() + "-" + r["time"][0].decode(), "%m/%d/%Y-%H:%M:%S"
-        )
+        # Only the first reading is needed, for its date and time.
+        with open(fl) as f:
+            f.readline()
+            date, time, *_ = f.readline().split(",")
+        t = datetime.strptime(date + "-" + time, "%m/%d/%Y-%H:%M:%S")
 
         fl.replace(
             res_path / f"{load}_{run_num:02}_{t.strftime('%Y_%j_%H_%M_%S')}_lab.csv"
@@ -392,9 +514,150 @@ def fastspec():
 
 
 @main.command()
-def temp_sensor():
-    """Run a temperature sensor."""
-    tmpsense()
+@click.option(
+    "-i", "--interval", default=30.0, type=float, help="Time (s) between samples"
+)
+@click.option(
+    "-r",
+    "--resolution-index",
+    default=0,
+    type=click.IntRange(0, 12),
+    help="U6 resolution (oversampling) index. 0 is the default.",
+)
+@click.option(
+    "-a/-A",
+    "--adaptive/--no-adaptive",
+    default=False,
+    help="Whether to adapt the time between samples to how fast temperatures change, "
+    "instead of using --interval.",
+)
+@click.option(
+    "--min-interval",
+    default=5.0,
+    type=float,
+    help="Shortest time (s) between adaptive samples",
+)
+@click.option(
+    "--max-interval",
+    default=120.0,
+    type=float,
+    help="Longest time (s) between adaptive samples",
+)
+@click.option(
+    "--threshold",
+    default=0.1,
+    type=float,
+    help="Rate of temperature change (C/min) above which adaptive samples are taken "
+    "at the shortest interval, if it is also significant given the noise",
+)
+@click.option(
+    "--channel",
+    "channels",
+    multiple=True,
+    default=["sp4t_temp", "load_temp"],
+    type=click.Choice(["lna_temp", "sp4t_temp", "load_temp", "room_temp"]),
+    help="The temperatures whose rate of change sets the adaptive interval. "
+    "May be given more than once.",
+)
+@click.option(
+    "-d/-D",
+    "--daemon/--no-daemon",
+    default=False,
+    help="Whether to also publish the temperatures on a UNIX socket, to which other "
+    "processes (e.g. `autocal run --temp-socket`) can subscribe.",
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    default=str(DEFAULT_SOCKET),
+    type=click.Path(dir_okay=False),
+    help="The socket on which to publish temperatures with --daemon.",
+)
+@click.option(
+    "--archive",
+    type=click.Path(file_okay=False),
+    help="A directory in which to also archive the readings in binary (HDF5) files.",
+)
+@click.option(
+    "--rotate-mb",
+    default=64.0,
+    type=float,
+    help="Size (MB) of an archive file above which a new one is started.",
+)
+@click.option(
+    "--rotate-hours",
+    default=24.0,
+    type=float,
+    help="Time (hours) after which a new archive file is started.",
+)
+def temp_sensor(
+    interval,
+    resolution_index,
+    adaptive,
+    min_interval,
+    max_interval,
+    threshold,
+    channels,
+    daemon,
+    socket_path,
+    archive,
+    rotate_mb,
+    rotate_hours,
+):
+    """Run a temperature sensor.
+
+    On its own, the readings are written to Temperature.csv, which `autocal run` later
+    collects from the same directory. With --daemon or --archive they are instead only
+    archived if --archive is given, and otherwise written to temperature-daemon.log,
+    so that a run in the same directory neither moves nor removes them; the run then
+    writes its own Temperature.csv from the readings it receives.
+    """
+    kwargs = dict(
+        interval=interval,
+        resolution_index=resolution_index,
+        adaptive=AdaptiveInterval(
+            min_interval, max_interval, threshold, channels=channels
+        )
+        if adaptive
+        else None,
+    )
+    if archive:
+        archive = TemperatureArchive(
+            archive,
+            max_bytes=int(rotate_mb * 2**20),
+            max_age=rotate_hours * 60 * 60,
+        )
+
+    if daemon or archive:
+        serve_temperatures(socket_path if daemon else None, archive=archive, **kwargs)
+    else:
+        tmpsense(**kwargs)
+
+
+@main.command()
+@click.option("--host", default="127.0.0.1", help="Address on which to listen")
+@click.option("-p", "--port", default=DEFAULT_PORT, type=int, help="Port to listen on")
+@click.option(
+    "-s", "--sweep-time", default=1.0, type=float, help="Time (s) for a single sweep"
+)
+@click.option(
+    "-l", "--latency", default=0.0, type=float, help="Time (s) added to each response"
+)
+@click.option(
+    "-n", "--noise", default=1e-3, type=float, help="RMS noise of a single sweep"
+)
+def vna_sim(host, port, sweep_time, latency, noise):
+    """Run a simulated VNA, e.g. to test or time the S11 code away from the lab.
+
+    Point autocal at it by setting vna_host and vna_port in ~/.edges-autocal.
+    """
+    sim = SimulatedVNA(
+        host=host, port=port, sweep_time=sweep_time, latency=latency, noise=noise
+    )
+    try:
+        sim.serve_forever()
+    except KeyboardInterrupt:
+        sim.stop()
 
 
 @main.command()
@@ -408,46 +671,55 @@ def mock_temp_sensor():
 @main.command()
 def test_power_supply_box():
     """Test setting voltages on power supply box."""
-    config.u3io.configIO(FIOAnalog=15)
-    config.u3io.getFeedback(u3.BitDirWrite(4, 1))
-    config.u3io.getFeedback(u3.BitDirWrite(5, 1))
-    config.u3io.getFeedback(u3.BitDirWrite(6, 1))
-    config.u3io.getFeedback(u3.BitDirWrite(7, 1))
+    switch = get_switch()
+    switch.configure()
 
     voltage = qs.select(
         "Select a voltage output", choices=["37V", "34V", "31.3V", "28V", "0V"]
     ).ask()
 
-    if voltage == "37V":
-        config.u3io.getFeedback(u3.BitStateWrite(4, 1))
-        config.u3io.getFeedback(u3.BitStateWrite(5, 1))
-        config.u3io.getFeedback(u3.BitStateWrite(6, 1))
-        time.sleep(0.1)
-        config.u3io.getFeedback(u3.BitStateWrite(7, 0))
-    elif voltage == "34V":
-        config.u3io.getFeedback(u3.BitStateWrite(4, 1))
-        config.u3io.getFeedback(u3.BitStateWrite(5, 1))
-        config.u3io.getFeedback(u3.BitStateWrite(6, 0))
-        time.sleep(0.1)
-        config.u3io.getFeedback(u3.BitStateWrite(7, 0))
-    elif voltage == "31.3V":
-        config.u3io.getFeedback(u3.BitStateWrite(4, 1))
-        config.u3io.getFeedback(u3.BitStateWrite(5, 0))
-        config.u3io.getFeedback(u3.BitStateWrite(6, 1))
-        time.sleep(0.1)
-        config.u3io.getFeedback(u3.BitStateWrite(7, 0))
-    elif voltage == "28V":
-        config.u3io.getFeedback(u3.BitStateWrite(4, 0))
-        config.u3io.getFeedback(u3.BitStateWrite(5, 1))
-        config.u3io.getFeedback(u3.BitStateWrite(6, 1))
-        time.sleep(0.1)
-        config.u3io.getFeedback(u3.BitStateWrite(7, 0))
-    elif voltage == "0V":
-        config.u3io.getFeedback(u3.BitStateWrite(4, 1))
-        config.u3io.getFeedback(u3.BitStateWrite(5, 1))
-        config.u3io.getFeedback(u3.BitStateWrite(6, 1))
-        time.sleep(0.1)
-        config.u3io.getFeedback(u3.BitStateWrite(7, 1))
+    switch.switch_to(float(voltage[:-1]))
+
+
+@main.command()
+@click.argument("store", type=click.Path(exists=True, dir_okay=False))
+@click.argument("directory", type=click.Path(file_okay=False))
+@click.option("-l", "--load", default=None, help="Only export sweeps of this load")
+@click.option("-r", "--run-num", type=int, default=None, help="Only export this run")
+def export_s11(store, directory, load, run_num):
+    """Export S11 sweeps from an HDF5 S11 store to Touchstone files in DIRECTORY."""
+    with S11Store(store) as st:
+        data = st.read()
+        if not data:
+            logger.warning(f"No sweeps in {store}.")
+            return
+
+        sel = np.ones(len(data["s11"]), dtype=bool)
+        if load is not None:
+            sel &= data["load"] == load
+        if run_num is not None:
+            sel &= data["run_num"] == run_num
+
+        st.export_touchstone(directory, np.nonzero(sel)[0])
+
+    console.print(f":heavy_check_mark: [green] Exported {sel.sum()} sweeps.")
+
+
+@main.command()
+@click.argument("archive", type=click.Path(exists=True, file_okay=False))
+@click.argument("output", type=click.Path(dir_okay=False))
+@click.option("--start", type=click.DateTime(), help="Only export readings from then")
+@click.option("--stop", type=click.DateTime(), help="Only export readings until then")
+def export_temperature(archive, output, start, stop):
+    """Export readings from a temperature archive to a temperature log (CSV) OUTPUT."""
+    with TemperatureArchive(archive) as arc:
+        n = arc.export_csv(
+            output,
+            start=start and start.timestamp(),
+            stop=stop and stop.timestamp(),
+        )
+
+    console.print(f":heavy_check_mark: [green] Exported {n} readings.")
 
 
 @main.command()
@@ -1,10 +1,12 @@
 """Configuration options for the package."""
-import u3
 import yaml
-from LabJackPython import NullHandleException
 from pathlib import Path
 
+from .hal import open_device
+from .switch import SwitchController, set_switch
+from .thermistor import get_thermistors
 from .utils import singleton
+from .vna import DEFAULT_HOST, DEFAULT_PORT
 
 
 @singleton
@@ -16,7 +18,7 @@ class Config:
     fname
         Filename where configuration is kept.
     init
-        Whether to initialize the u3 object on read.
+        Whether to initialize the u3 object when it is first used.
     """
 
     def __init__(self, fname: [str, Path], init=True):
@@ -37,28 +39,47 @@ class Config:
         self.fastspec_path = self.fastspec_dir / "fastspec_single"
         self.fastspec_ini = self.fastspec_dir / "edges.ini"
 
-        self.u3io = None
+        self.vna_host = settings.get("vna_host", DEFAULT_HOST)
+        self.vna_port = int(settings.get("vna_port", DEFAULT_PORT))
 
-        if init:
+        # Divider resistors and Steinhart-Hart coefficients of the thermistors.
+        self.thermistors = get_thermistors(settings.get("thermistors"))
+
+        # Time (s) for the SP4T control lines to settle before its supply is switched on.
+        self.switch_guard_time = float(settings.get("switch_guard_time", 0.1))
+
+        # Parameters of the convergence test of the warmup (see TrendConvergence).
+        self.warmup_convergence = dict(settings.get("warmup_convergence") or {})
+        # Parameters of the skipping of warm warmups (see WarmupCache).
+        self.warm_start = dict(settings.get("warm_start") or {})
+
+        self._init = init
+        self._u3io = None
+
+    @property
+    def u3io(self):
+        """The U3, which is opened (and its switch configured) when first used."""
+        if self._u3io is None and self._init:
             self.initialize()
+        return self._u3io
+
+    @u3io.setter
+    def u3io(self, device):
+        self._u3io = device
 
     def initialize(self):
         """Initialize the u3 object."""
-        self.u3io = u3.U3()
-        self.u3io.configIO(FIOAnalog=15)
-        self.u3io.getFeedback(u3.BitDirWrite(4, 1))
-        self.u3io.getFeedback(u3.BitDirWrite(5, 1))
-        self.u3io.getFeedback(u3.BitDirWrite(6, 1))
-        self.u3io.getFeedback(u3.BitDirWrite(7, 1))
+        self._u3io = open_device("u3")
+
+        switch = SwitchController(self.u3io, guard_time=self.switch_guard_time)
+        switch.configure()
+        set_switch(switch)
 
 
+# The U3 is only opened when first used, so that processes that don't need it (like
+# the temp_sensor function, which is run in a separate process while the calibration
+# holds the U3) can still import this.
 try:
     config = Config("~/.edges-autocal")
 except IOError:
     config = None
-except NullHandleException:
-    # If u3 was instantiated in some other process, it can't be instantiated again here.
-    # This will cause a lot of functions to error (since u3io won't be defined). But
-    # some functions don't need it, and we still need to run them (especially the
-    # temp_sensor function, which is run in a separate process).
-    config = Config("~/.edges-autocal", init=False)
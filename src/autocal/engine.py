@@ -0,0 +1,269 @@
+"""An asyncio engine that overlaps the independent steps of a calibration."""
+import asyncio
+import logging
+import signal
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from rich.console import Console
+from typing import Optional
+
+from . import automation, plotting
+from .config import config
+from .hal import get_clock
+from .sampler import set_sampler
+from .utils import block_on_question_async
+from .warmup import WarmupBuffer
+
+console = Console()
+logger = logging.getLogger(__name__)
+
+
+class Engine:
+    """Coordinates the instruments, fastspec and the temperature logger with asyncio.
+
+    Every VNA and LabJack call goes through a single-thread "hardware" executor, so the
+    instruments are driven by exactly one call at a time, in order. Reading the
+    temperature log, parsing and plotting happen on other threads, and fastspec and the
+    temperature logger are asyncio subprocesses, so all of these overlap with the
+    instrument work and with each other.
+
+    Parameters
+    ----------
+    show_fastspec_output
+        Whether to show the output of fastspec.
+    plot
+        Whether to create running plots of the warmup.
+    """
+
+    def __init__(self, show_fastspec_output: bool = True, plot: bool = True):
+        self.stdout = None if show_fastspec_output else subprocess.DEVNULL
+        self.plot = plot
+
+        self._hardware = ThreadPoolExecutor(max_workers=1)
+        self._workers = ThreadPoolExecutor(max_workers=1)
+        self._plotter = ThreadPoolExecutor(max_workers=1)
+        self._processes = []
+
+    async def _run_in(self, pool: ThreadPoolExecutor, call: partial):
+        return await asyncio.get_running_loop().run_in_executor(pool, call)
+
+    async def hardware(self, func, *args, **kwargs):
+        """Run a function that talks to the VNA or LabJacks."""
+        return await self._run_in(self._hardware, partial(func, *args, **kwargs))
+
+    async def background(self, func, *args, **kwargs):
+        """Run a function that does not need the instruments."""
+        return await self._run_in(self._workers, partial(func, *args, **kwargs))
+
+    async def start_process(self, *cmd, stdout=None) -> asyncio.subprocess.Process:
+        """Start a subprocess that is terminated when the engine shuts down."""
+        proc = await asyncio.create_subprocess_exec(*map(str, cmd), stdout=stdout)
+        self._processes.append(proc)
+        return proc
+
+    async def wait_process(self, proc: asyncio.subprocess.Process):
+        """Wait for a subprocess to exit by itself."""
+        await proc.wait()
+        if proc in self._processes:
+            self._processes.remove(proc)
+
+    async def stop_process(self, proc: asyncio.subprocess.Process):
+        """Terminate a subprocess (if it is still running) and wait for it to exit."""
+        if proc.returncode is None:
+            proc.terminate()
+        await self.wait_process(proc)
+
+    async def start_fastspec(self, run_time: float = 0) -> asyncio.subprocess.Process:
+        """Start fastspec, for a certain amount of time or (by default) forever."""
+        cmd = [config.fastspec_path, "-i", config.fastspec_ini]
+        if run_time:
+            cmd += ["-s", run_time]
+        return await self.start_process(*cmd, "-p", stdout=self.stdout)
+
+    async def shutdown(self):
+        """Stop all subprocesses and switch off the SP4T power supply."""
+        for proc in list(self._processes):
+            await self.stop_process(proc)
+        set_sampler(None)
+
+        # Any instrument call still in progress finishes before this one runs.
+        await self.hardware(automation._set_voltage, 0)
+
+        self._hardware.shutdown()
+        self._workers.shutdown()
+        self._plotter.shutdown()
+
+    async def run_load(
+        self,
+        load: str,
+        run_time: float,
+        min_warmup_iters=2,
+        max_warmup_iters=50,
+        sampler: bool = False,
+        temp_socket: Optional[str] = None,
+    ):
+        """Run a full calibration of a load.
+
+        If ``sampler`` is True, the thermistors are read by an in-process
+        :class:`~autocal.sampler.TemperatureSampler` rather than by
+        ``autocal temp-sensor`` in a separate process. If ``temp_socket`` is given,
+        they are instead received from the ``autocal temp-sensor --daemon`` publishing
+        on that socket.
+        """
+        await self.hardware(
+            automation._init_switch,
+            configure_io=load in automation.CONFIGURE_IO_LOADS,
+        )
+
+        console.rule(f"Starting {load} Calibration")
+
+        for check in automation._load_checks(load):
+            await block_on_question_async(check)
+
+        console.print(
+            "[bold]Starting the spectrum observing program and temperature monitoring "
+            "program"
+        )
+        temp_sampler = automation._start_temperature_sampler(sampler, temp_socket)
+        fastspec = await self.start_fastspec(run_time)
+        if temp_sampler is None:
+            temp_sensor = await self.start_process("autocal", "temp-sensor")
+        await self.wait_process(fastspec)
+        console.rule("[bold]Finished taking spectra.")
+
+        # Warmup before taking S11.
+        console.print("[bold]Starting S11 Warmup")
+        await self.take_warmup_s11(min_warmup_iters, max_warmup_iters)
+
+        console.print("")
+        for repeat, name in automation.LOAD_S11_REPEATS.items():
+            console.print(f"[bold]Taking {name} Repeat of S11 measurements...")
+            await self.take_all_load_s11(repeat)
+
+        if temp_sampler is not None:
+            await self.background(set_sampler, None)
+        else:
+            await self.stop_process(temp_sensor)
+
+    async def take_all_load_s11(self, repeat_num: int):
+        """Take all S11 measurements for a load, saving them in the background."""
+        futures = [
+            await self.hardware(
+                automation.take_s11,
+                f"{name}{repeat_num:02}",
+                voltage=voltage,
+                print_settings=not i,
+                executor=self._workers,
+                repeat=repeat_num,
+            )
+            for i, (name, voltage) in enumerate(automation.STANDARD_VOLTAGES.items())
+        ]
+        await asyncio.gather(*map(asyncio.wrap_future, futures))
+
+    async def _plot_warmup(self, freqs, warmup_re, warmup_im, temps):
+        await self._run_in(
+            self._plotter,
+            partial(
+                plotting.s11_warmup_plot,
+                freq=freqs,
+                s11_re=warmup_re,
+                s11_im=warmup_im,
+                temperatures=await temps,
+                filename="warmup_s11.pdf",
+            ),
+        )
+
+    async def take_warmup_s11(self, min_warmup_iters, max_warmup_iters):
+        """Warm up the SP4T switch until its S11 has converged."""
+        warmup = WarmupBuffer(automation.WARMUP_VOLTAGES, max_warmup_iters)
+        convergence = automation._convergence()
+        plots = []
+
+        if await self.hardware(automation._start_warmup, warmup):
+            await self.background(automation._write_warmup_s11, warmup)
+            return
+
+        # Any verification sweeps count as the first iteration.
+        for warmup_count in range(len(warmup), max_warmup_iters):
+            # Each step (sweep) of the iteration runs on the hardware thread.
+            steps = automation._warmup_iteration(warmup)
+            while await self.hardware(next, steps, None) is not None:
+                # Read the temperatures and plot while the switch moves on.
+                if self.plot:
+                    temps = asyncio.ensure_future(
+                        self.background(automation._read_sp4t_temps)
+                    )
+                    # The views are taken now, so later sweeps aren't plotted.
+                    plots.append(
+                        asyncio.ensure_future(
+                            self._plot_warmup(
+                                warmup.freq, warmup.real(), warmup.imag(), temps
+                            )
+                        )
+                    )
+
+            if await self.background(
+                automation._end_warmup_iteration,
+                warmup,
+                warmup_count,
+                min_warmup_iters,
+                convergence,
+            ):
+                break
+
+        await asyncio.gather(*plots)
+        await self.background(automation._write_warmup_s11, warmup)
+
+    async def measure_receiver_reading(self):
+        """Measure receiver reading S11."""
+        console.rule("Performing Receiver Reading Measurement")
+        for check in automation.RECEIVER_READING_CHECKS:
+            await block_on_question_async(check)
+
+        for repeat in [1, 2]:
+            fastspec = await self.start_fastspec()
+
+            # The first repeat runs fastspec for a while first, to stabilise the
+            # receiver.
+            if repeat == 1:
+                await asyncio.sleep(
+                    get_clock().to_real(automation.RECEIVER_WARMUP_TIME)
+                )
+
+            for question, measure in automation._receiver_load_steps(repeat):
+                await block_on_question_async(question)
+                await self.hardware(measure)
+
+            # Block here before we release fastspec, so that it doesn't cool down
+            # before the second repeat while waiting for user input.
+            await block_on_question_async(automation.RECEIVER_READING_CHECK)
+            await self.stop_process(fastspec)
+
+            await self.hardware(automation._take_receiver_reading, repeat)
+
+
+def run(step: str, *args, show_fastspec_output=True, plot=True, **kwargs):
+    """Run an :class:`Engine` method to completion, stopping cleanly on Ctrl+C.
+
+    Ctrl+C cancels whatever the engine is waiting on; subprocesses are then stopped and
+    the SP4T power supply switched off before exiting.
+    """
+    engine = Engine(show_fastspec_output=show_fastspec_output, plot=plot)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGINT, asyncio.current_task().cancel)
+        try:
+            await getattr(engine, step)(*args, **kwargs)
+        finally:
+            loop.remove_signal_handler(signal.SIGINT)
+            await engine.shutdown()
+
+    try:
+        asyncio.run(main())
+    except asyncio.CancelledError:
+        logger.warning("Ctrl+C detected exiting calibration")
+        logger.warning("Exiting cleanly...")
+        sys.exit(signal.SIGINT)
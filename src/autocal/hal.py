@@ -0,0 +1,129 @@
+"""The devices and clock used for a calibration, which can be replaced by simulations.
+
+The LabJacks are opened through :func:`open_device`, and every wait of the calibration
+is made on the clock of :func:`get_clock`. Setting simulated drivers (see
+:mod:`autocal.labjack_sim`) and a fast clock lets a whole calibration run offline,
+in a fraction of its real time, for profiling and benchmarks.
+
+The drivers need only implement the part of the LabJackPython API that is used here:
+
+- U3 (the SP4T switch): ``configIO(FIOAnalog=...)``, and ``getFeedback`` with
+  ``u3.BitDirWrite`` and ``u3.BitStateWrite`` commands.
+- U6 (the thermistors): ``getFeedback`` with ``u6.AIN24AR`` commands, returning a
+  dict with ``"AIN"`` and ``"GainIndex"`` for each, and
+  ``binaryToCalibratedAnalogVoltage``.
+"""
+import datetime
+import logging
+import threading
+import time
+import u3
+import u6
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Clock:
+    """The time, and waits, of a calibration, optionally running faster than real time.
+
+    Parameters
+    ----------
+    speedup
+        The number of (simulated) seconds that pass in each real second. At 1, this is
+        just the system clock.
+
+    Examples
+    --------
+    Run four simulated hours in under two real seconds:
+
+    >>> set_clock(Clock(speedup=10000))
+    >>> get_clock().sleep(4 * 60 * 60)
+    """
+
+    def __init__(self, speedup: float = 1.0):
+        if speedup <= 0:
+            raise ValueError("speedup must be positive.")
+
+        self.speedup = speedup
+        self._real_start = time.monotonic()
+        self._start = time.time()
+
+    def monotonic(self) -> float:
+        """A monotonic time (seconds), with an arbitrary origin."""
+        if self.speedup == 1:
+            return time.monotonic()
+        return self.speedup * (time.monotonic() - self._real_start)
+
+    def time(self) -> float:
+        """The (epoch) time, in seconds."""
+        if self.speedup == 1:
+            return time.time()
+        return self._start + self.monotonic()
+
+    def now(self) -> datetime.datetime:
+        """The (local) date and time."""
+        return datetime.datetime.fromtimestamp(self.time())
+
+    def to_real(self, seconds: float) -> float:
+        """The real time taken by a (simulated) time."""
+        return seconds / self.speedup
+
+    def sleep(self, seconds: float):
+        """Wait for a time."""
+        if seconds > 0:
+            time.sleep(self.to_real(seconds))
+
+    def wait(self, event: threading.Event, timeout: float) -> bool:
+        """Wait for an event to be set, for at most a time.
+
+        Returns
+        -------
+        bool
+            Whether the event is set.
+        """
+        return event.wait(self.to_real(max(timeout, 0)))
+
+
+_clock = Clock()
+
+
+def get_clock() -> Clock:
+    """Return the clock of the calibration, by default the system clock."""
+    return _clock
+
+
+def set_clock(clock: Optional[Clock]):
+    """Set the clock of the calibration. None to restore the system clock."""
+    global _clock
+    _clock = Clock() if clock is None else clock
+
+
+# The functions that open each type of device.
+DRIVERS: Dict[str, Callable] = {"u3": u3.U3, "u6": u6.U6}
+_drivers = dict(DRIVERS)
+
+
+def open_device(kind: str):
+    """Open a LabJack (``"u3"`` or ``"u6"``) with its current driver."""
+    try:
+        driver = _drivers[kind]
+    except KeyError:
+        raise ValueError(f"Unknown device '{kind}', must be one of {list(DRIVERS)}.")
+    return driver()
+
+
+def set_driver(kind: str, driver: Optional[Callable]):
+    """Set the function that opens a type of device, e.g. to a simulated one.
+
+    Parameters
+    ----------
+    kind
+        The type of device, ``"u3"`` or ``"u6"``.
+    driver
+        A function taking no arguments and returning an open device. None to restore
+        the LabJackPython one.
+    """
+    if kind not in DRIVERS:
+        raise ValueError(f"Unknown device '{kind}', must be one of {list(DRIVERS)}.")
+    _drivers[kind] = DRIVERS[kind] if driver is None else driver
@@ -0,0 +1,181 @@
+"""In-memory simulations of the LabJacks, for offline testing and timing.
+
+Use them in place of the real devices with :func:`autocal.hal.set_driver`.
+"""
+import logging
+import numpy as np
+import u3
+import u6
+from numpy.polynomial import polynomial
+from typing import Dict, List, Optional, Tuple
+
+from .hal import get_clock
+from .temp_sensor_with_time_U6 import CHANNELS
+from .thermistor import ABS_ZERO, THERMISTORS, Thermistor
+
+logger = logging.getLogger(__name__)
+
+# The initial and final temperatures (C) of each thermistor, and the time constant
+# (seconds) with which it relaxes from one to the other: the SP4T switch warms up over
+# the first hour or so, while the room stays put.
+DEFAULT_TEMPERATURES: Dict[str, Tuple[float, float, float]] = {
+    "lna": (24.0, 25.0, 1200.0),
+    "sp4t": (24.0, 32.0, 900.0),
+    "load": (24.0, 24.5, 1800.0),
+    "room": (24.0, 24.0, 1.0),
+}
+
+
+class SimulatedU3:
+    """A U3 that keeps the configuration and state of its FIO pins in memory.
+
+    Parameters
+    ----------
+    latency
+        Time (simulated seconds) taken by each USB transaction.
+
+    Attributes
+    ----------
+    fio
+        The state of each FIO pin.
+    direction
+        The direction of each FIO pin (1 for an output).
+    transactions
+        The number of transactions made with the device.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.analog = 0
+        self.fio: List[int] = [0] * 8
+        self.direction: List[int] = [0] * 8
+        self.transactions = 0
+
+    def _transaction(self):
+        get_clock().sleep(self.latency)
+        self.transactions += 1
+
+    def configIO(self, FIOAnalog=None, **kwargs):  # noqa: N802,N803
+        """Configure which FIO pins are analog inputs."""
+        self._transaction()
+        if FIOAnalog is not None:
+            self.analog = FIOAnalog
+        return {"FIOAnalog": self.analog}
+
+    def getFeedback(self, *commands):  # noqa: N802
+        """Apply bit direction and state writes, all in one transaction."""
+        self._transaction()
+        for cmd in commands:
+            if isinstance(cmd, u3.BitStateWrite):
+                self.fio[cmd.ioNumber] = int(bool(cmd.state))
+            elif isinstance(cmd, u3.BitDirWrite):
+                self.direction[cmd.ioNumber] = int(bool(cmd.direction))
+            else:
+                raise NotImplementedError(f"{type(cmd).__name__} is not simulated.")
+        return [None] * len(commands)
+
+
+class SimulatedU6:
+    """A U6 reading the thermistor dividers of a simulated, warming-up receiver.
+
+    The temperature of each thermistor relaxes exponentially from an initial to a final
+    value, in the time of the clock (see :func:`autocal.hal.get_clock`) since the
+    device was opened. The voltages read are those of the dividers at that
+    temperature, plus Gaussian noise.
+
+    The raw readings returned by :meth:`getFeedback` are the voltages themselves, which
+    :meth:`binaryToCalibratedAnalogVoltage` passes through.
+
+    Parameters
+    ----------
+    temperatures
+        The initial and final temperature (C), and the time constant (seconds), of each
+        thermistor. By default, :data:`DEFAULT_TEMPERATURES`.
+    thermistors
+        The thermistors. By default, :data:`~autocal.thermistor.THERMISTORS`.
+    vs
+        The excitation voltage of the dividers.
+    noise
+        The standard deviation (V) of the noise on each voltage.
+    latency
+        Time (simulated seconds) taken by each USB transaction.
+    seed
+        Seed for the noise.
+    """
+
+    def __init__(
+        self,
+        temperatures: Optional[Dict[str, Tuple[float, float, float]]] = None,
+        thermistors: Optional[Dict[str, Thermistor]] = None,
+        vs: float = 2.5,
+        noise: float = 1e-5,
+        latency: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.temperatures = dict(temperatures or DEFAULT_TEMPERATURES)
+        self.thermistors = thermistors or THERMISTORS
+        self.vs = vs
+        self.noise = noise
+        self.latency = latency
+        self.transactions = 0
+
+        self._rng = np.random.default_rng(seed)
+        self._start = get_clock().monotonic()
+
+    def temperature(self, name: str, t: Optional[float] = None) -> float:
+        """The temperature (C) of a thermistor at a time (seconds since opening).
+
+        By default, the current time.
+        """
+        if t is None:
+            t = get_clock().monotonic() - self._start
+        initial, final, tau = self.temperatures[name]
+        return final + (initial - final) * np.exp(-t / tau)
+
+    def voltage(self, name: str, t: Optional[float] = None) -> float:
+        """The (noiseless) voltage across a thermistor at a time."""
+        if name == "vs":
+            return self.vs
+
+        thermistor = self.thermistors[name]
+        resistance = _resistance(thermistor, self.temperature(name, t))
+        return self.vs * resistance / (resistance + thermistor.resistor)
+
+    def getFeedback(self, *commands):  # noqa: N802
+        """Read analog inputs, all in one transaction."""
+        get_clock().sleep(self.latency)
+        self.transactions += 1
+
+        channels = {channel: name for name, channel in CHANNELS.items()}
+        t = get_clock().monotonic() - self._start
+        results = []
+        for cmd in commands:
+            if not isinstance(cmd, u6.AIN24AR):
+                raise NotImplementedError(f"{type(cmd).__name__} is not simulated.")
+
+            voltage = self.voltage(channels[cmd.positiveChannel], t)
+            results.append(
+                {
+                    "AIN": voltage + self.noise * self._rng.standard_normal(),
+                    "ResolutionIndex": cmd.resolutionIndex,
+                    "GainIndex": cmd.gainIndex,
+                    "Status": 0,
+                }
+            )
+        return results
+
+    def binaryToCalibratedAnalogVoltage(  # noqa: N802
+        self, gainIndex, bytesVoltage, is16Bits=False, resolutionIndex=0  # noqa: N803
+    ) -> float:
+        """Return the voltage of a raw reading (which is the voltage itself)."""
+        return float(bytesVoltage)
+
+
+def _resistance(thermistor: Thermistor, temperature: float) -> float:
+    # Invert the Steinhart-Hart equation: of the real roots for ln(R), take that
+    # closest to the resistor of the divider, which is matched to the thermistor.
+    coefficients = np.array(thermistor.coefficients)
+    coefficients[0] -= 1 / (temperature + ABS_ZERO)
+    roots = polynomial.polyroots(coefficients)
+    roots = roots[np.isreal(roots)].real
+    return float(np.exp(roots[np.argmin(abs(roots - np.log(thermistor.resistor)))]))
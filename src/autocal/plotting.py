@@ -1,17 +1,20 @@
 """PLotting functionality for autocal."""
 import numpy as np
-from matplotlib import pyplot as plt
-from typing import Dict, List
+from matplotlib.figure import Figure
+from typing import Dict
 
 
 def s11_warmup_plot(
     freq: np.ndarray,
-    s11_re: Dict[str, List[np.ndarray]],
-    s11_im: Dict[str, List[np.ndarray]],
+    s11_re: Dict[str, np.ndarray],
+    s11_im: Dict[str, np.ndarray],
     temperatures: np.ndarray,
     filename=None,
 ):
-    """Plot all the S11 measurements taken in warmup, to illustrate convergence."""
+    """Plot all the S11 measurements taken in warmup, to illustrate convergence.
+
+    The figure is created without pyplot, so this is safe to call off the main thread.
+    """
     nfreq = len(freq)
     assert len(s11_re) == len(s11_im)
 
@@ -19,14 +22,15 @@ def s11_warmup_plot(
     freq1 = freq[nfreq // 2]
     freq2 = freq[-1]
 
-    fig, ax = plt.subplots(5, 1, sharex=True, figsize=(12, 12))
+    fig = Figure(figsize=(12, 12))
+    ax = fig.subplots(5, 1, sharex=True)
 
     for i, load in enumerate(s11_re.keys()):
-        re = np.atleast_2d(np.array(s11_re[load]))
-        im = np.atleast_2d(np.array(s11_im[load]))
+        re = np.atleast_2d(s11_re[load])
+        im = np.atleast_2d(s11_im[load])
         print(re.shape)
         print(im.shape)
-        if re.shape[1] == 0 or im.shape[1] == 0:
+        if re.size == 0 or im.size == 0:
             continue
 
         ax[0].plot(re[:, 0], ls="-", color=f"C{i}", label=f"{load} (Re)")
@@ -52,4 +56,4 @@ def s11_warmup_plot(
     ax[0].legend()
 
     if filename:
-        plt.savefig(filename)
+        fig.savefig(filename)
@@ -0,0 +1,220 @@
+"""A consolidated HDF5 store of all the S11 sweeps of an observation."""
+import h5py
+import json
+import logging
+import numpy as np
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Per-sweep metadata, stored as one-dimensional datasets alongside the traces.
+_METADATA = {
+    "load": h5py.string_dtype(),
+    "run_num": int,
+    "name": h5py.string_dtype(),
+    "repeat": int,
+    "voltage": float,
+    "timestamp": float,
+    "settings": h5py.string_dtype(),
+}
+
+
+def write_touchstone(fname: Union[str, Path], s11: np.ndarray):
+    """Write an ``(nfreq, 3)`` array of frequency, real and imaginary S11 to file."""
+    np.savetxt(fname, s11, delimiter="\t", header="Hz S RI R 50")
+
+
+class S11Store:
+    """An HDF5 file to which every S11 sweep of an observation is appended.
+
+    Each sweep is stored with its frequency grid, the load and run it belongs to, its
+    name (e.g. ``External01``), repeat number, SP4T voltage, time and VNA settings.
+    All datasets are chunked, compressed and resizable along the first (sweep) axis, so
+    appending is cheap and any set of sweeps can be read back with a single slice.
+
+    Parameters
+    ----------
+    path
+        The HDF5 file. It is created if it doesn't exist, and appended to if it does.
+    load
+        The load whose sweeps are being appended.
+    run_num
+        The run number of the load.
+    touchstone
+        Whether sweeps should also be written as Touchstone files as they are taken.
+        If False, they can be exported later with :meth:`export_touchstone`.
+    chunk_size
+        The number of sweeps in each chunk.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        load: str = "",
+        run_num: int = 0,
+        touchstone: bool = True,
+        chunk_size: int = 16,
+    ):
+        self.path = Path(path)
+        self.load = load
+        self.run_num = run_num
+        self.touchstone = touchstone
+        self.chunk_size = chunk_size
+
+        self._lock = threading.Lock()
+        self._file = h5py.File(self.path, "a")
+
+    def __len__(self) -> int:
+        """The number of sweeps in the store."""
+        return len(self._file["s11"]) if "s11" in self._file else 0
+
+    def close(self):
+        """Close the file."""
+        self._file.close()
+
+    def __enter__(self):
+        """Use the store."""
+        return self
+
+    def __exit__(self, *exc):
+        """Close the store."""
+        self.close()
+
+    def _create(self, nfreq: int):
+        fl = self._file
+        for key, dtype in [("freq", float), ("s11", complex)]:
+            fl.create_dataset(
+                key,
+                shape=(0, nfreq),
+                maxshape=(None, nfreq),
+                dtype=dtype,
+                chunks=(self.chunk_size, nfreq),
+                compression="gzip",
+                shuffle=True,
+            )
+        for key, dtype in _METADATA.items():
+            fl.create_dataset(
+                key,
+                shape=(0,),
+                maxshape=(None,),
+                dtype=dtype,
+                chunks=(max(self.chunk_size, 256),),
+                compression="gzip",
+            )
+
+    def append(
+        self,
+        s11: np.ndarray,
+        name: str,
+        repeat: int = 0,
+        voltage: float = np.nan,
+        settings: Optional[Dict[str, str]] = None,
+        timestamp: Optional[float] = None,
+    ):
+        """Append a sweep.
+
+        Parameters
+        ----------
+        s11
+            The ``(nfreq, 3)`` array of frequency, real and imaginary S11.
+        name
+            The name of the measurement, e.g. ``External01``.
+        repeat
+            The repeat number of the measurement.
+        voltage
+            The voltage setting the SP4T switch state.
+        settings
+            The VNA settings used for the sweep.
+        timestamp
+            The (epoch) time of the sweep. By default, now.
+        """
+        row = {
+            "load": self.load,
+            "run_num": self.run_num,
+            "name": name,
+            "repeat": repeat,
+            "voltage": voltage,
+            "timestamp": time.time() if timestamp is None else timestamp,
+            "settings": json.dumps(settings or {}),
+        }
+
+        with self._lock:
+            if "s11" not in self._file:
+                self._create(len(s11))
+
+            n = len(self)
+            if len(s11) != self._file["s11"].shape[1]:
+                raise ValueError(
+                    f"Sweep has {len(s11)} frequencies but the store has "
+                    f"{self._file['s11'].shape[1]}."
+                )
+
+            for key in ["freq", "s11", *_METADATA]:
+                self._file[key].resize(n + 1, axis=0)
+
+            self._file["freq"][n] = s11[:, 0]
+            self._file["s11"][n] = s11[:, 1] + 1j * s11[:, 2]
+            for key, value in row.items():
+                self._file[key][n] = value
+
+            self._file.flush()
+
+    def read(
+        self, sel: Union[slice, np.ndarray] = slice(None)
+    ) -> Dict[str, np.ndarray]:
+        """Read (a selection of) the sweeps and their metadata.
+
+        Parameters
+        ----------
+        sel
+            A slice, or boolean or index array, selecting the sweeps to read.
+        """
+        if not len(self):
+            return {}
+
+        with self._lock:
+            out = {}
+            for key in ["freq", "s11", *_METADATA]:
+                dset = self._file[key]
+                if h5py.check_string_dtype(dset.dtype):
+                    dset = dset.asstr()
+                out[key] = dset[sel]
+        return out
+
+    def export_touchstone(
+        self, directory: Union[str, Path], sel: Union[slice, np.ndarray] = slice(None)
+    ):
+        """Export (a selection of) the sweeps as Touchstone files.
+
+        Files are written as ``<directory>/<load><run_num>/<name>.s1p``, matching the
+        layout of the ``S11`` directory of an observation.
+        """
+        data = self.read(sel)
+        for i in range(len(data.get("s11", []))):
+            outdir = Path(directory) / f"{data['load'][i]}{data['run_num'][i]:02}"
+            outdir.mkdir(parents=True, exist_ok=True)
+
+            s11 = np.column_stack(
+                [data["freq"][i], data["s11"][i].real, data["s11"][i].imag]
+            )
+            write_touchstone(outdir / f"{data['name'][i]}.s1p", s11)
+
+
+_store: Optional[S11Store] = None
+
+
+def get_store() -> Optional[S11Store]:
+    """Return the store to which S11 sweeps are currently appended, if any."""
+    return _store
+
+
+def set_store(store: Optional[S11Store]):
+    """Set the store to which S11 sweeps are appended, closing any other."""
+    global _store
+
+    if _store is not None and _store is not store:
+        _store.close()
+    _store = store
@@ -0,0 +1,300 @@
+"""An in-process temperature sampler, keeping its readings in a ring buffer."""
+import csv
+import datetime
+import logging
+import numpy as np
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+from .hal import get_clock, open_device
+from .temp_sensor_with_time_U6 import (
+    COLUMNS,
+    FIELDNAMES,
+    AdaptiveInterval,
+    check_reading,
+    take_reading,
+    to_row,
+)
+from .temperature_stats import TemperatureStats
+from .thermistor import Thermistor
+
+logger = logging.getLogger(__name__)
+
+# A reading of the temperature sensor: its (epoch) time, the values of the log, and
+# the time since the previous reading.
+READING_DTYPE = np.dtype(
+    [("timestamp", float)]
+    + [(n, float) for n in COLUMNS.values()]
+    + [("interval", float)]
+)
+
+
+class RingBuffer:
+    """A fixed-size, preallocated buffer of the most recent rows of a structured array.
+
+    Appending a row, and reading the latest, take constant time no matter how many rows
+    have been appended. Reads return copies, so they can be used while rows continue to
+    be appended from another thread.
+
+    Parameters
+    ----------
+    capacity
+        The maximum number of rows kept. Older rows are overwritten.
+    dtype
+        The (structured) dtype of the rows.
+    """
+
+    def __init__(self, capacity: int, dtype: np.dtype = READING_DTYPE):
+        self._data = np.zeros(capacity, dtype=dtype)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        """The maximum number of rows kept."""
+        return len(self._data)
+
+    @property
+    def total(self) -> int:
+        """The number of rows ever appended."""
+        return self._count
+
+    def __len__(self) -> int:
+        """The number of rows in the buffer."""
+        return min(self._count, self.capacity)
+
+    def append(self, row: tuple):
+        """Append a row, overwriting the oldest if the buffer is full."""
+        with self._lock:
+            self._data[self._count % self.capacity] = row
+            self._count += 1
+
+    def latest(self) -> Optional[np.void]:
+        """The most recent row, if any."""
+        with self._lock:
+            if not self._count:
+                return None
+            return self._data[(self._count - 1) % self.capacity].copy()
+
+    def since(self, value: float, field: str = "timestamp") -> np.ndarray:
+        """The rows whose (increasing) ``field`` is greater than ``value``, oldest
+        first."""
+        data = self.window()
+        return data[np.searchsorted(data[field], value, side="right") :]
+
+    def window(self, n: Optional[int] = None) -> np.ndarray:
+        """The most recent ``n`` rows (by default, all of them), oldest first."""
+        with self._lock:
+            n = len(self) if n is None else min(n, len(self))
+            start = (self._count - n) % self.capacity
+            if start + n <= self.capacity:
+                return self._data[start : start + n].copy()
+            return np.concatenate(
+                (self._data[start:], self._data[: start + n - self.capacity])
+            )
+
+
+class TemperatureSampler:
+    """Read the thermistors on a background thread, in the calibration process.
+
+    This is an alternative to running ``autocal temp-sensor`` in a separate process:
+    readings are kept in a :class:`RingBuffer`, from which the warmup reads them
+    directly, and are written to the temperature log by a second thread so that slow
+    disk writes never delay a reading.
+
+    Parameters
+    ----------
+    filename
+        The CSV file to which readings are written. None to not write them.
+    interval
+        Time (seconds) between readings.
+    resolution_index
+        The U6 resolution (oversampling) index.
+    capacity
+        The number of readings kept in memory.
+    thermistors
+        The thermistors. By default, those configured in ``~/.edges-autocal``.
+    connection
+        An open U6. By default, one is opened when the sampler starts.
+    adaptive
+        If given, the time between readings adapts to how fast temperatures change,
+        and ``interval`` is ignored.
+
+    Attributes
+    ----------
+    stats
+        Running statistics of the temperatures, updated with every reading.
+    error
+        The error that stopped the sampler by itself, if any. See :meth:`check`.
+    listeners
+        Functions called with every new reading (a record of :data:`READING_DTYPE`),
+        e.g. to publish it.
+    """
+
+    def __init__(
+        self,
+        filename: Optional[Union[str, Path]] = "Temperature.csv",
+        interval: float = 30.0,
+        resolution_index: int = 0,
+        capacity: int = 2**16,
+        thermistors: Optional[Dict[str, Thermistor]] = None,
+        connection=None,
+        adaptive: Optional[AdaptiveInterval] = None,
+    ):
+        self.filename = filename
+        self.interval = interval
+        self.resolution_index = resolution_index
+        self.thermistors = thermistors
+        self.connection = connection
+        self.adaptive = adaptive
+
+        self.buffer = RingBuffer(capacity)
+        self.stats = TemperatureStats()
+        self.listeners: List[Callable[[np.void], None]] = []
+        self.error: Optional[Exception] = None
+        self._rows = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = open_device("u6")
+
+    def start(self):
+        """Start taking readings."""
+        self._connect()
+
+        self._stop.clear()
+        self.error = None
+        self._threads = [threading.Thread(target=self._run, daemon=True)]
+        if self.filename is not None:
+            self._threads.append(threading.Thread(target=self._write, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop taking readings, once all of them have been written.
+
+        Does nothing if the sampler is not running.
+        """
+        if not self._threads:
+            return
+
+        self._stop.set()
+        sampler, *writer = self._threads
+        sampler.join()
+
+        # The sampler has put its last row, so the writer can stop after it.
+        self._rows.put(None)
+        for thread in writer:
+            thread.join()
+        self._threads = []
+
+    def __enter__(self):
+        """Start taking readings."""
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        """Stop taking readings."""
+        self.stop()
+
+    def check(self):
+        """Raise an error if the sampler has stopped taking readings by itself."""
+        if self.error is not None:
+            raise RuntimeError(
+                f"The temperature sampler stopped: {self.error}"
+            ) from self.error
+
+    def _run(self):
+        try:
+            self._sample()
+        except Exception as e:
+            logger.exception("The temperature sampler stopped")
+            self.error = e
+
+    def _sample(self):
+        clock = get_clock()
+        last_sample = np.nan
+        next_sample = clock.monotonic()
+        while not clock.wait(self._stop, next_sample - clock.monotonic()):
+            interval = (
+                self.interval if self.adaptive is None else self.adaptive.interval
+            )
+
+            now = clock.now()
+            t = clock.monotonic()
+            try:
+                reading = take_reading(
+                    self.connection, self.thermistors, self.resolution_index
+                )
+            except Exception:
+                logger.exception("Failed to read the thermistors")
+                reading = None
+
+            if reading is None:
+                next_sample += interval
+                continue
+
+            if self.adaptive is not None:
+                interval = self.adaptive.update(t, reading)
+            next_sample += interval
+
+            self._record(now, reading, t - last_sample)
+            last_sample = t
+            check_reading(reading)
+
+    def _record(
+        self, now: datetime.datetime, reading: Dict[str, float], interval: float
+    ):
+        record = np.array(
+            (now.timestamp(), *(reading[n] for n in COLUMNS.values()), interval),
+            dtype=READING_DTYPE,
+        )[()]
+        self.buffer.append(record)
+        self.stats.update(record["timestamp"], record)
+        if self.filename is not None:
+            self._rows.put(to_row(now, reading, interval))
+
+        for listener in self.listeners:
+            try:
+                listener(record)
+            except Exception:
+                logger.exception(f"Temperature listener {listener} failed")
+
+    def _write(self):
+        with open(self.filename, "w") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+            writer.writeheader()
+            csvfile.flush()
+
+            while True:
+                row = self._rows.get()
+                if row is None:
+                    break
+                writer.writerow(row)
+                csvfile.flush()
+                logger.info(row)
+
+    def readings(self, n: Optional[int] = None) -> np.ndarray:
+        """The most recent ``n`` readings (by default, all of those kept)."""
+        return self.buffer.window(n)
+
+
+_sampler: Optional[TemperatureSampler] = None
+
+
+def get_sampler() -> Optional[TemperatureSampler]:
+    """Return the in-process temperature sampler, if one is running."""
+    return _sampler
+
+
+def set_sampler(sampler: Optional[TemperatureSampler]):
+    """Set the in-process temperature sampler, stopping any other."""
+    global _sampler
+
+    if _sampler is not None and _sampler is not sampler:
+        _sampler.stop()
+    _sampler = sampler
@@ -0,0 +1,218 @@
+"""Detection of when the trace through the SP4T switch has settled after switching."""
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from .hal import get_clock
+from .vna import get_vna
+
+logger = logging.getLogger(__name__)
+
+
+class SettleDetector:
+    """Wait for the SP4T switch to settle by taking fast probe sweeps of the VNA.
+
+    After switching, un-averaged sweeps of a few points at a wide bandwidth are taken
+    until two consecutive traces agree to within the noise. The probes are swept on a
+    channel of their own (``channel``), so that the stimulus and user calibration of
+    channel 1, on which the S11 is measured, are never changed.
+
+    The noise of a probe is estimated by :meth:`calibrate` from repeated probes with
+    the switch left alone, from the second differences in time of consecutive probes
+    at each frequency. Unlike differences across frequency, these don't depend on the
+    shape of the trace, and a slow drift doesn't add to them. The time taken to settle
+    is recorded for each switch state, so that fixed waits can be set from data.
+
+    Parameters
+    ----------
+    points
+        The number of frequency points of each probe sweep.
+    bandwidth
+        The IF bandwidth (Hz) of each probe sweep.
+    threshold
+        The multiple of the noise (of the difference of two traces) within which
+        consecutive traces must agree.
+    max_probes
+        The maximum number of probe sweeps to take before giving up.
+    probe_timeout
+        Maximum time (seconds) to wait for each probe sweep.
+    channel
+        The VNA channel on which to sweep the probes. It must not be 1.
+    calibration_probes
+        The number of probes taken by :meth:`calibrate`.
+
+    Attributes
+    ----------
+    noise
+        The RMS noise of a single probe, or None until :meth:`calibrate` is run.
+    times
+        The settle times (seconds) observed for each switch state.
+    """
+
+    def __init__(
+        self,
+        points: int = 101,
+        bandwidth: float = 1000,
+        threshold: float = 1.5,
+        max_probes: int = 20,
+        probe_timeout: float = 5.0,
+        channel: int = 2,
+        calibration_probes: int = 5,
+    ):
+        if max_probes < 2:
+            raise ValueError("max_probes must be at least 2.")
+        if channel == 1:
+            raise ValueError("Probes can't be swept on channel 1, used for the S11.")
+        if calibration_probes < 3:
+            raise ValueError("calibration_probes must be at least 3.")
+
+        self.points = points
+        self.bandwidth = bandwidth
+        self.threshold = threshold
+        self.max_probes = max_probes
+        self.probe_timeout = probe_timeout
+        self.channel = channel
+        self.calibration_probes = calibration_probes
+        self.noise: Optional[float] = None
+        self.times: Dict[float, List[float]] = {}
+        self._split: Optional[str] = None
+
+    def _setup(self):
+        vna = get_vna()
+        ch = self.channel
+
+        # The probe channel must be displayed to be swept, and is the only one swept
+        # by a trigger. Channel 1 is not swept, so its traces are left alone. The
+        # display is put back as it was by _teardown.
+        if self._split is None:
+            self._split = vna.query("DISP:SPL?")
+        vna.set("DISP:SPL", "D12")
+        vna.set(f"CALC{ch}:PAR:COUN", 1)
+        vna.set(f"CALC{ch}:PAR1:DEF", "S11")
+        vna.set(f"SENS{ch}:FREQ:START", "40e6")
+        vna.set(f"SENS{ch}:FREQ:STOP", "200e6")
+        vna.set(f"SENS{ch}:SWE:POIN", self.points)
+        vna.set(f"SENS{ch}:BWID", self.bandwidth)
+        vna.set(f"SENS{ch}:AVER:STAT", "0")
+        vna.set("INIT:CONT", "OFF")
+        vna.set(f"INIT{ch}:CONT", "ON")
+        vna.set("TRIG:SOUR", "BUS")
+        vna.set("TRIG:AVER", "OFF")
+        vna.set("FORM:DATA", "REAL")
+        vna.set("FORM:BORD", "SWAP")
+
+    def _teardown(self):
+        # Stop the probe channel from being swept along with channel 1.
+        vna = get_vna()
+        vna.set(f"INIT{self.channel}:CONT", "OFF")
+        vna.set("TRIG:SOUR", "INT")
+        if self._split is not None:
+            vna.set("DISP:SPL", self._split)
+            self._split = None
+
+    def probe(self) -> np.ndarray:
+        """Take a single probe sweep, returning its complex (uncorrected) S11."""
+        self._setup()
+        vna = get_vna()
+        if not vna.trigger_and_wait(self.probe_timeout, poll_interval=0.05):
+            logger.warning(f"Probe sweep did not complete in {self.probe_timeout} s.")
+        return vna.query_binary(f"CALC{self.channel}:DATA:SDAT?", dtype="<c16")
+
+    def calibrate(self) -> float:
+        """Estimate the noise of a probe from repeated probes, returning it.
+
+        The switch should have been left alone for long enough to have settled.
+        """
+        probes = np.array([self.probe() for _ in range(self.calibration_probes)])
+        self._teardown()
+
+        # For white noise of variance s^2, second differences (in time) have variance
+        # 6s^2.
+        second = probes[2:] - 2 * probes[1:-1] + probes[:-2]
+        self.noise = float(np.sqrt(np.mean(np.abs(second) ** 2) / 6))
+        logger.info(f"Noise of the SP4T settle probes: {self.noise:.2e}")
+        return self.noise
+
+    def agree(self, previous: np.ndarray, current: np.ndarray) -> bool:
+        """Whether two consecutive traces agree to within the noise."""
+        # The difference of two traces has twice the variance of one.
+        diff = np.sqrt(np.mean(np.abs(current - previous) ** 2))
+        return diff <= self.threshold * np.sqrt(2) * self.noise
+
+    def wait(self, state: float) -> bool:
+        """Wait for the switch, just set to a state, to settle.
+
+        Parameters
+        ----------
+        state
+            The switch state (voltage), under which to record the settle time.
+
+        Returns
+        -------
+        bool
+            Whether the switch settled within ``max_probes`` probe sweeps.
+        """
+        if self.noise is None:
+            logger.warning(
+                "The settle detector was not calibrated while the switch was idle, "
+                "calibrating it now."
+            )
+            self.calibrate()
+
+        clock = get_clock()
+        start = clock.monotonic()
+
+        settled = False
+        previous, previous_time = None, None
+        for n in range(1, self.max_probes + 1):
+            probe_time = clock.monotonic() - start
+            current = self.probe()
+            if previous is not None and self.agree(previous, current):
+                settled = True
+                break
+            previous, previous_time = current, probe_time
+        self._teardown()
+
+        if not settled:
+            logger.warning(
+                f"SP4T state {state}V did not settle within {n} probe sweeps "
+                f"({clock.monotonic() - start:.2f} s)."
+            )
+            return False
+
+        # The trace was already settled at the first of the two probes that agree.
+        self.times.setdefault(state, []).append(previous_time)
+        logger.info(
+            f"SP4T state {state}V settled within {previous_time:.2f} s "
+            f"({n} probe sweeps)."
+        )
+        return True
+
+    def summary(self) -> Dict[float, Tuple[int, float, float]]:
+        """The number, median and maximum of the settle times of each state."""
+        return {
+            state: (len(times), float(np.median(times)), float(np.max(times)))
+            for state, times in self.times.items()
+        }
+
+    def log_summary(self):
+        """Log the settle times of each state."""
+        for state, (n, median, longest) in self.summary().items():
+            logger.info(
+                f"SP4T state {state}V settled in {median:.2f} s (median), "
+                f"{longest:.2f} s (max) over {n} switches."
+            )
+
+
+_detector: Optional[SettleDetector] = None
+
+
+def get_detector() -> Optional[SettleDetector]:
+    """Return the detector used to wait for the switch to settle, if any."""
+    return _detector
+
+
+def set_detector(detector: Optional[SettleDetector]):
+    """Set the detector used to wait for the switch to settle. None for fixed waits."""
+    global _detector
+    _detector = detector
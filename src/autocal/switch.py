@@ -0,0 +1,154 @@
+"""Control of the SP4T switch through the digital outputs of the U3."""
+import logging
+import u3
+from typing import Dict, Optional, Tuple
+
+from .hal import get_clock
+
+logger = logging.getLogger(__name__)
+
+# The FIO pins controlling the switch: three control lines and the (active-low) supply.
+LINES = (4, 5, 6)
+POWER = 7
+
+# The state of (FIO4, FIO5, FIO6, FIO7) for each switch voltage.
+SWITCH_STATES: Dict[float, Tuple[int, int, int, int]] = {
+    37: (1, 1, 1, 0),
+    34: (1, 1, 0, 0),
+    31.3: (1, 0, 1, 0),
+    28: (0, 1, 1, 0),
+    0: (1, 1, 1, 1),
+}
+
+
+class SwitchController:
+    """The SP4T switch, remembering the configuration and state of the U3 pins.
+
+    Every write is skipped if the pin is already known to be in the requested state, so
+    e.g. switching on a state right after a reset only switches the supply on. All
+    writes that are needed for a change of state go in as few USB transactions as
+    possible.
+
+    Parameters
+    ----------
+    device
+        The U3.
+    guard_time
+        Time (seconds) for the control lines to settle before the supply is switched
+        on.
+    """
+
+    def __init__(self, device, guard_time: float = 0.1):
+        self.device = device
+        self.guard_time = guard_time
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget the known configuration and state of the pins.
+
+        The next call of each method then writes everything it would need to.
+        """
+        self._analog = None
+        self._direction: Dict[int, int] = {}
+        self._state: Dict[int, int] = {}
+
+    @property
+    def voltage(self) -> Optional[float]:
+        """The voltage the switch is known to be set to, if any."""
+        state = tuple(self._state.get(pin) for pin in (*LINES, POWER))
+        for voltage, settings in SWITCH_STATES.items():
+            if settings == state:
+                return voltage
+        return None
+
+    def configure(self, configure_io: bool = True):
+        """Make the switch pins digital outputs.
+
+        Parameters
+        ----------
+        configure_io
+            Whether to also configure FIO0-3 as analog inputs and FIO4-7 as digital.
+        """
+        if configure_io and self._analog != 15:
+            self.device.configIO(FIOAnalog=15)
+            self._analog = 15
+            self._direction = {}
+
+        writes = [
+            u3.BitDirWrite(pin, 1)
+            for pin in (*LINES, POWER)
+            if self._direction.get(pin) != 1
+        ]
+        if writes:
+            self.device.getFeedback(*writes)
+            self._direction.update({pin: 1 for pin in (*LINES, POWER)})
+
+    def _writes(self, pins, states, force=False):
+        return [
+            u3.BitStateWrite(pin, state)
+            for pin, state in zip(pins, states)
+            if force or self._state.get(pin) != state
+        ]
+
+    def switch_to(self, voltage: float, force: bool = False):
+        """Set the switch to the state of a given voltage.
+
+        Parameters
+        ----------
+        voltage
+            The voltage, one of the keys of :data:`SWITCH_STATES`. Zero switches the
+            supply off.
+        force
+            Whether to write every pin, even those already known to be in the state.
+        """
+        try:
+            settings = SWITCH_STATES[voltage]
+        except KeyError:
+            raise ValueError(f"Voltage {voltage} not understood.")
+
+        lines = self._writes(LINES, settings[:3], force)
+        power = self._writes([POWER], settings[3:], force)
+
+        if settings[3]:
+            # Switching off needs no settling: do it before changing the lines.
+            writes = power + lines
+            if writes:
+                self.device.getFeedback(*writes)
+        elif lines and power and self.guard_time:
+            self.device.getFeedback(*lines)
+            get_clock().sleep(self.guard_time)
+            self.device.getFeedback(*power)
+        elif lines or power:
+            self.device.getFeedback(*lines, *power)
+
+        self._state.update(zip((*LINES, POWER), settings))
+
+    def power_off(self, force: bool = False):
+        """Switch the supply off, leaving the control lines as they are."""
+        writes = self._writes([POWER], [1], force)
+        if writes:
+            self.device.getFeedback(*writes)
+        self._state[POWER] = 1
+
+
+_switch: Optional[SwitchController] = None
+
+
+def get_switch() -> SwitchController:
+    """Return the shared switch controller, by default that of the configured U3."""
+    global _switch
+
+    if _switch is None:
+        from .config import config
+
+        # Opening the U3 (on first use) sets the switch of the config.
+        device = config.u3io
+        if _switch is None:
+            _switch = SwitchController(device, guard_time=config.switch_guard_time)
+    return _switch
+
+
+def set_switch(switch: Optional[SwitchController]):
+    """Set the shared switch controller, e.g. to one of another (or a mock) U3."""
+    global _switch
+    _switch = switch
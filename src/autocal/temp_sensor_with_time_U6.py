@@ -3,145 +3,259 @@
 import csv
 import datetime
 import logging
-import math
-import time
+import numpy as np
 import u6
+from typing import Dict, Optional, Sequence
+
+from .config import config
+from .hal import get_clock, open_device
+from .temperature_stats import TemperatureStats
+from .thermistor import THERMISTORS, Thermistor, convert
 
 logger = logging.getLogger(__name__)
 
-ABS_ZERO = 273.15
+# Analog input channel of each thermistor, and of the excitation voltage (vs).
+CHANNELS = {"lna": 3, "sp4t": 0, "load": 1, "room": 8, "vs": 2}
 
 
-def temp_sensor(filename="Temperature.csv"):
-    """Measure thermistor temperature."""
-    connection = u6.U6()
+def read_voltages(
+    connection: u6.U6, resolution_index: int = 0, settling_factor: int = 0
+) -> Dict[str, float]:
+    """Read the voltages of all the thermistor channels in one USB transaction.
 
-    with open(filename, "w") as csvfile:
-        fieldnames = [
-            "Date",
-            "Time",
-            "LNA Voltage",
-            "LNA Thermistor (Ohm)",
-            "LNA (C)",
-            "SP4T Voltage",
-            "SP4T Thermistor (Ohm)",
-            "SP4T (C)",
-            "Load Voltage",
-            "Load-thermistor (Ohm)",
-            "Load (C)",
-            "Room_Temp(C)",
+    Parameters
+    ----------
+    connection
+        The U6.
+    resolution_index
+        The U6 resolution index, which sets the amount of oversampling. 0 is the
+        default, 1-8 use the high-speed ADC and 9-12 the high-resolution ADC
+        (U6-Pro only).
+    settling_factor
+        The U6 settling factor, 0 being automatic.
+
+    Returns
+    -------
+    dict
+        The voltage of each channel in :data:`CHANNELS`.
+    """
+    results = connection.getFeedback(
+        *[
+            u6.AIN24AR(channel, resolution_index, 0, settling_factor)
+            for channel in CHANNELS.values()
         ]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    )
+    return {
+        name: connection.binaryToCalibratedAnalogVoltage(
+            result["GainIndex"], result["AIN"], resolutionIndex=resolution_index
+        )
+        for name, result in zip(CHANNELS, results)
+    }
+
+
+# The columns of the temperature log (after the date and time), and the name of each
+# in the array read from it by :meth:`edges_io.io.Resistance.read_csv`.
+COLUMNS = {
+    "LNA Voltage": "lna_voltage",
+    "LNA Thermistor (Ohm)": "lna_resistance",
+    "LNA (C)": "lna_temp",
+    "SP4T Voltage": "sp4t_voltage",
+    "SP4T Thermistor (Ohm)": "sp4t_resistance",
+    "SP4T (C)": "sp4t_temp",
+    "Load Voltage": "load_voltage",
+    "Load-thermistor (Ohm)": "load_resistance",
+    "Load (C)": "load_temp",
+    "Room_Temp(C)": "room_temp",
+}
+# The log also records the time since the previous row, as the interval can vary.
+FIELDNAMES = ["Date", "Time", *COLUMNS, "Interval (s)"]
+
+
+def take_reading(
+    connection: u6.U6,
+    thermistors: Optional[Dict[str, Thermistor]] = None,
+    resolution_index: int = 0,
+) -> Optional[Dict[str, float]]:
+    """Take a reading of all the thermistors.
+
+    Parameters
+    ----------
+    connection
+        The U6.
+    thermistors
+        The thermistors. By default, those configured in ``~/.edges-autocal``.
+    resolution_index
+        The U6 resolution (oversampling) index, see :func:`read_voltages`.
+
+    Returns
+    -------
+    dict or None
+        The voltages, resistances and temperatures, keyed by the names in
+        :data:`COLUMNS`. None if any of the voltages could not be converted.
+    """
+    if thermistors is None:
+        thermistors = THERMISTORS if config is None else config.thermistors
+
+    # TODO: should we be using internal temperature? (i.e. connection.getTemperature)?
+    voltages = read_voltages(connection, resolution_index=resolution_index)
+    vs = voltages["vs"]  # the excitation voltage of the dividers
+    res, temp = convert({name: voltages[name] for name in thermistors}, vs, thermistors)
+
+    if np.isnan(list(temp.values())).any():
+        logger.warning(f"Skipping reading with invalid voltages: {voltages}")
+        return None
+
+    reading = {}
+    for name in ["lna", "sp4t", "load"]:
+        reading[f"{name}_voltage"] = voltages[name]
+        reading[f"{name}_resistance"] = float(res[name])
+        reading[f"{name}_temp"] = float(temp[name])
+    reading["room_temp"] = float(temp["room"])
+    return reading
+
+
+def to_row(
+    now: datetime.datetime, reading: Dict[str, float], interval: float = np.nan
+) -> Dict[str, str]:
+    """Make a row of the temperature log from a reading taken at some time.
+
+    ``interval`` is the time (seconds) since the previous reading.
+    """
+    row = {"Date": now.strftime("%m/%d/%Y"), "Time": now.strftime("%H:%M:%S")}
+    row.update({column: reading[name] for column, name in COLUMNS.items()})
+    row["Interval (s)"] = round(interval, 3)
+    return row
+
+
+class AdaptiveInterval:
+    """An interval between readings that adapts to how fast temperatures change.
+
+    A channel is changing when the least-squares slope of its last ``window`` readings
+    is both faster than ``threshold`` and significant, at ``significance`` standard
+    errors, given the scatter of those readings about the fitted line. The jitter of
+    single readings (about 0.1 C for the SP4T thermistor) therefore does not count as
+    change. While any of ``channels`` is changing, or fewer than ``window`` readings
+    have been taken, readings are taken every ``min_interval``. Otherwise, the interval
+    is doubled after each reading, up to ``max_interval``.
+
+    Parameters
+    ----------
+    min_interval
+        The shortest time (seconds) between readings.
+    max_interval
+        The longest time (seconds) between readings.
+    threshold
+        The rate of change of temperature (C per minute) above which readings are taken
+        at the shortest interval.
+    channels
+        The temperatures (fields of the readings) whose changes set the interval.
+    window
+        The number of most recent readings over which the rate of change is fit.
+    significance
+        The number of standard errors by which the rate of change must differ from
+        zero to count.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 5.0,
+        max_interval: float = 120.0,
+        threshold: float = 0.1,
+        channels: Sequence[str] = ("sp4t_temp", "load_temp"),
+        window: int = 6,
+        significance: float = 3.0,
+    ):
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("Need 0 < min_interval <= max_interval.")
+        if window < 3:
+            raise ValueError("window must be at least 3.")
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.threshold = threshold
+        self.significance = significance
+        self.stats = TemperatureStats(channels, window=window)
+        self.interval = min_interval
+
+    def changing(self) -> Dict[str, float]:
+        """The rate of change (C per minute) of each channel that is changing."""
+        rates = {}
+        for channel, stats in self.stats.channels.items():
+            if not stats.full:
+                rates[channel] = np.nan
+            elif (
+                abs(stats.slope) * 60 > self.threshold
+                and abs(stats.slope) > self.significance * stats.slope_error
+            ):
+                rates[channel] = stats.slope * 60
+        return rates
+
+    def update(self, t: float, reading: Dict[str, float]) -> float:
+        """Update with a reading taken at (monotonic) time ``t``, returning the interval
+        until the next reading."""
+        self.stats.update(t, reading)
+
+        if self.changing():
+            self.interval = self.min_interval
+        else:
+            self.interval = min(2 * self.interval, self.max_interval)
+        return self.interval
+
+
+def check_reading(reading: Dict[str, float]):
+    """Log some warnings if things seem bad."""
+    if not 23.0 < reading["room_temp"] < 25.0:
+        logger.warning("Room Temperature is not between 23C and 25C!")
+
+
+def temp_sensor(
+    filename="Temperature.csv",
+    interval: float = 30.0,
+    resolution_index: int = 0,
+    adaptive: Optional[AdaptiveInterval] = None,
+):
+    """Measure thermistor temperature.
+
+    Parameters
+    ----------
+    filename
+        The CSV file to which to write the temperatures.
+    interval
+        Time (seconds) between samples.
+    resolution_index
+        The U6 resolution (oversampling) index, see :func:`read_voltages`.
+    adaptive
+        If given, the time between samples adapts to how fast temperatures change,
+        and ``interval`` is ignored.
+    """
+    connection = open_device("u6")
+    thermistors = THERMISTORS if config is None else config.thermistors
+    clock = get_clock()
+
+    with open(filename, "w") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
         writer.writeheader()
 
+        last_sample = np.nan
+        next_sample = clock.monotonic()
         while True:
-            now = datetime.datetime.now()
-            date = now.strftime("%m/%d/%Y")
-            times = now.strftime("%H:%M:%S")
-            # TODO: should we be using internal temperature? (i.e. connection.getTemperature)?
-
-            # -----------------------------------------------------------------------------------
-            # Read Labjack Voltage
-            # -----------------------------------------------------------------------------------
-            lna_voltage = connection.getAIN(3)
-            time.sleep(0.5)
-            sp4t_voltage = connection.getAIN(0)
-            time.sleep(0.5)
-            load_voltage = connection.getAIN(1)
-            time.sleep(0.5)
-            ambient_room_voltage = connection.getAIN(
-                8
-            )  # ambient room temperature sensor
-            time.sleep(0.5)
-            vs = connection.getAIN(2)  # measure the Vs (V) of labjack
-            time.sleep(0.5)
-            # -----------------------------------------------------------------------------------
-            # Calculate the resistence from voltage
-            # -----------------------------------------------------------------------------------
-            lna_resistance = (lna_voltage * 9918) / (vs - lna_voltage)
-            sp4t_resistance = (sp4t_voltage * 9960) / (vs - sp4t_voltage)
-            load_resistance = (load_voltage * 9923) / (vs - load_voltage)
-            ambient_resistance = (ambient_room_voltage * 3251) / (
-                vs - ambient_room_voltage
-            )
-            # -----------------------------------------------------------------------------------
-            # Calculate the temperature with curve fitting
-            # -----------------------------------------------------------------------------------
-            f = (
-                0.129675e-2,
-                0.197374e-3,
-                0.304e-6,
-                1.03514e-3,
-                2.33825e-4,
-                7.92467e-8,
-                0.1408390910882e-2,
-                0.22774732e-3,
-                9.87803e-7,
-                6.704665177e-8,
-            )
-
-            try:  # Hello leroy Fixes the value error causing a crash
-                lna_deg_cels = (
-                    1
-                    / (
-                        f[0]
-                        + f[1] * math.log(lna_resistance)
-                        + f[2] * math.pow(math.log(lna_resistance), 3)
-                    )
-                    - ABS_ZERO
-                )
-                sp4t_deg_cels = (
-                    1
-                    / (
-                        f[0]
-                        + f[1] * math.log(sp4t_resistance)
-                        + f[2] * math.pow(math.log(sp4t_resistance), 3)
-                    )
-                    - ABS_ZERO
-                )
-                load_deg_cels = (
-                    1
-                    / (
-                        f[3]
-                        + f[4] * math.log(load_resistance)
-                        + f[5] * math.pow(math.log(load_resistance), 3)
-                    )
-                    - ABS_ZERO
-                )
-                ambient_room_deg_cels = (
-                    1
-                    / (
-                        f[6]
-                        + f[7] * math.log(ambient_resistance)
-                        + f[8] * math.pow(math.log(ambient_resistance), 2)
-                        + f[9] * math.pow(math.log(ambient_resistance), 3)
-                    )
-                    - ABS_ZERO
-                )
-
-            except ValueError:
+            clock.sleep(next_sample - clock.monotonic())
+
+            now = clock.now()
+            t = clock.monotonic()
+            reading = take_reading(connection, thermistors, resolution_index)
+            if reading is None:
+                next_sample += interval if adaptive is None else adaptive.interval
                 continue
 
-            time.sleep(28)
-
-            row = {
-                "Date": date,
-                "Time": times,
-                "LNA Voltage": lna_voltage,
-                "LNA Thermistor (Ohm)": lna_resistance,
-                "LNA (C)": lna_deg_cels,
-                "SP4T Voltage": sp4t_voltage,
-                "SP4T Thermistor (Ohm)": sp4t_resistance,
-                "SP4T (C)": sp4t_deg_cels,
-                "Load Voltage": load_voltage,
-                "Load-thermistor (Ohm)": load_resistance,
-                "Load (C)": load_deg_cels,
-                "Room_Temp(C)": ambient_room_deg_cels,
-            }
+            if adaptive is not None:
+                interval = adaptive.update(t, reading)
+            next_sample += interval
+
+            row = to_row(now, reading, t - last_sample)
+            last_sample = t
             writer.writerow(row)
             csvfile.flush()
             logger.info(row)
 
-            # Some warnings if things seem bad.
-            if not 23.0 < ambient_room_deg_cels < 25.0:
-                logger.warning("Room Temperature is not between 23C and 25C!")
+            check_reading(reading)
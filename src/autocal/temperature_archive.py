@@ -0,0 +1,244 @@
+"""A binary archive of temperature readings, rotated across HDF5 files."""
+import csv
+import datetime
+import h5py
+import logging
+import numpy as np
+import threading
+from pathlib import Path
+from typing import List, Optional, Union
+
+from .hal import get_clock
+from .sampler import READING_DTYPE
+from .temp_sensor_with_time_U6 import COLUMNS, FIELDNAMES, to_row
+
+logger = logging.getLogger(__name__)
+
+
+class TemperatureArchive:
+    """An append-only archive of temperature readings in a directory of HDF5 files.
+
+    Readings are appended, with their epoch timestamps, raw voltages and derived
+    resistances and temperatures, to a chunked, compressed dataset in the current file.
+    A new file is started once the current one is too large or too old, so that
+    multi-day runs never make a single file unwieldy. Since readings are in time
+    order, any time range can be read back by only opening the files that overlap it.
+
+    Readings are buffered and written a chunk at a time, to a dataset that grows a
+    chunk at a time, with the number of readings in it kept in its ``length``
+    attribute. They are also written and flushed to the file every ``flush_interval``,
+    so that at most that much of the readings is lost if the process dies. The dataset
+    is trimmed to its readings when the file is closed or rotated.
+
+    Parameters
+    ----------
+    directory
+        The directory of the archive. It is created if it doesn't exist.
+    max_bytes
+        The size (bytes) above which a new file is started.
+    max_age
+        The time (seconds) after its first reading after which a new file is started.
+    chunk_size
+        The number of readings in each chunk.
+    flush_interval
+        The time (seconds) after which buffered readings are written and flushed.
+
+    Examples
+    --------
+    Archive the readings of a sampler as they are taken:
+
+    >>> sampler.listeners.append(TemperatureArchive("temperatures").append)
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        max_bytes: int = 64 * 2**20,
+        max_age: float = 24 * 60 * 60,
+        chunk_size: int = 256,
+        flush_interval: float = 60.0,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._length = 0
+        self._buffer = np.zeros(chunk_size, dtype=READING_DTYPE)
+        self._buffered = 0
+        self._started = None
+        self._flushed = None
+
+    @property
+    def files(self) -> List[Path]:
+        """The files of the archive, oldest first."""
+        return sorted(self.directory.glob("temperature_*.h5"))
+
+    def close(self):
+        """Close the current file."""
+        with self._lock:
+            if self._file is not None:
+                self._close_file()
+
+    def __enter__(self):
+        """Use the archive."""
+        return self
+
+    def __exit__(self, *exc):
+        """Close the archive."""
+        self.close()
+
+    def _write(self):
+        if not self._buffered:
+            return
+
+        dset = self._file["readings"]
+        end = self._length + self._buffered
+        if end > len(dset):
+            dset.resize(-(-end // self.chunk_size) * self.chunk_size, axis=0)
+        dset[self._length : end] = self._buffer[: self._buffered]
+        dset.attrs["length"] = self._length = end
+        self._buffered = 0
+
+    def _flush(self):
+        self._write()
+        self._file.flush()
+        self._flushed = get_clock().monotonic()
+
+    def _close_file(self):
+        self._write()
+        self._file["readings"].resize(self._length, axis=0)
+        self._file.close()
+        self._file = None
+
+    def _rotate(self, timestamp: float):
+        if self._file is not None:
+            self._close_file()
+
+        start = datetime.datetime.fromtimestamp(timestamp)
+        path = self.directory / f"temperature_{start.strftime('%Y_%j_%H_%M_%S')}.h5"
+        logger.info(f"Archiving temperatures to {path}")
+
+        self._file = h5py.File(path, "a")
+        if "readings" not in self._file:
+            dset = self._file.create_dataset(
+                "readings",
+                shape=(0,),
+                maxshape=(None,),
+                dtype=READING_DTYPE,
+                chunks=(self.chunk_size,),
+                compression="gzip",
+                shuffle=True,
+            )
+            dset.attrs["length"] = 0
+        self._length = _length(self._file["readings"])
+        self._started = self._flushed = get_clock().monotonic()
+
+    def _full(self) -> bool:
+        return (
+            self._file.id.get_filesize() >= self.max_bytes
+            or get_clock().monotonic() - self._started >= self.max_age
+        )
+
+    def append(self, record: np.void):
+        """Append a reading (a record of :data:`~autocal.sampler.READING_DTYPE`)."""
+        with self._lock:
+            if self._file is None or self._full():
+                self._rotate(record["timestamp"])
+
+            self._buffer[self._buffered] = record
+            self._buffered += 1
+            if (
+                self._buffered == self.chunk_size
+                or get_clock().monotonic() - self._flushed >= self.flush_interval
+            ):
+                self._flush()
+
+    def read(
+        self, start: Optional[float] = None, stop: Optional[float] = None
+    ) -> np.ndarray:
+        """Read the readings taken in a range of (epoch) time.
+
+        Parameters
+        ----------
+        start
+            The earliest time to read. By default, the start of the archive.
+        stop
+            The time up to which to read. By default, the end of the archive.
+        """
+        start = -np.inf if start is None else start
+        stop = np.inf if stop is None else stop
+
+        out = []
+        with self._lock:
+            files = self.files
+            for i, path in enumerate(files):
+                # Files are named by the time (to the second) of their first reading,
+                # so a file can be skipped if the next one starts before ``start``.
+                if i + 1 < len(files) and _first_time(files[i + 1]) + 1 <= start:
+                    continue
+                if _first_time(path) >= stop:
+                    break
+
+                if self._file is not None and Path(self._file.filename) == path:
+                    self._write()
+                    dset = self._file["readings"]
+                    out.append(_slice(dset, start, stop, self._length))
+                else:
+                    with h5py.File(path, "r") as fl:
+                        out.append(_slice(fl["readings"], start, stop))
+
+        return np.concatenate(out) if out else np.zeros(0, dtype=READING_DTYPE)
+
+    def export_csv(
+        self,
+        path: Union[str, Path],
+        start: Optional[float] = None,
+        stop: Optional[float] = None,
+    ) -> int:
+        """Export the readings taken in a range of time as a temperature log.
+
+        The log has the same format as that written by ``autocal temp-sensor``, so it
+        can be read by :meth:`edges_io.io.Resistance.read_csv`.
+
+        Returns
+        -------
+        int
+            The number of readings exported.
+        """
+        data = self.read(start, stop)
+        with open(path, "w") as fl:
+            writer = csv.DictWriter(fl, fieldnames=FIELDNAMES)
+            writer.writeheader()
+            for record in data:
+                writer.writerow(
+                    to_row(
+                        datetime.datetime.fromtimestamp(record["timestamp"]),
+                        {name: record[name] for name in COLUMNS.values()},
+                        record["interval"],
+                    )
+                )
+        return len(data)
+
+
+def _first_time(path: Path) -> float:
+    return datetime.datetime.strptime(
+        path.stem, "temperature_%Y_%j_%H_%M_%S"
+    ).timestamp()
+
+
+def _length(dset: h5py.Dataset) -> int:
+    # Files that were not closed cleanly may have unused rows at the end.
+    return int(dset.attrs.get("length", len(dset)))
+
+
+def _slice(
+    dset: h5py.Dataset, start: float, stop: float, length: Optional[int] = None
+) -> np.ndarray:
+    length = _length(dset) if length is None else length
+    times = dset.fields("timestamp")[:length]
+    return dset[np.searchsorted(times, start) : np.searchsorted(times, stop)]
@@ -0,0 +1,134 @@
+"""Incremental reading of the temperature log while it is being written."""
+import datetime
+import io
+import logging
+import numpy as np
+import os
+import threading
+from pathlib import Path
+from typing import Union
+
+from .temp_sensor_with_time_U6 import COLUMNS
+from .temperature_stats import TemperatureStats
+
+logger = logging.getLogger(__name__)
+
+# The dtype of the log, as read by :meth:`edges_io.io.Resistance.read_csv`.
+LOG_DTYPE = np.dtype(
+    [("date", "S10"), ("time", "S8")] + [(name, float) for name in COLUMNS.values()]
+)
+
+
+class TemperatureLog:
+    """The rows of a temperature log, read incrementally as the log grows.
+
+    Each :meth:`update` reads only the bytes appended to the file since the last one,
+    and parses only the complete rows among them into a growing in-memory array. A row
+    that is only partially written is kept back until the rest of it arrives. If the
+    file is replaced or truncated (e.g. by a new temperature sensor), it is read again
+    from the start.
+
+    Parameters
+    ----------
+    path
+        The temperature log, as written by ``autocal temp-sensor``.
+    capacity
+        The number of rows for which space is initially allocated. It is doubled
+        whenever it runs out.
+
+    Attributes
+    ----------
+    stats
+        Running statistics of the temperatures, updated with every new row.
+    """
+
+    def __init__(self, path: Union[str, Path] = "Temperature.csv", capacity=1024):
+        self.path = Path(path)
+        self._data = np.zeros(capacity, dtype=LOG_DTYPE)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.stats = TemperatureStats()
+        self._n = 0
+        self._offset = 0
+        self._partial = b""
+        self._header = True
+        self._inode = None
+
+    def __len__(self) -> int:
+        """The number of rows read so far."""
+        return self._n
+
+    @property
+    def data(self) -> np.ndarray:
+        """The rows read so far (a read-only view)."""
+        out = self._data[: self._n]
+        out.flags.writeable = False
+        return out
+
+    def __getitem__(self, key):
+        """Get a column (or rows) of the log."""
+        return self.data[key]
+
+    def _append(self, rows: np.ndarray):
+        if self._n + len(rows) > len(self._data):
+            new = np.zeros(
+                max(2 * len(self._data), self._n + len(rows)), dtype=LOG_DTYPE
+            )
+            new[: self._n] = self._data[: self._n]
+            self._data = new
+
+        self._data[self._n : self._n + len(rows)] = rows
+        self._n += len(rows)
+
+    def update(self) -> int:
+        """Read any rows appended to the log since the last update.
+
+        Returns
+        -------
+        int
+            The number of new rows.
+        """
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return 0
+
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                if self._inode is not None:
+                    logger.info(f"{self.path} was replaced, reading it again.")
+                self._reset()
+                self._inode = stat.st_ino
+
+            if stat.st_size == self._offset:
+                return 0
+
+            with open(self.path, "rb") as fl:
+                fl.seek(self._offset)
+                new = fl.read()
+            self._offset += len(new)
+
+            # Only parse up to the last complete line.
+            new = self._partial + new
+            end = new.rfind(b"\n") + 1
+            new, self._partial = new[:end], new[end:]
+
+            if self._header and new:
+                new = new[new.find(b"\n") + 1 :]
+                self._header = False
+            if not new.strip():
+                return 0
+
+            rows = np.atleast_1d(
+                np.genfromtxt(io.BytesIO(new), delimiter=",", dtype=LOG_DTYPE)
+            )
+            self._append(rows)
+            for row in rows:
+                when = datetime.datetime.strptime(
+                    f"{row['date'].decode()} {row['time'].decode()}",
+                    "%m/%d/%Y %H:%M:%S",
+                )
+                self.stats.update(when.timestamp(), row)
+            return len(rows)
@@ -0,0 +1,361 @@
+"""Publish temperature readings to any number of local subscribers over a UNIX socket.
+
+The protocol is line-based JSON. A client sends a single request line::
+
+    {"subscribe": true, "since": 1650000000.0}
+
+and receives, one per line, every reading kept by the server that was taken after
+``since`` (all of them if it is null or missing), as a JSON object with the fields of
+:data:`~autocal.sampler.READING_DTYPE`. If ``subscribe`` is true, new readings are then
+sent as they are taken until the client disconnects; otherwise the server closes the
+connection after the replay.
+"""
+import datetime
+import json
+import logging
+import numpy as np
+import os
+import queue
+import socket
+import socketserver
+import stat
+import tempfile
+import threading
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+from .sampler import READING_DTYPE, TemperatureSampler
+from .temp_sensor_with_time_U6 import COLUMNS
+from .temperature_archive import TemperatureArchive
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = Path(tempfile.gettempdir()) / "autocal-temperature.sock"
+
+# The daemon's own log. It is not a *.csv, which ``autocal run`` collects or removes
+# from its working directory: the Temperature.csv there is written by the run's own
+# sampler or subscriber.
+DAEMON_FILENAME = "temperature-daemon.log"
+
+
+def _encode(record: np.void) -> bytes:
+    return (
+        json.dumps({k: float(record[k]) for k in READING_DTYPE.names}).encode() + b"\n"
+    )
+
+
+def _decode(line: bytes) -> np.void:
+    values = json.loads(line)
+    return np.array(tuple(values[k] for k in READING_DTYPE.names), READING_DTYPE)[()]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server: TemperatureServer = self.server.publisher
+        request = json.loads(self.rfile.readline() or b"{}")
+
+        since = request.get("since")
+        subscribe = request.get("subscribe", False)
+
+        # Register before replaying, so that no reading falls between the two. Any
+        # reading that is in both is skipped when it comes off the queue.
+        if subscribe:
+            readings = server._subscribe()
+
+        try:
+            last = -np.inf if since is None else since
+            for record in server.sampler.buffer.since(last):
+                self.wfile.write(_encode(record))
+                last = record["timestamp"]
+
+            while subscribe:
+                record = readings.get()
+                if record is None:
+                    break
+                if record["timestamp"] > last:
+                    self.wfile.write(_encode(record))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            if subscribe:
+                server._unsubscribe(readings)
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def _remove_stale_socket(path: Path):
+    """Remove a socket left behind by a server that is no longer running, if any.
+
+    Raises :class:`FileExistsError` if there is anything else at the path, or if a
+    server is still listening on it.
+    """
+    try:
+        mode = path.stat().st_mode
+    except FileNotFoundError:
+        return
+
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket.")
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(os.fspath(path))
+        except ConnectionRefusedError:
+            logger.info(f"Removing the stale socket {path}")
+            path.unlink()
+            return
+
+    raise FileExistsError(f"A temperature server is already running on {path}.")
+
+
+class TemperatureServer:
+    """Publish the readings of a :class:`~autocal.sampler.TemperatureSampler`.
+
+    Parameters
+    ----------
+    sampler
+        The sampler whose readings are published. Its ring buffer is used for replays.
+    path
+        The UNIX socket on which to listen. A socket left behind by a server that has
+        stopped is replaced, but :class:`FileExistsError` is raised if a server is
+        still listening on it, or if something other than a socket is there.
+    max_pending
+        The number of readings that may be waiting to be sent to a subscriber. A
+        subscriber that falls further behind is disconnected.
+    """
+
+    def __init__(
+        self,
+        sampler: TemperatureSampler,
+        path: Union[str, Path] = DEFAULT_SOCKET,
+        max_pending: int = 1024,
+    ):
+        self.sampler = sampler
+        self.path = Path(path)
+        self.max_pending = max_pending
+
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+        _remove_stale_socket(self.path)
+        self._server = _Server(str(self.path), _Handler)
+        self._server.publisher = self
+        self._thread = None
+
+        sampler.listeners.append(self.publish)
+
+    def _subscribe(self) -> queue.Queue:
+        readings = queue.Queue(maxsize=self.max_pending)
+        with self._lock:
+            self._subscribers.add(readings)
+        return readings
+
+    def _unsubscribe(self, readings: queue.Queue):
+        with self._lock:
+            self._subscribers.discard(readings)
+
+    def publish(self, record: np.void):
+        """Send a reading to all subscribers."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for readings in subscribers:
+            try:
+                readings.put_nowait(record)
+            except queue.Full:
+                logger.warning(
+                    "Disconnecting a temperature subscriber that fell behind"
+                )
+                self._unsubscribe(readings)
+                with readings.mutex:
+                    readings.queue.clear()
+                readings.put_nowait(None)
+
+    def start(self):
+        """Start serving in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Publishing temperatures on {self.path}")
+
+    def serve_forever(self):
+        """Serve in the current thread, until interrupted."""
+        logger.info(f"Publishing temperatures on {self.path}")
+        self._server.serve_forever()
+
+    def stop(self):
+        """Stop serving, and disconnect all subscribers."""
+        self.sampler.listeners.remove(self.publish)
+        self._server.shutdown()
+
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, set()
+        for readings in subscribers:
+            readings.put(None)
+
+        self._server.server_close()
+        if self.path.exists():
+            self.path.unlink()
+
+    def __enter__(self):
+        """Start serving in a background thread."""
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        """Stop serving."""
+        self.stop()
+
+
+def _open(
+    path: Union[str, Path], since: Optional[float], subscribe: bool, timeout=None
+) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.connect(os.fspath(path))
+    sock.sendall(json.dumps({"since": since, "subscribe": subscribe}).encode() + b"\n")
+    return sock
+
+
+def request(
+    path: Union[str, Path] = DEFAULT_SOCKET,
+    since: Optional[float] = None,
+    subscribe: bool = False,
+    timeout: Optional[float] = None,
+) -> Iterator[np.void]:
+    """Request readings from a :class:`TemperatureServer`.
+
+    Parameters
+    ----------
+    path
+        The UNIX socket of the server.
+    since
+        Only get readings taken after this (epoch) time. By default, all those kept.
+    subscribe
+        Whether to keep getting new readings as they are taken.
+    timeout
+        Timeout (seconds) of each read from the socket. :class:`socket.timeout` is
+        raised if it expires.
+
+    Yields
+    ------
+    record
+        Each reading, as a record of :data:`~autocal.sampler.READING_DTYPE`.
+    """
+    with _open(path, since, subscribe, timeout) as sock, sock.makefile("rb") as fl:
+        for line in fl:
+            yield _decode(line)
+
+
+class TemperatureSubscriber(TemperatureSampler):
+    """A sampler that gets its readings from a :class:`TemperatureServer`.
+
+    It can be used wherever a :class:`~autocal.sampler.TemperatureSampler` is, e.g. to
+    follow the temperatures of a daemon (``autocal temp-sensor --socket``) from a
+    calibration, writing them to that calibration's own temperature log.
+
+    Starting it raises :class:`ConnectionError` if the server can't be reached. If the
+    server stops later, so does the subscriber, and
+    :meth:`~autocal.sampler.TemperatureSampler.check` then raises.
+
+    Parameters
+    ----------
+    path
+        The UNIX socket of the server.
+    since
+        Replay readings taken after this (epoch) time. By default, only new readings
+        are received.
+
+    Other Parameters
+    ----------------
+    All other parameters are passed to :class:`~autocal.sampler.TemperatureSampler`.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = DEFAULT_SOCKET,
+        since: Optional[float] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.path = Path(path)
+        self.since = since
+
+    def _connect(self):
+        if self.since is None:
+            self.since = datetime.datetime.now().timestamp()
+
+        # Connect here, rather than on the sampling thread, so that starting fails if
+        # there is no server. Wake up every second to check whether the sampler has
+        # been stopped.
+        try:
+            self._sock = _open(self.path, self.since, True, timeout=1.0)
+        except OSError as e:
+            raise ConnectionError(
+                f"Could not connect to the temperature server at {self.path}: {e}"
+            ) from e
+
+    def _sample(self):
+        with self._sock as sock:
+            pending = b""
+            while not self._stop.is_set():
+                try:
+                    data = sock.recv(65536)
+                except socket.timeout:
+                    continue
+
+                if not data:
+                    raise ConnectionError(
+                        f"The temperature server at {self.path} stopped"
+                    )
+
+                *lines, pending = (pending + data).split(b"\n")
+                for line in lines:
+                    record = _decode(line)
+                    self._record(
+                        datetime.datetime.fromtimestamp(record["timestamp"]),
+                        {name: record[name] for name in COLUMNS.values()},
+                        record["interval"],
+                    )
+
+
+def serve(
+    path: Optional[Union[str, Path]] = DEFAULT_SOCKET,
+    archive: Optional[TemperatureArchive] = None,
+    **kwargs,
+):
+    """Run a temperature sampler until interrupted, publishing its readings.
+
+    Parameters
+    ----------
+    path
+        The UNIX socket on which to publish. None to not publish.
+    archive
+        An archive to which to also append the readings.
+
+    Other Parameters
+    ----------------
+    All other parameters are passed to :class:`~autocal.sampler.TemperatureSampler`.
+    Unless given, the readings are only written to ``archive`` if there is one, and
+    otherwise to :data:`DAEMON_FILENAME` rather than to the default file of the
+    sampler, which belongs to ``autocal run``.
+    """
+    kwargs.setdefault("filename", None if archive is not None else DAEMON_FILENAME)
+    sampler = TemperatureSampler(**kwargs)
+    if archive is not None:
+        sampler.listeners.append(archive.append)
+    server = None if path is None else TemperatureServer(sampler, path)
+
+    sampler.start()
+    if server is not None:
+        server.start()
+
+    try:
+        threading.Event().wait()
+    finally:
+        if server is not None:
+            server.stop()
+        sampler.stop()
+        if archive is not None:
+            archive.close()
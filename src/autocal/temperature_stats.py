@@ -0,0 +1,179 @@
+"""Online statistics of temperature readings, updated one reading at a time."""
+import logging
+import numpy as np
+import threading
+from typing import Dict, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class RunningStats:
+    """Running statistics of a single channel, each updated in constant time.
+
+    Over all values, the mean and variance (Welford's algorithm) and an exponentially
+    weighted moving average are kept. Over the most recent ``window`` values, the mean,
+    standard deviation and least-squares slope are kept with running sums, along with
+    the drift: the difference between the means of the most recent half of the window
+    and the half before it.
+
+    Parameters
+    ----------
+    window
+        The number of most recent values over which windowed statistics are kept.
+    alpha
+        The weight of each new value in the exponentially weighted moving average.
+    """
+
+    def __init__(self, window: int = 10, alpha: float = 0.1):
+        if window < 2:
+            raise ValueError("window must be at least 2.")
+
+        self.window = window
+        self.alpha = alpha
+
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.ewma = np.nan
+
+        # Windowed values are kept relative to the first, to limit round-off.
+        self._origin = None
+        self._t = np.zeros(window)
+        self._x = np.zeros(window)
+        self._n = 0
+        self._sums = np.zeros(5)  # of t, x, t^2, tx and x^2 over the window
+        self._recent = 0.0  # of x over the most recent half of the window
+
+    def update(self, t: float, x: float):
+        """Add a value ``x`` taken at time ``t`` (seconds). NaN values are ignored."""
+        if not np.isfinite(x):
+            return
+
+        self.count += 1
+        delta = x - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (x - self._mean)
+        self.ewma = x if self.count == 1 else self.ewma + self.alpha * (x - self.ewma)
+
+        if self._origin is None:
+            self._origin = (t, x)
+        t, x = t - self._origin[0], x - self._origin[1]
+
+        i = self._n % self.window
+        if self._n >= self.window:
+            old_t, old_x = self._t[i], self._x[i]
+            self._sums -= (old_t, old_x, old_t * old_t, old_t * old_x, old_x * old_x)
+        self._t[i], self._x[i] = t, x
+        self._sums += (t, x, t * t, t * x, x * x)
+
+        half = self.window // 2
+        self._recent += x
+        if self._n >= half:
+            self._recent -= self._x[(self._n - half) % self.window]
+        self._n += 1
+
+    @property
+    def mean(self) -> float:
+        """The mean of all values."""
+        return self._mean if self.count else np.nan
+
+    @property
+    def variance(self) -> float:
+        """The (sample) variance of all values."""
+        return self._m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def full(self) -> bool:
+        """Whether the window is full."""
+        return self._n >= self.window
+
+    @property
+    def window_mean(self) -> float:
+        """The mean of the values in the window."""
+        n = min(self._n, self.window)
+        return self._origin[1] + self._sums[1] / n if n else np.nan
+
+    @property
+    def window_std(self) -> float:
+        """The standard deviation of the values in the window."""
+        n = min(self._n, self.window)
+        if not n:
+            return np.nan
+        return np.sqrt(max(self._sums[4] / n - (self._sums[1] / n) ** 2, 0))
+
+    @property
+    def slope(self) -> float:
+        """The least-squares slope (per second) of the values in the window."""
+        n = min(self._n, self.window)
+        st, sx, stt, stx, _ = self._sums
+        denom = n * stt - st * st
+        return (n * stx - st * sx) / denom if n > 1 and denom > 0 else np.nan
+
+    @property
+    def slope_error(self) -> float:
+        """The standard error (per second) of :attr:`slope`, from the scatter of the
+        values in the window about the fitted line."""
+        n = min(self._n, self.window)
+        if n < 3:
+            return np.nan
+
+        st, sx, stt, stx, sxx = self._sums
+        ctt, ctx, cxx = stt - st * st / n, stx - st * sx / n, sxx - sx * sx / n
+        if ctt <= 0:
+            return np.nan
+        residual = max(cxx - ctx * ctx / ctt, 0) / (n - 2)
+        return np.sqrt(residual / ctt)
+
+    @property
+    def drift(self) -> float:
+        """The mean of the most recent half of the (full) window minus that of the
+        half before it."""
+        if not self.full:
+            return np.nan
+        half = self.window // 2
+        return self._recent / half - (self._sums[1] - self._recent) / (
+            self.window - half
+        )
+
+    def is_stable(self, delta: float) -> bool:
+        """Whether the window is full and its drift is within ``delta``."""
+        return self.full and abs(self.drift) <= delta
+
+
+class TemperatureStats:
+    """:class:`RunningStats` of every temperature channel of the thermistor readings.
+
+    Parameters
+    ----------
+    channels
+        The fields of the readings for which to keep statistics.
+
+    Other Parameters
+    ----------------
+    All other parameters are passed to :class:`RunningStats`.
+    """
+
+    def __init__(
+        self,
+        channels: Sequence[str] = ("lna_temp", "sp4t_temp", "load_temp", "room_temp"),
+        **kwargs,
+    ):
+        self.channels: Dict[str, RunningStats] = {
+            channel: RunningStats(**kwargs) for channel in channels
+        }
+        self._lock = threading.Lock()
+
+    def __getitem__(self, channel: str) -> RunningStats:
+        """The statistics of a channel."""
+        return self.channels[channel]
+
+    def update(self, t: float, reading):
+        """Add a reading (a mapping or record with every channel) taken at time ``t``."""
+        with self._lock:
+            for channel, stats in self.channels.items():
+                stats.update(t, reading[channel])
+
+    def is_stable(self, channel: str, delta: float) -> bool:
+        """Whether a channel has been stable to within ``delta`` over its window."""
+        with self._lock:
+            return self.channels[channel].is_stable(delta)
@@ -0,0 +1,134 @@
+"""Vectorized conversion of thermistor divider voltages to resistance and temperature."""
+import logging
+import numpy as np
+from numpy.polynomial import polynomial
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+ABS_ZERO = 273.15
+
+
+class Thermistor:
+    """A thermistor read through a voltage divider, with a Steinhart–Hart fit.
+
+    The thermistor sits on the low side of a divider with a fixed resistor, so its
+    resistance is ``R = V * resistor / (Vs - V)`` for a measured voltage ``V`` and
+    excitation voltage ``Vs``. Its temperature is given by the (generalized)
+    Steinhart–Hart equation ``1/T = sum_k c_k ln(R)^k``.
+
+    Parameters
+    ----------
+    resistor
+        The resistance (Ohm) of the fixed resistor of the divider.
+    coefficients
+        The Steinhart–Hart coefficients ``c_k``, in increasing order of the power of
+        ``ln(R)``. The standard equation has ``(A, B, 0, C)``.
+    """
+
+    def __init__(self, resistor: float, coefficients: Sequence[float]):
+        self.resistor = float(resistor)
+        self.coefficients = tuple(float(c) for c in coefficients)
+
+    def __repr__(self):
+        """Represent the thermistor."""
+        return f"Thermistor(resistor={self.resistor}, coefficients={self.coefficients})"
+
+    def resistance(self, voltage: np.ndarray, vs: np.ndarray) -> np.ndarray:
+        """Compute the resistance of the thermistor from divider voltages.
+
+        Voltages that do not give a finite, positive resistance give NaN.
+        """
+        voltage = np.asarray(voltage, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            res = voltage * self.resistor / (vs - voltage)
+        return np.where(np.isfinite(res) & (res > 0), res, np.nan)
+
+    def temperature(self, resistance: np.ndarray) -> np.ndarray:
+        """Compute the temperature (C) of the thermistor from its resistance.
+
+        Resistances that are NaN or not positive give NaN.
+        """
+        resistance = np.asarray(resistance, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv_temp = polynomial.polyval(np.log(resistance), self.coefficients)
+            return 1 / inv_temp - ABS_ZERO
+
+    def convert(
+        self, voltage: np.ndarray, vs: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Compute both the resistance and temperature (C) from divider voltages."""
+        res = self.resistance(voltage, vs)
+        return res, self.temperature(res)
+
+
+# The thermistors read by the temperature sensor: the LNA, SP4T switch and load
+# thermistors, and the ambient room temperature sensor.
+THERMISTORS: Dict[str, Thermistor] = {
+    "lna": Thermistor(9918, (0.129675e-2, 0.197374e-3, 0, 0.304e-6)),
+    "sp4t": Thermistor(9960, (0.129675e-2, 0.197374e-3, 0, 0.304e-6)),
+    "load": Thermistor(9923, (1.03514e-3, 2.33825e-4, 0, 7.92467e-8)),
+    "room": Thermistor(
+        3251, (0.1408390910882e-2, 0.22774732e-3, 9.87803e-7, 6.704665177e-8)
+    ),
+}
+
+
+def get_thermistors(settings: Optional[Mapping[str, Mapping]] = None):
+    """Get the thermistors, overriding the defaults with those in the settings.
+
+    Parameters
+    ----------
+    settings
+        A mapping of thermistor name to a mapping with ``resistor`` and/or
+        ``coefficients``, e.g. the ``thermistors`` section of ``~/.edges-autocal``.
+    """
+    thermistors = dict(THERMISTORS)
+    for name, spec in (settings or {}).items():
+        default = thermistors.get(name)
+        if default is None and not {"resistor", "coefficients"} <= set(spec):
+            raise ValueError(
+                f"Thermistor '{name}' needs both a resistor and coefficients."
+            )
+
+        thermistors[name] = Thermistor(
+            resistor=spec.get("resistor", default and default.resistor),
+            coefficients=spec.get("coefficients", default and default.coefficients),
+        )
+    return thermistors
+
+
+def convert(
+    voltages: Mapping[str, np.ndarray],
+    vs: np.ndarray,
+    thermistors: Optional[Mapping[str, Thermistor]] = None,
+) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Convert the voltages of several thermistors to resistances and temperatures.
+
+    Parameters
+    ----------
+    voltages
+        The divider voltage(s) of each thermistor. Any (broadcastable) shape can be
+        given, e.g. a single reading or a whole log.
+    vs
+        The excitation voltage(s) of the dividers.
+    thermistors
+        The thermistors. By default, those configured in ``~/.edges-autocal``.
+
+    Returns
+    -------
+    resistances
+        The resistance (Ohm) of each thermistor.
+    temperatures
+        The temperature (C) of each thermistor. Readings that cannot be converted are
+        NaN.
+    """
+    if thermistors is None:
+        from .config import config
+
+        thermistors = THERMISTORS if config is None else config.thermistors
+
+    resistances, temperatures = {}, {}
+    for name, voltage in voltages.items():
+        resistances[name], temperatures[name] = thermistors[name].convert(voltage, vs)
+    return resistances, temperatures
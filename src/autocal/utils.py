@@ -75,3 +75,10 @@ def block_on_question(question):
     while not qs.confirm(question, default=False).ask():
         if qs.confirm("Would you like to exit then?", default=False).ask():
             sys.exit()
+
+
+async def block_on_question_async(question):
+    """Block on affirmation from user, allowing exit, without blocking the event loop."""
+    while not await qs.confirm(question, default=False).ask_async():
+        if await qs.confirm("Would you like to exit then?", default=False).ask_async():
+            sys.exit()
@@ -0,0 +1,360 @@
+"""A persistent SCPI session with the network analyser."""
+import logging
+import numpy as np
+import socket
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "10.206.160.72"
+DEFAULT_PORT = 5025
+
+_NUMBER_START = b"+-.0123456789"
+
+
+def parse_ascii_trace(payload, ncols: int = 3) -> np.ndarray:
+    """Parse a CSV trace file (as stored by ``MMEM:STOR:FDAT``) into a float array.
+
+    Header lines (any lines that don't start with a number) are skipped, and the rest
+    is parsed by numpy in C, without creating any intermediate Python strings.
+
+    Parameters
+    ----------
+    payload
+        The bytes of the file, e.g. as returned by :meth:`VNA.query_block`.
+    ncols
+        The number of comma-separated columns in each row.
+
+    Returns
+    -------
+    np.ndarray
+        The ``(npoints, ncols)`` data.
+    """
+    data = bytes(payload)
+
+    start = 0
+    while start < len(data) and data[start] not in _NUMBER_START:
+        start = data.index(b"\n", start) + 1
+
+    # Rows are separated by line breaks and values by commas: make them all commas.
+    data = data[start:].rstrip().replace(b"\r\n", b",").replace(b"\n", b",")
+    return np.fromstring(data, sep=",").reshape(-1, ncols)
+
+
+class VNA:
+    """A long-lived SCPI session with an E5071-style network analyser.
+
+    The connection is opened lazily on the first request, kept alive between sweeps
+    and transparently re-opened if the instrument drops it. A request interrupted by a
+    dropped connection is only sent again if doing so is safe: if it never reached the
+    instrument, or if it is a query or setting that can simply be repeated. Any other
+    error, such as a timeout, is raised, and the next request starts on a new
+    connection so that a late reply can't be taken for the answer to it.
+
+    Settings made with :meth:`set` are remembered, and only sent to the instrument when
+    they differ from what was last set. The remembered state is discarded whenever the
+    instrument may have changed behind our back: on (re-)connecting, and when
+    :meth:`invalidate` is called (e.g. after a front-panel calibration).
+
+    Parameters
+    ----------
+    host
+        IP address of the network analyser.
+    port
+        SCPI socket port of the network analyser.
+    timeout
+        Socket timeout (seconds) for any single send/receive.
+    """
+
+    def __init__(
+        self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 30.0
+    ):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idn = None
+        self._sock: Optional[socket.socket] = None
+        self._state: Dict[str, str] = {}
+        self._freq: Optional[np.ndarray] = None
+        self._sent = False
+
+    @property
+    def connected(self) -> bool:
+        """Whether the session currently holds an open socket."""
+        return self._sock is not None
+
+    @property
+    def state(self) -> Dict[str, str]:
+        """A copy of the settings last made with :meth:`set`."""
+        return dict(self._state)
+
+    def connect(self):
+        """Open the socket and identify the instrument."""
+        logger.info(f"Connecting to network analyser {self.host} port {self.port}")
+
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._sock = sock
+        self.invalidate()
+
+        self.idn = self._query("*IDN?")
+        logger.info(f"Connected to ENA: {self.idn}")
+
+    def invalidate(self):
+        """Forget the remembered instrument state.
+
+        Every setting is then sent again the next time it is made with :meth:`set`, so
+        all settings a sweep depends on must be made (with :meth:`set`) for every sweep.
+        """
+        self._state.clear()
+        self._freq = None
+
+    def close(self):
+        """Close the socket, if it is open."""
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+
+    def __enter__(self):
+        """Open the session."""
+        if not self.connected:
+            self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        """Close the session."""
+        self.close()
+
+    def _send(self, cmd: str):
+        self._sock.sendall(cmd.encode() + b"\n")
+        self._sent = True
+
+    def _readline(self) -> bytes:
+        buf = bytearray()
+        while not buf.endswith(b"\n"):
+            chunk = self._sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("Network analyser closed the connection.")
+            buf += chunk
+        return bytes(buf)
+
+    def _write(self, cmd: str):
+        # Every command is followed by *OPC? so that the instrument has finished
+        # processing it (and the reply is consumed) before the next one is sent.
+        self._send(f"{cmd};*OPC?")
+        self._readline()
+
+    def _set(self, header: str, value) -> bool:
+        header = header.upper()
+        value = str(value)
+        if self._state.get(header) == value:
+            return False
+
+        self._write(f"{header} {value}")
+        self._state[header] = value
+
+        # The frequency grid of the sweep is only re-read when it may have changed.
+        if header.startswith(("SENS:FREQ", "SENS1:FREQ", "SENS:SWE", "SENS1:SWE")):
+            self._freq = None
+        return True
+
+    def _query(self, cmd: str) -> str:
+        self._send(cmd)
+        return self._readline().decode().strip()
+
+    def _recv_exact(self, n: int) -> memoryview:
+        buf = bytearray(n)
+        view = memoryview(buf)
+        nread = 0
+        while nread < n:
+            got = self._sock.recv_into(view[nread:], n - nread)
+            if not got:
+                raise ConnectionError("Network analyser closed the connection.")
+            nread += got
+        return view
+
+    def _read_block(self) -> memoryview:
+        # An IEEE 488.2 definite-length block is '#', then the number of digits in the
+        # length, then the length (in bytes) of the payload, then the payload itself.
+        lead = self._recv_exact(1)
+        while lead[0] != ord("#"):
+            lead = self._recv_exact(1)
+
+        ndigits = int(bytes(self._recv_exact(1)))
+        if not ndigits:
+            raise IOError("Indefinite-length blocks are not supported.")
+        length = int(bytes(self._recv_exact(ndigits)))
+
+        payload = self._recv_exact(length)
+
+        # Consume the message terminator so that the next response starts cleanly.
+        while self._recv_exact(1)[0] != ord("\n"):
+            pass
+
+        return payload
+
+    def _query_block(self, cmd: str) -> memoryview:
+        self._send(cmd)
+        return self._read_block()
+
+    def _request(self, method, *args, repeatable: bool = True):
+        if not self.connected:
+            self.connect()
+
+        self._sent = False
+        try:
+            return method(*args)
+        except ConnectionError as e:
+            self.close()
+            if self._sent and not repeatable:
+                raise
+            logger.warning(f"Lost connection to network analyser ({e}), reconnecting.")
+            self.connect()
+            return method(*args)
+        except OSError:
+            # A reply may still be on its way (e.g. after a timeout), which would then
+            # be read as the reply to the next request.
+            self.close()
+            raise
+
+    def _wait_for_opc(self, timeout: float, poll_interval: float) -> bool:
+        # *OPC (without the query) sets bit 0 of the event status register once all
+        # pending operations are complete. Polling *ESR? rather than blocking on *OPC?
+        # keeps the session responsive, so a timeout never leaves a stale reply behind.
+        deadline = time.monotonic() + timeout
+        while True:
+            if int(self._query("*ESR?")) & 1:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(min(poll_interval, max(0, deadline - time.monotonic())))
+
+    def _trigger_and_wait(self, timeout: float, poll_interval: float) -> bool:
+        self._write("*CLS")
+        self._send("TRIG:SING;*OPC")
+        return self._wait_for_opc(timeout, poll_interval)
+
+    def trigger_and_wait(self, timeout: float, poll_interval: float = 0.5) -> bool:
+        """Trigger a single (averaged) sweep and wait until the instrument completes it.
+
+        The trigger source must be ``BUS`` for the trigger to be honoured.
+
+        Parameters
+        ----------
+        timeout
+            Maximum time (seconds) to wait for the sweep to complete.
+        poll_interval
+            Time (seconds) between status polls.
+
+        Returns
+        -------
+        bool
+            Whether the sweep completed before the timeout.
+        """
+        # The trigger and the wait for it are repeated together if the connection
+        # drops, so that a sweep is always waited for from its own trigger.
+        return self._request(self._trigger_and_wait, timeout, poll_interval)
+
+    def query_binary(self, cmd: str, dtype="<f8") -> np.ndarray:
+        """Send a query and decode its binary block response as an array.
+
+        The array is a view onto the received bytes, so no copy is made.
+        """
+        return np.frombuffer(self.query_block(cmd), dtype=dtype)
+
+    def read_trace(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Read the frequencies and complex (corrected) data of the S11 trace.
+
+        Both are transferred as little-endian REAL64 binary blocks, so no ASCII
+        formatting or parsing happens on either end.
+
+        Returns
+        -------
+        freq
+            The frequencies (Hz) of the sweep.
+        s11
+            The complex S11 at each frequency.
+        """
+        self.set("FORM:DATA", "REAL")
+        self.set("FORM:BORD", "SWAP")
+
+        if self._freq is None:
+            self._freq = self.query_binary("SENS1:FREQ:DATA?")
+        freq = self._freq
+        # Corrected data are transferred as interleaved (real, imag) pairs, which is
+        # exactly the memory layout of a complex128 array.
+        s11 = self.query_binary("CALC1:DATA:SDAT?", dtype="<c16")
+        return freq, s11
+
+    def write(self, cmd: str):
+        """Send a command and wait for the instrument to acknowledge it.
+
+        The command is not sent again if the connection drops after it was sent, as
+        it may already have been carried out.
+        """
+        self._request(self._write, cmd, repeatable=False)
+
+    def set(self, header: str, value) -> bool:
+        """Change a setting, unless it already has this value.
+
+        Parameters
+        ----------
+        header
+            The SCPI header of the setting, e.g. ``SENS:BWID``.
+        value
+            The value of the setting. Values are compared as strings, so the same
+            setting should always be given in the same form.
+
+        Returns
+        -------
+        bool
+            Whether the command was actually sent.
+        """
+        return self._request(self._set, header, value)
+
+    def query(self, cmd: str) -> str:
+        """Send a query and return its (single-line) response."""
+        return self._request(self._query, cmd)
+
+    def query_block(self, cmd: str) -> memoryview:
+        """Send a query and return the payload of its definite-length block response.
+
+        Exactly as many bytes as the block header announces are read, directly into
+        a buffer of that size, so arbitrarily large traces are neither truncated nor
+        copied.
+        """
+        return self._request(self._query_block, cmd)
+
+
+_session: Optional[VNA] = None
+
+
+def get_vna() -> VNA:
+    """Return the VNA session shared by all measurement functions.
+
+    Unless a session has been set with :func:`set_vna`, it connects to the address
+    given in the configuration file (or the lab VNA, if there is none).
+    """
+    global _session
+
+    if _session is None:
+        # Imported here so that the session can be used without LabJack drivers.
+        from .config import config
+
+        if config is None:
+            _session = VNA()
+        else:
+            _session = VNA(host=config.vna_host, port=config.vna_port)
+    return _session
+
+
+def set_vna(vna: VNA):
+    """Set the VNA session shared by all measurement functions, closing any other."""
+    global _session
+
+    if _session is not None and _session is not vna:
+        _session.close()
+    _session = vna
@@ -0,0 +1,250 @@
+"""A local SCPI simulator of the network analyser, for offline testing and timing."""
+import logging
+import numpy as np
+import re
+import socketserver
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _block(payload: bytes) -> bytes:
+    """Wrap a payload in an IEEE 488.2 definite-length block."""
+    length = str(len(payload)).encode()
+    return b"#" + str(len(length)).encode() + length + payload
+
+
+def _channel(header: str) -> int:
+    """The channel of a SCPI header, e.g. 2 for ``SENS2:BWID`` and 1 for ``SENS:BWID``."""
+    match = re.match(r"(?:SENS|CALC|INIT)(\d)", header)
+    return int(match.group(1)) if match else 1
+
+
+def _with_channel(header: str) -> str:
+    """A SCPI header with its (implied) channel made explicit, e.g. ``SENS1:BWID``."""
+    return re.sub(r"^(SENS|CALC|INIT)(?=:)", r"\g<1>1", header)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        sim: SimulatedVNA = self.server.sim
+        for line in self.rfile:
+            # Commands within a message are separated by semicolons, and may each
+            # produce a response. Responses to one message are joined by semicolons.
+            responses = [
+                sim.handle(cmd) for cmd in line.decode().strip().split(";") if cmd
+            ]
+            responses = [r for r in responses if r is not None]
+            if responses:
+                time.sleep(sim.latency)
+                self.wfile.write(b";".join(responses) + b"\n")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SimulatedVNA:
+    """A TCP server that emulates the SCPI commands we send to the E5071 VNA.
+
+    Traces are a synthetic reflection (a mismatched load at the end of a short cable)
+    plus Gaussian noise that shrinks with the number of averages. Triggered sweeps take
+    a configurable (simulated) time to complete. A transient that decays over the
+    settle time can be added to the traces with :meth:`disturb`, as after switching.
+    Each channel has its own stimulus settings, and a trigger sweeps every channel that
+    is continuously initiated (by default, only channel 1).
+
+    Parameters
+    ----------
+    host
+        Address on which to listen.
+    port
+        Port on which to listen. Zero picks a free port.
+    sweep_time
+        Time (seconds) taken by a single sweep.
+    latency
+        Time (seconds) added before every response.
+    noise
+        Standard deviation of the noise on a single (un-averaged) sweep.
+    seed
+        Seed for the noise.
+    settle_time
+        Time constant (seconds) of the decay of transients.
+
+    Examples
+    --------
+    >>> with SimulatedVNA(sweep_time=0.01) as sim:
+    >>>     vna = VNA(*sim.address)
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        sweep_time: float = 1.0,
+        latency: float = 0.0,
+        noise: float = 1e-3,
+        seed: Optional[int] = None,
+        settle_time: float = 0.1,
+    ):
+        self.sweep_time = sweep_time
+        self.latency = latency
+        self.noise = noise
+        self.settle_time = settle_time
+
+        self.settings: Dict[str, str] = {"DISP:SPL": "D1"}
+        self.files: Dict[str, bytes] = {}
+        self.esr = 0
+        self._sweep_done = 0.0
+        self._opc_pending = False
+        self._transient = (0.0, 0.0)
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+        self._server = _Server((host, port), _Handler)
+        self._server.sim = self
+        self._thread = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """The (host, port) on which the simulator listens."""
+        return self._server.server_address[:2]
+
+    def start(self):
+        """Start serving in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Simulated VNA listening on {self.address[0]}:{self.address[1]}")
+
+    def serve_forever(self):
+        """Serve in the current thread, until interrupted."""
+        logger.info(f"Simulated VNA listening on {self.address[0]}:{self.address[1]}")
+        self._server.serve_forever()
+
+    def stop(self):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        """Start serving in a background thread."""
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        """Stop serving."""
+        self.stop()
+
+    def _get(self, key: str, default: str) -> str:
+        return self.settings.get(_with_channel(key), default)
+
+    @property
+    def freq(self) -> np.ndarray:
+        """The frequencies of the current sweep settings of channel 1."""
+        return self.channel_freq(1)
+
+    def channel_freq(self, channel: int) -> np.ndarray:
+        """The frequencies of the current sweep settings of a channel."""
+        return np.linspace(
+            float(self._get(f"SENS{channel}:FREQ:START", "40e6")),
+            float(self._get(f"SENS{channel}:FREQ:STOP", "200e6")),
+            int(self._get(f"SENS{channel}:SWE:POIN", "641")),
+        )
+
+    def disturb(self, amplitude: float = 1e-2):
+        """Add a transient of some amplitude to the traces, starting now."""
+        with self._lock:
+            self._transient = (time.monotonic(), amplitude)
+
+    def _averages(self, channel: int) -> int:
+        if self._get(f"SENS{channel}:AVER:STAT", "0") not in ("1", "ON"):
+            return 1
+        return int(self._get(f"SENS{channel}:AVER:COUN", "1"))
+
+    def trace(self, channel: int = 1) -> np.ndarray:
+        """Generate the complex S11 of the current sweep settings of a channel."""
+        freq = self.channel_freq(channel)
+        count = self._averages(channel)
+
+        s11 = 0.05 * np.exp(-2j * np.pi * freq * 5e-9)
+        start, amplitude = self._transient
+        if amplitude and self.settle_time > 0:
+            s11 = s11 + amplitude * np.exp(
+                -(time.monotonic() - start) / self.settle_time
+            )
+        sigma = self.noise / np.sqrt(2 * count)
+        return s11 + self._rng.normal(scale=sigma, size=(len(freq), 2)) @ [1, 1j]
+
+    def _sweep_complete(self) -> bool:
+        return time.monotonic() >= self._sweep_done
+
+    def _format(self, values: np.ndarray) -> bytes:
+        if self._get("FORM:DATA", "ASC").startswith("REAL"):
+            order = "<" if self._get("FORM:BORD", "NORM") == "SWAP" else ">"
+            return _block(values.astype(f"{order}f8").tobytes())
+        return ",".join(f"{v:+.12e}" for v in values).encode()
+
+    def _fdat(self) -> bytes:
+        s11 = self.trace()
+        fmt = self._get("CALC1:FORM", "MLOG")
+        data = s11.imag if fmt.startswith("IMAG") else s11.real
+        lines = [
+            "# Channel 1",
+            "# Trace 1",
+            "Frequency, Formatted Data, Formatted Data",
+        ]
+        lines += [f"{f:+.12e},{d:+.12e},{0:+.12e}" for f, d in zip(self.freq, data)]
+        return ("\r\n".join(lines) + "\r\n").encode()
+
+    def handle(self, cmd: str) -> Optional[bytes]:
+        """Handle a single SCPI command, returning its response (if any)."""
+        with self._lock:
+            return self._handle(cmd.strip())
+
+    def _handle(self, cmd: str) -> Optional[bytes]:
+        header, _, arg = cmd.partition(" ")
+        header = header.upper()
+        arg = arg.strip()
+
+        if header == "*IDN?":
+            return b"Simulated,E5071C,0,autocal"
+        elif header == "*OPC?":
+            time.sleep(max(0, self._sweep_done - time.monotonic()))
+            return b"1"
+        elif header == "*OPC":
+            self._opc_pending = True
+        elif header == "*CLS":
+            self.esr = 0
+            self._opc_pending = False
+        elif header == "*ESR?":
+            if self._opc_pending and self._sweep_complete():
+                self.esr |= 1
+                self._opc_pending = False
+            esr, self.esr = self.esr, 0
+            return str(esr).encode()
+        elif header == "TRIG:SING":
+            # Every channel that is continuously initiated is swept in turn.
+            averaged = self._get("TRIG:AVER", "OFF") in ("1", "ON")
+            nsweeps = 0
+            for channel in range(1, 5):
+                default = "ON" if channel == 1 else "OFF"
+                if self._get(f"INIT{channel}:CONT", default) in ("1", "ON"):
+                    nsweeps += self._averages(channel) if averaged else 1
+            self._sweep_done = time.monotonic() + nsweeps * self.sweep_time
+        elif re.fullmatch(r"SENS\d?:FREQ:DATA\?", header):
+            return self._format(self.channel_freq(_channel(header)))
+        elif re.fullmatch(r"CALC\d?:DATA:SDAT\?", header):
+            s11 = self.trace(_channel(header))
+            return self._format(np.stack([s11.real, s11.imag], axis=-1).ravel())
+        elif header == "MMEM:STOR:FDAT":
+            self.files[arg.strip('"')] = self._fdat()
+        elif header == "MMEM:TRAN?":
+            return _block(self.files[arg.strip('"')])
+        elif header.endswith("?"):
+            return self._get(header[:-1], "0").encode()
+        else:
+            self.settings[_with_channel(header)] = arg.upper()
+        return None
@@ -0,0 +1,411 @@
+"""Storage, and the convergence test, of the S11 taken during the SP4T switch warmup."""
+import h5py
+import logging
+import numpy as np
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+from .config import config
+from .hal import get_clock
+from .temperature_stats import TemperatureStats
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupBuffer:
+    """The S11 of each load at each iteration of the warmup, in a preallocated array.
+
+    Each sweep is written in place into a complex array of shape
+    ``(max_iters, n_loads, n_freq)``, and the sweeps of a load taken so far are read as
+    a view of it, so nothing is copied as the warmup goes on. Since a sweep is never
+    written again once it has been added, views can be used (e.g. plotted) on another
+    thread while further sweeps are added.
+
+    Parameters
+    ----------
+    loads
+        The names of the loads, in the order in which they are swept.
+    max_iters
+        The maximum number of iterations of the warmup.
+    n_freq
+        The number of frequencies of each sweep. By default, that of the first sweep.
+
+    Attributes
+    ----------
+    freq
+        The frequencies of the sweeps, once one has been added.
+    """
+
+    def __init__(
+        self, loads: Sequence[str], max_iters: int, n_freq: Optional[int] = None
+    ):
+        self.loads = tuple(loads)
+        self.max_iters = max_iters
+        self.freq: Optional[np.ndarray] = None
+
+        self._index = {load: i for i, load in enumerate(self.loads)}
+        self._counts = np.zeros(len(self.loads), dtype=int)
+        self._data = None if n_freq is None else self._allocate(n_freq)
+
+    def _allocate(self, n_freq: int) -> np.ndarray:
+        return np.empty((self.max_iters, len(self.loads), n_freq), dtype=complex)
+
+    def __len__(self) -> int:
+        """The number of iterations for which every load has been swept."""
+        return int(self._counts.min())
+
+    def count(self, load: str) -> int:
+        """The number of sweeps of a load taken so far."""
+        return int(self._counts[self._index[load]])
+
+    def append(self, load: str, s11: np.ndarray):
+        """Add the next sweep of a load.
+
+        Parameters
+        ----------
+        load
+            The name of the load.
+        s11
+            The sweep, with columns of frequency, real and imaginary part (as returned
+            by :func:`~autocal.automation.measure_s11`).
+        """
+        i = self._index[load]
+        n = self._counts[i]
+        if n >= self.max_iters:
+            raise IndexError(f"The buffer already has {self.max_iters} {load} sweeps.")
+
+        if self._data is None:
+            self._data = self._allocate(len(s11))
+        if self.freq is None:
+            self.freq = s11[:, 0].copy()
+
+        out = self._data[n, i]
+        out.real = s11[:, 1]
+        out.imag = s11[:, 2]
+        self._counts[i] += 1
+
+    def __getitem__(self, load: str) -> np.ndarray:
+        """The sweeps of a load taken so far: a read-only ``(n, n_freq)`` view."""
+        i = self._index[load]
+        if self._data is None:
+            return np.zeros((0, 0), dtype=complex)
+
+        out = self._data[: self._counts[i], i]
+        out.flags.writeable = False
+        return out
+
+    def real(self) -> Dict[str, np.ndarray]:
+        """The real part of the sweeps of each load taken so far (views)."""
+        return {load: self[load].real for load in self.loads}
+
+    def imag(self) -> Dict[str, np.ndarray]:
+        """The imaginary part of the sweeps of each load taken so far (views)."""
+        return {load: self[load].imag for load in self.loads}
+
+
+def _rms(x: np.ndarray, axis=None):
+    return np.sqrt(np.mean(np.abs(x) ** 2, axis=axis))
+
+
+class Convergence:
+    """A criterion for when the warmup has converged.
+
+    Subclasses implement :meth:`pending`. The SP4T temperature must also have been
+    stable to within ``temperature_delta`` (C) over the window of its statistics.
+
+    Parameters
+    ----------
+    temperature_delta
+        The drift (C) of the SP4T temperature within which it is stable. None to not
+        check the temperature.
+    """
+
+    def __init__(self, temperature_delta: Optional[float] = 0.2):
+        self.temperature_delta = temperature_delta
+
+    def pending(self, warmup: WarmupBuffer) -> Dict[str, str]:
+        """What has not converged (e.g. the standards), with the reason for each."""
+        raise NotImplementedError
+
+    def converged(
+        self, warmup: WarmupBuffer, stats: Optional[TemperatureStats] = None
+    ) -> bool:
+        """Whether the warmup has converged, logging what it is waiting for if not.
+
+        Parameters
+        ----------
+        warmup
+            The sweeps of the warmup so far.
+        stats
+            Running statistics of the temperatures.
+        """
+        pending = {}
+        if self.temperature_delta is not None and (
+            stats is None or not stats.is_stable("sp4t_temp", self.temperature_delta)
+        ):
+            pending[
+                "SP4T temperature"
+            ] = f"not yet stable to {self.temperature_delta} C"
+        pending.update(self.pending(warmup))
+
+        if pending:
+            logger.info(
+                f"Warmup not converged after {len(warmup)} iterations, waiting for "
+                + "; ".join(f"{name} ({why})" for name, why in pending.items())
+            )
+        return not pending
+
+
+class TrendConvergence(Convergence):
+    """Converged once no standard's S11 has a significant trend over recent iterations.
+
+    For each standard, a straight line is fit (per frequency) to the sweeps of the last
+    ``window`` iterations. The mean square (over frequency) of the fitted slopes is
+    compared to that expected from noise alone, which is estimated from the residuals
+    of the fits pooled over all frequencies. Pooling over frequencies makes the test
+    sensitive to drifts much smaller than the noise of a single sweep.
+
+    A standard has converged when the excess of its slopes over the noise is not
+    significant (at ``threshold`` standard deviations), or when the drift of its S11
+    over the window is within ``tolerance`` regardless. All standards must have
+    converged.
+
+    Parameters
+    ----------
+    window
+        The number of most recent iterations over which to test for a trend.
+    threshold
+        The significance (in standard deviations) above which there is a trend.
+    tolerance
+        The RMS drift of S11 over the window below which a standard has converged
+        even if the drift is significant.
+
+    Other Parameters
+    ----------------
+    All other parameters are passed to :class:`Convergence`.
+    """
+
+    def __init__(
+        self, window: int = 4, threshold: float = 3.0, tolerance: float = 0, **kwargs
+    ):
+        super().__init__(**kwargs)
+        if window < 3:
+            raise ValueError("window must be at least 3.")
+
+        self.window = window
+        self.threshold = threshold
+        self.tolerance = tolerance
+
+        self._x = np.arange(window) - (window - 1) / 2
+        self._sxx = np.sum(self._x**2)
+
+    def trend(self, sweeps: np.ndarray) -> Tuple[float, float]:
+        """Test the most recent sweeps of a standard for a trend.
+
+        Parameters
+        ----------
+        sweeps
+            The ``(window, n_freq)`` sweeps.
+
+        Returns
+        -------
+        drift
+            The RMS drift of S11 over the window, according to the fitted slopes.
+        significance
+            The significance (in standard deviations) of the slopes above noise.
+        """
+        n_freq = sweeps.shape[1]
+        slope = self._x @ sweeps / self._sxx
+        residuals = sweeps - sweeps.mean(axis=0) - np.outer(self._x, slope)
+
+        # The mean square of the residuals, and of the slopes (scaled by sxx), both
+        # estimate the noise variance if there is no trend. The first is pooled over
+        # window - 2 degrees of freedom per frequency, the second over one.
+        noise = np.mean(np.abs(residuals) ** 2) * self.window / (self.window - 2)
+        excess = np.mean(np.abs(slope) ** 2) * self._sxx / noise - 1
+        sigma = np.sqrt((1 + 1 / (self.window - 2)) / n_freq)
+
+        drift = _rms(slope) * (self.window - 1)
+        return drift, excess / sigma if noise > 0 else np.inf
+
+    def pending(self, warmup: WarmupBuffer) -> Dict[str, str]:
+        """The standards with a trend, or more iterations if there are too few."""
+        if len(warmup) < self.window:
+            return {"more iterations": f"{len(warmup)} of {self.window}"}
+
+        pending = {}
+        for load in warmup.loads:
+            drift, significance = self.trend(warmup[load][-self.window :])
+            if significance > self.threshold and drift > self.tolerance:
+                pending[load] = f"drift {drift:.2e}, {significance:.1f} sigma"
+        return pending
+
+
+class AdjacentChannelConvergence(Convergence):
+    """Converged once every standard's last two sweeps differ by less than the noise.
+
+    The RMS difference between the last two sweeps of each standard must be within the
+    RMS difference between adjacent frequencies of the last sweep, for both the real
+    and imaginary parts.
+    """
+
+    def pending(self, warmup: WarmupBuffer) -> Dict[str, str]:
+        """The standards whose last two sweeps differ by more than the noise."""
+        if len(warmup) < 2:
+            return {"more iterations": f"{len(warmup)} of 2"}
+
+        pending = {}
+        for load in warmup.loads:
+            last, previous = warmup[load][-1], warmup[load][-2]
+            for part in ("real", "imag"):
+                diff = _rms(getattr(last - previous, part))
+                intrinsic = _rms(np.diff(getattr(last, part)))
+                if diff > intrinsic:
+                    pending[load] = f"RMS difference {diff:.2e} > {intrinsic:.2e}"
+        return pending
+
+
+class WarmupCache:
+    """The last converged warmup, kept in a file so that the next one can be skipped.
+
+    After a warmup converges, the last sweep of each standard is saved, along with the
+    noise of its sweeps, the SP4T temperature and the time. A following warmup takes a
+    single (verification) sweep of each standard, and can be skipped if every one
+    matches the saved sweep to within the noise, at about the same temperature. When
+    it is skipped, the time and temperature of the saved warmup are brought up to date
+    (see :meth:`refresh`), so that a chain of warm starts doesn't age out.
+
+    Parameters
+    ----------
+    path
+        The file in which to keep the warmup. By default, ``.edges-autocal-warmup.h5``
+        next to the configuration file (``~/.edges-autocal``).
+    max_age
+        The time (seconds) since it was saved, or last verified, after which a saved
+        warmup is no longer used. None for no limit, relying only on the verification
+        sweeps and the temperature.
+    threshold
+        The multiple of the noise (of the difference of two sweeps) within which a
+        verification sweep must match the saved one.
+    temperature_delta
+        The difference (C) from the saved SP4T temperature within which the current
+        one must be.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        max_age: Optional[float] = 24 * 60 * 60,
+        threshold: float = 2.0,
+        temperature_delta: float = 0.5,
+    ):
+        if path is None:
+            directory = config.config_path.parent if config else Path("~").expanduser()
+            path = directory / ".edges-autocal-warmup.h5"
+
+        self.path = Path(path)
+        self.max_age = max_age
+        self.threshold = threshold
+        self.temperature_delta = temperature_delta
+
+    def save(self, warmup: WarmupBuffer, sp4t_temp: float):
+        """Save a converged warmup, at the current SP4T temperature (C)."""
+        if len(warmup) < 2:
+            logger.warning("Not saving a warmup of less than two iterations.")
+            return
+
+        # Write to a temporary file first, so a crash never leaves a partial cache.
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with h5py.File(tmp, "w") as fl:
+            fl.attrs["timestamp"] = get_clock().time()
+            fl.attrs["sp4t_temp"] = sp4t_temp
+            fl["freq"] = warmup.freq
+            for load in warmup.loads:
+                sweeps = warmup[load]
+                fl[load] = sweeps[-1]
+                fl[load].attrs["noise"] = np.sqrt(
+                    np.mean(np.abs(sweeps[-1] - sweeps[-2]) ** 2) / 2
+                )
+        os.replace(tmp, self.path)
+        logger.info(f"Saved the converged warmup to {self.path}")
+
+    def refresh(self, sp4t_temp: float):
+        """Set the time of the saved warmup to now, and its temperature to the current
+        SP4T temperature (C), after it has been verified."""
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        shutil.copyfile(self.path, tmp)
+        with h5py.File(tmp, "r+") as fl:
+            fl.attrs["timestamp"] = get_clock().time()
+            fl.attrs["sp4t_temp"] = sp4t_temp
+        os.replace(tmp, self.path)
+
+    def mismatches(self, warmup: WarmupBuffer, sp4t_temp: float) -> Dict[str, str]:
+        """How the last sweeps of a warmup differ from the saved warmup, if they do.
+
+        Parameters
+        ----------
+        warmup
+            The warmup, of which the last sweep of each standard is the verification.
+        sp4t_temp
+            The current SP4T temperature (C).
+
+        Returns
+        -------
+        dict
+            The reason for each mismatch, keyed by what doesn't match (e.g. the
+            standard). Empty if the warmup matches.
+        """
+        if not self.path.exists():
+            return {"saved warmup": f"{self.path} does not exist"}
+
+        with h5py.File(self.path, "r") as fl:
+            age = get_clock().time() - fl.attrs["timestamp"]
+            if self.max_age is not None and age > self.max_age:
+                return {"saved warmup": f"{age / 60:.0f} minutes old"}
+
+            if len(fl["freq"]) != len(warmup.freq) or not np.allclose(
+                fl["freq"][:], warmup.freq
+            ):
+                return {"saved warmup": "different frequencies"}
+
+            out = {}
+            if not abs(sp4t_temp - fl.attrs["sp4t_temp"]) <= self.temperature_delta:
+                out[
+                    "SP4T temperature"
+                ] = f"{sp4t_temp:.2f} C vs. {fl.attrs['sp4t_temp']:.2f} C"
+
+            for load in warmup.loads:
+                if load not in fl:
+                    out[load] = "not saved"
+                    continue
+                diff = np.sqrt(np.mean(np.abs(warmup[load][-1] - fl[load][:]) ** 2))
+                tolerance = self.threshold * np.sqrt(2) * fl[load].attrs["noise"]
+                if not diff <= tolerance:
+                    out[load] = f"RMS difference {diff:.2e} > {tolerance:.2e}"
+        return out
+
+    def matches(self, warmup: WarmupBuffer, sp4t_temp: float) -> bool:
+        """Whether the last sweeps of a warmup match the saved one, logging why not."""
+        mismatches = self.mismatches(warmup, sp4t_temp)
+        if mismatches:
+            logger.info(
+                "Not skipping the warmup: "
+                + "; ".join(f"{name} ({why})" for name, why in mismatches.items())
+            )
+        return not mismatches
+
+
+_cache: Optional[WarmupCache] = None
+
+
+def get_warmup_cache() -> Optional[WarmupCache]:
+    """Return the cache from which warmups can be skipped, if any."""
+    return _cache
+
+
+def set_warmup_cache(cache: Optional[WarmupCache]):
+    """Set the cache from which warmups can be skipped. None to always warm up."""
+    global _cache
+    _cache = cache
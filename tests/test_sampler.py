@@ -0,0 +1,26 @@
+"""Tests of the sampling of temperatures in the background."""
+import pytest
+
+from autocal.hal import set_driver
+from autocal.labjack_sim import SimulatedU6
+from autocal.sampler import TemperatureSampler
+
+
+@pytest.fixture
+def u6():
+    set_driver("u6", SimulatedU6)
+    yield
+    set_driver("u6", None)
+
+
+def test_stop_when_not_running():
+    sampler = TemperatureSampler(filename=None)
+    sampler.stop()
+
+
+def test_stop_twice(u6, tmp_path):
+    sampler = TemperatureSampler(filename=tmp_path / "Temperature.csv", interval=0.01)
+    sampler.start()
+    sampler.stop()
+    sampler.stop()
+    assert (tmp_path / "Temperature.csv").exists()
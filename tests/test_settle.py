@@ -0,0 +1,26 @@
+"""Tests of the detection of the SP4T switch settling."""
+import pytest
+
+from autocal import vna as vna_module
+from autocal.settle import SettleDetector
+from autocal.vna import VNA
+from autocal.vna_sim import SimulatedVNA
+
+
+@pytest.fixture
+def sim(monkeypatch):
+    with SimulatedVNA(sweep_time=0.001) as sim:
+        with VNA(*sim.address, timeout=5) as vna:
+            monkeypatch.setattr(vna_module, "_session", vna)
+            yield sim
+
+
+def test_display_is_restored(sim):
+    sim.settings["DISP:SPL"] = "D1_2"
+    detector = SettleDetector(points=11)
+    detector.calibrate()
+    assert sim.settings["DISP:SPL"] == "D1_2"
+
+    assert detector.wait(37.0)
+    assert sim.settings["DISP:SPL"] == "D1_2"
+    assert sim.settings["INIT2:CONT"] == "OFF"
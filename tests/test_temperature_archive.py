@@ -0,0 +1,71 @@
+"""Tests of the HDF5 archive of temperature readings."""
+import pytest
+
+import h5py
+import numpy as np
+
+from autocal.sampler import READING_DTYPE
+from autocal.temperature_archive import TemperatureArchive
+
+
+def readings(n, start=1650000000.0):
+    data = np.zeros(n, dtype=READING_DTYPE)
+    data["timestamp"] = start + np.arange(n)
+    data["interval"] = 1.0
+    return data
+
+
+@pytest.fixture
+def archive(tmp_path):
+    with TemperatureArchive(tmp_path, chunk_size=8) as archive:
+        yield archive
+
+
+def test_read_before_close(archive):
+    data = readings(20)
+    for record in data:
+        archive.append(record)
+
+    np.testing.assert_array_equal(archive.read(), data)
+    np.testing.assert_array_equal(archive.read(data["timestamp"][5]), data[5:])
+
+
+def test_trimmed_on_close(archive):
+    data = readings(20)
+    for record in data:
+        archive.append(record)
+    archive.close()
+
+    (path,) = archive.files
+    with h5py.File(path, "r") as fl:
+        assert len(fl["readings"]) == 20
+        assert fl["readings"].attrs["length"] == 20
+    np.testing.assert_array_equal(archive.read(), data)
+
+
+def test_unclosed_file_is_read_to_its_length(tmp_path):
+    archive = TemperatureArchive(tmp_path, chunk_size=8, flush_interval=0)
+    data = readings(10)
+    for record in data:
+        archive.append(record)
+
+    # As if the process had died: the file holds a whole number of chunks.
+    (path,) = archive.files
+    with h5py.File(path, "r") as fl:
+        assert len(fl["readings"]) == 16
+    np.testing.assert_array_equal(TemperatureArchive(tmp_path).read(), data)
+    archive.close()
+
+
+def test_trimmed_on_rotate(tmp_path):
+    # Every reading is too late for the current file, so starts a new one.
+    data = readings(3)
+    with TemperatureArchive(tmp_path, chunk_size=8, max_age=0) as archive:
+        for record in data:
+            archive.append(record)
+
+        assert len(archive.files) == 3
+        for path in archive.files[:-1]:
+            with h5py.File(path, "r") as fl:
+                assert len(fl["readings"]) == 1
+        np.testing.assert_array_equal(archive.read(), data)
@@ -0,0 +1,43 @@
+"""Tests of the publishing of temperatures over a UNIX socket."""
+import pytest
+
+import socket
+
+from autocal.sampler import TemperatureSampler
+from autocal.temperature_server import TemperatureServer, request
+
+
+@pytest.fixture
+def sampler():
+    """A sampler that is never started, so needs no U6."""
+    return TemperatureSampler(filename=None)
+
+
+def test_second_server_on_same_path(tmp_path, sampler):
+    path = tmp_path / "temperature.sock"
+    with TemperatureServer(sampler, path):
+        with pytest.raises(FileExistsError, match="already running"):
+            TemperatureServer(TemperatureSampler(filename=None), path)
+
+        # The first server still owns its socket.
+        assert path.is_socket()
+        assert list(request(path, timeout=5)) == []
+
+
+def test_stale_socket_is_replaced(tmp_path, sampler):
+    path = tmp_path / "temperature.sock"
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(path))
+    stale.close()
+
+    with TemperatureServer(sampler, path):
+        assert list(request(path, timeout=5)) == []
+
+
+def test_other_file_is_kept(tmp_path, sampler):
+    path = tmp_path / "temperature.sock"
+    path.write_text("not a socket")
+
+    with pytest.raises(FileExistsError, match="not a socket"):
+        TemperatureServer(sampler, path)
+    assert path.read_text() == "not a socket"
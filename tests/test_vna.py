@@ -0,0 +1,84 @@
+"""Tests of the recovery of the VNA session from dropped connections and timeouts."""
+import pytest
+
+import socket
+
+from autocal.vna import VNA
+from autocal.vna_sim import SimulatedVNA
+
+
+@pytest.fixture
+def sim():
+    with SimulatedVNA(sweep_time=0.01) as sim:
+        yield sim
+
+
+@pytest.fixture
+def vna(sim):
+    with VNA(*sim.address, timeout=5) as vna:
+        sent = []
+        send = vna._send
+
+        def record(cmd):
+            sent.append(cmd)
+            send(cmd)
+
+        vna._send = record
+        vna.sent = sent
+        yield vna
+
+
+def drop(vna):
+    """Break the connection, as if the instrument had dropped it."""
+    vna._sock.shutdown(socket.SHUT_RDWR)
+
+
+def test_query_is_repeated_on_new_connection(vna):
+    drop(vna)
+    vna.query("TRIG:SOUR?")
+    assert vna.sent.count("TRIG:SOUR?") == 2
+
+
+def test_write_is_not_repeated_once_sent(vna):
+    def dropped():
+        # The reply may already have arrived, so a real drop might not be noticed.
+        raise ConnectionResetError("Connection reset by peer")
+
+    vna._readline = dropped
+    with pytest.raises(ConnectionError):
+        vna.write("TRIG:SOUR BUS")
+    assert not vna.connected
+    assert vna.sent.count("TRIG:SOUR BUS;*OPC?") == 1
+
+
+def test_write_is_repeated_if_never_sent(vna):
+    drop(vna)
+    vna.write("TRIG:SOUR BUS")
+    assert vna.sent.count("TRIG:SOUR BUS;*OPC?") == 2
+
+
+def test_timeout_is_not_repeated(sim, vna):
+    vna._sock.settimeout(0.05)
+    sim.latency = 0.5
+    with pytest.raises(socket.timeout):
+        vna.query("*IDN?")
+
+    # The late reply is left behind with the old connection.
+    assert not vna.connected
+    assert vna.sent.count("*IDN?") == 1
+
+
+def test_trigger_is_repeated_with_its_wait(vna):
+    vna.set("TRIG:SOUR", "BUS")
+    query = vna._query
+
+    def poll(cmd):
+        if cmd == "*ESR?" and vna.sent.count("*ESR?") == 0:
+            drop(vna)
+        return query(cmd)
+
+    vna._query = poll
+    assert vna.trigger_and_wait(timeout=5, poll_interval=0.01)
+    # The status is cleared and the sweep triggered again on the new connection.
+    reconnected = vna.sent[vna.sent.index("*IDN?") + 1 :]
+    assert reconnected[:2] == ["*CLS;*OPC?", "TRIG:SING;*OPC"]